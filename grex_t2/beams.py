@@ -0,0 +1,165 @@
+import logging
+import numpy as np
+from grex_t2 import metrics, triggering
+
+# edges of the snr bins of the per-beam snr distribution; the last bin
+# holds everything above the last edge
+SNR_EDGES = np.array([6.0, 7.0, 8.0, 10.0, 12.0, 15.0, 20.0, 30.0, 50.0])
+# gulps for a beam's rate to decay to half
+HALFLIFE = 20.0
+# a beam is masked once its rate is more than k_mask scaled MADs above the
+# median beam rate (and at least min_rate candidates per gulp), and
+# unmasked when it falls below k_unmask MADs (and k_unmask / k_mask of
+# min_rate)
+K_MASK = 10.0
+K_UNMASK = 5.0
+MIN_RATE = 50.0
+# gulps seen before any beam is masked
+MIN_GULPS = 10
+# beams with candidates needed to judge which are hot; the rates are
+# compared among these only, as arrays often run with beams switched off
+MIN_ACTIVE = 8
+# most beams masked at once; more hot beams than this is a storm for rfi
+MAX_MASKED = triggering.nbeam // 8
+
+
+def beam_stats(tab, nbeam=triggering.nbeam, snr_edges=SNR_EDGES):
+    """Candidate counts per beam and per beam x snr bin of one gulp,
+    as (counts (nbeam,), snr_counts (nbeam, len(snr_edges) + 1)).
+    """
+
+    ibeam = np.asarray(tab["ibeam"])
+    nbin = len(snr_edges) + 1
+    nbeam = max(nbeam, int(ibeam.max()) + 1) if len(ibeam) else nbeam
+    sbin = np.searchsorted(snr_edges, np.asarray(tab["snr"]), side="right")
+    snr_counts = np.bincount(ibeam * nbin + sbin, minlength=nbeam * nbin)
+    snr_counts = snr_counts.reshape(nbeam, nbin)
+    return snr_counts.sum(axis=1), snr_counts
+
+
+def _finite(values):
+    return [float(v) if np.isfinite(v) else None for v in values]
+
+
+def mask_rows(tab, mask):
+    """Rows of tab not in a beam flagged in mask (bool per beam)."""
+
+    ibeam = np.asarray(tab["ibeam"])
+    masked = np.zeros(len(ibeam), dtype=bool)
+    inside = ibeam < len(mask)
+    masked[inside] = mask[ibeam[inside]]
+    return tab[~masked]
+
+
+class BeamMonitor:
+    """Exponentially decayed candidate rate and snr distribution of every
+    beam, and the mask of hot beams they imply.
+
+    update() takes the beam_stats of each gulp, in gulp order, before any
+    masking. A beam is masked when its rate exceeds the median rate of
+    the beams with candidates by k_mask scaled median absolute deviations
+    (at least the Poisson spread, and min_rate), and stays masked until
+    it falls below k_unmask deviations. At most max_masked beams, the
+    hottest, are masked at once, and none while fewer than min_active
+    beams have candidates.
+    """
+
+    def __init__(
+        self,
+        nbeam=triggering.nbeam,
+        halflife=HALFLIFE,
+        k_mask=K_MASK,
+        k_unmask=K_UNMASK,
+        min_rate=MIN_RATE,
+        min_gulps=MIN_GULPS,
+        min_active=MIN_ACTIVE,
+        max_masked=MAX_MASKED,
+        snr_edges=SNR_EDGES,
+    ):
+        self.nbeam = nbeam
+        self.decay = 0.5 ** (1.0 / halflife)
+        self.k_mask = k_mask
+        self.k_unmask = k_unmask
+        self.min_rate = min_rate
+        self.min_gulps = min_gulps
+        self.min_active = min_active
+        self.max_masked = max_masked
+        self.snr_edges = np.asarray(snr_edges)
+        self.rates = np.zeros(nbeam)
+        self.snr_rates = np.zeros((nbeam, len(self.snr_edges) + 1))
+        self.mask = np.zeros(nbeam, dtype=bool)
+        self.threshold = np.inf
+        self.ngulp = 0
+
+    def stats(self, tab):
+        return beam_stats(tab, self.nbeam, self.snr_edges)
+
+    def update(self, counts, snr_counts):
+        """Fold one gulp's beam_stats into the rates and update the mask.
+        Returns the beams masked and unmasked by this gulp.
+        """
+
+        # beams beyond nbeam (not expected from heimdall) are ignored
+        counts = counts[: self.nbeam]
+        snr_counts = snr_counts[: self.nbeam]
+        self.rates *= self.decay
+        self.rates[: len(counts)] += (1.0 - self.decay) * counts
+        self.snr_rates *= self.decay
+        self.snr_rates[: len(snr_counts)] += (1.0 - self.decay) * snr_counts
+        self.ngulp += 1
+
+        active = self.rates[self.rates > 0]
+        median = np.median(active) if len(active) else 0.0
+        mad = 1.4826 * np.median(np.abs(active - median)) if len(active) else 0.0
+        mad = max(mad, np.sqrt(median))
+        self.threshold = max(median + self.k_mask * mad, self.min_rate)
+        # the min_rate floor is lowered in the same proportion
+        release = max(
+            median + self.k_unmask * mad, self.min_rate * self.k_unmask / self.k_mask
+        )
+        mask = self.mask & (self.rates >= release)
+        if self.ngulp >= self.min_gulps and len(active) >= self.min_active:
+            mask |= self.rates > self.threshold
+        if np.count_nonzero(mask) > self.max_masked:
+            hottest = np.argsort(np.where(mask, self.rates, -np.inf))[::-1]
+            mask[hottest[self.max_masked :]] = False
+
+        masked = np.flatnonzero(mask & ~self.mask)
+        unmasked = np.flatnonzero(self.mask & ~mask)
+        self.mask = mask
+        for beam in masked:
+            logging.warning(
+                f"Masking hot beam {beam}: {self.rates[beam]:.1f} candidates "
+                f"per gulp, threshold {self.threshold:.1f}"
+            )
+        for beam in unmasked:
+            logging.info(f"Unmasking beam {beam}: {self.rates[beam]:.1f} per gulp")
+        metrics.inc("beams_mask_on", len(masked))
+        metrics.inc("beams_mask_off", len(unmasked))
+        metrics.set_gauge("beams_masked", int(np.count_nonzero(mask)))
+        metrics.set_gauge("beam_rate_median", float(median))
+        metrics.set_gauge("beam_rate_threshold", float(self.threshold))
+        return masked, unmasked
+
+    def snr_quantile(self, q):
+        """Approximate q-quantile of the decayed snr distribution of each
+        beam (the upper edge of the snr bin it falls in, inf above the
+        last edge, nan for beams without candidates).
+        """
+
+        cdf = np.cumsum(self.snr_rates, axis=1)
+        total = cdf[:, -1:]
+        ibin = np.argmax(cdf >= q * total, axis=1)
+        upper = np.append(self.snr_edges, np.inf)[ibin]
+        return np.where(total[:, 0] > 0, upper, np.nan)
+
+    def snapshot(self):
+        """Plain-dict copy of the rates, mask and threshold."""
+
+        return {
+            "ngulp": self.ngulp,
+            "threshold": _finite([self.threshold])[0],
+            "masked": np.flatnonzero(self.mask).tolist(),
+            "rates": np.round(self.rates, 3).tolist(),
+            "snr_p90": _finite(self.snr_quantile(0.9)),
+        }
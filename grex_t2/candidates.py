@@ -0,0 +1,181 @@
+import numpy as np
+
+# columns of a heimdall candidate line, and their types
+col_heimdall = ["snr", "if", "itime", "mjds", "ibox", "idm", "dm", "ibeam"]
+dtype_heimdall = {
+    "snr": np.float64,
+    "if": np.int64,
+    "itime": np.int64,
+    "mjds": np.float64,
+    "ibox": np.int64,
+    "idm": np.int64,
+    "dm": np.float64,
+    "ibeam": np.int64,
+}
+
+# columns added by T2, preallocated with their fill values
+col_extra = ["cl", "cntc", "cntb", "trigger"]
+dtype_extra = {"cl": np.int64, "cntc": np.int64, "cntb": np.int64, "trigger": "U16"}
+fill_extra = {"cl": -1, "cntc": 0, "cntb": 0, "trigger": "0"}
+
+# itime of merged streams counted from the T2 start time (see
+# merge.StreamMerger); itime itself stays the stream's own sample number
+col_aligned = "itime_t2"
+
+
+def aligned(tab, col):
+    """Column col of tab, with itime replaced by the col_aligned column
+    of merged streams if tab has it, so that times compare across streams.
+    """
+
+    if col == "itime" and col_aligned in tab.colnames:
+        col = col_aligned
+    return np.asarray(tab[col])
+
+
+class CandidateBatch:
+    """Columnar container for one gulp of candidates.
+
+    Columns are contiguous NumPy arrays shared by every selection of the
+    batch. Selecting rows (by slice, index array or boolean mask) returns a
+    new batch holding only an index into the shared columns, so no column
+    data is copied until a column is read. Writing a column through a
+    selection writes into the shared columns at the selected rows.
+
+    Indexing follows astropy Table: batch["snr"] is a column, batch[i] is
+    a row (dict) and batch[mask] is a selection. Use to_table at the output
+    edges where an astropy Table is needed.
+    """
+
+    def __init__(self, columns, index=None):
+        self._columns = columns
+        self._index = index
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Build a batch from a mapping of equal-length arrays.
+        Missing T2 columns (cl, cntc, cntb, trigger) are preallocated.
+        """
+
+        nrow = len(next(iter(columns.values()))) if len(columns) else 0
+        cols = {
+            name: np.ascontiguousarray(values, dtype=dtype_heimdall.get(name))
+            for name, values in columns.items()
+        }
+        for name in col_extra:
+            if name not in cols:
+                cols[name] = np.full(nrow, fill_extra[name], dtype=dtype_extra[name])
+        return cls(cols)
+
+    @classmethod
+    def from_text(cls, candstr):
+        """Parse heimdall candidate lines ("snr if itime mjds ibox idm dm ibeam")."""
+
+        values = np.fromstring(candstr, sep=" ")
+        ncol = len(col_heimdall)
+        if values.size % ncol:
+            raise ValueError(
+                f"Candidate text has {values.size} values, not a multiple of {ncol}"
+            )
+        values = values.reshape(-1, ncol)
+        return cls.from_columns(
+            {name: values[:, i] for i, name in enumerate(col_heimdall)}
+        )
+
+    @classmethod
+    def from_records(cls, records):
+        """Build a batch from a structured array (e.g. wire.decode_records)."""
+        return cls.from_columns({name: records[name] for name in records.dtype.names})
+
+    @classmethod
+    def concatenate(cls, batches):
+        """Stack the rows of several batches with the same columns."""
+        return cls.from_columns(
+            {
+                name: np.concatenate([b[name] for b in batches])
+                for name in batches[0].colnames
+            }
+        )
+
+    @classmethod
+    def from_table(cls, tab):
+        """Build a batch from an astropy Table (or anything with colnames)."""
+        return cls.from_columns({name: np.asarray(tab[name]) for name in tab.colnames})
+
+    @property
+    def colnames(self):
+        return list(self._columns)
+
+    @property
+    def index(self):
+        """Rows of the shared columns held by this batch."""
+        if self._index is None:
+            return np.arange(self.nbase)
+        return self._index
+
+    @property
+    def nbase(self):
+        """Number of rows in the shared columns."""
+        return len(next(iter(self._columns.values()))) if self._columns else 0
+
+    def __len__(self):
+        if self._index is None:
+            return self.nbase
+        return len(self._index)
+
+    def __contains__(self, name):
+        return name in self._columns
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            col = self._columns[key]
+            return col if self._index is None else col[self._index]
+        if isinstance(key, (int, np.integer)):
+            irow = self.index[key]
+            return {name: col[irow] for name, col in self._columns.items()}
+        key = np.asarray(key) if not isinstance(key, slice) else key
+        if isinstance(key, np.ndarray) and key.dtype == bool:
+            if len(key) != len(self):
+                raise IndexError(f"Boolean index of length {len(key)} for {len(self)}")
+            key = np.flatnonzero(key)
+        if self._index is None:
+            if isinstance(key, slice):
+                key = np.arange(self.nbase)[key]
+            return CandidateBatch(self._columns, np.asarray(key, dtype=np.intp))
+        return CandidateBatch(self._columns, self._index[key])
+
+    def __setitem__(self, name, values):
+        if self._index is None:
+            col = self._columns.get(name)
+            values = np.asarray(values)
+            if col is not None and col.shape == values.shape:
+                try:
+                    np.copyto(col, values, casting="same_kind")
+                    return
+                except TypeError:
+                    pass
+            self._columns[name] = np.ascontiguousarray(
+                np.broadcast_to(values, (self.nbase,))
+            )
+            return
+
+        if name not in self._columns:
+            values = np.asarray(values)
+            self._columns[name] = np.zeros(self.nbase, dtype=values.dtype)
+        self._columns[name][self._index] = values
+
+    def copy(self):
+        """Compact copy holding only the selected rows."""
+        return CandidateBatch({name: self[name].copy() for name in self._columns})
+
+    def to_table(self, colnames=None):
+        """Materialise the selected rows as an astropy Table."""
+        from astropy.table import Table
+
+        colnames = self.colnames if colnames is None else colnames
+        # a selection already materialises fresh arrays, only copy shared ones
+        return Table(
+            [self[name] for name in colnames],
+            names=colnames,
+            copy=self._index is None,
+        )
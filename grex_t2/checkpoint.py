@@ -0,0 +1,186 @@
+import datetime
+import json
+import logging
+import os
+import time
+import numpy as np
+from grex_t2 import cluster_heimdall, eventlog, metrics, names
+
+# bumped when the layout of the state changes; other versions are ignored
+VERSION = 1
+# file name of the checkpoint in outroot. Not .json, so that it is never
+# taken for a candidate by names.get_lastname_grex.
+FILENAME = ".t2_checkpoint"
+# seconds between checkpoints
+INTERVAL = 30.0
+# seconds after which the start time and recent peaks of a checkpoint are
+# too old to restore
+MAX_AGE = 3600.0
+# recent peaks and injection MJDs kept in a checkpoint
+MAX_PEAKS = 5000
+MAX_INJECTIONS = 10000
+
+
+def save(path, state):
+    """Write state (a JSON-serialisable dict) to path atomically: a
+    reader or a restart sees either the old or the new checkpoint.
+    """
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def load(path):
+    """The state saved at path, or None if there is no usable checkpoint."""
+
+    try:
+        with open(path, "r") as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as exc:
+        logging.warning(f"Ignoring unreadable checkpoint {path}: {exc}")
+        return None
+    if state.get("version") != VERSION:
+        logging.warning(
+            f"Ignoring checkpoint {path} of version {state.get('version')}, "
+            f"expected {VERSION}"
+        )
+        return None
+    return state
+
+
+def capture(runtime, max_peaks=MAX_PEAKS, max_injections=MAX_INJECTIONS):
+    """The state of runtime (socket_grex.T2Runtime) worth keeping across a
+    restart: last candidate name, trigger holdoff, cached start time,
+    injection cache and the latest max_peaks recent peaks.
+    """
+
+    start_time, age = cluster_heimdall.cached_start_time()
+    injections = runtime.injections
+    state = {
+        "version": VERSION,
+        "saved": time.time(),
+        "lastname": runtime.lastname,
+        "last_trigger_time": runtime.last_trigger_time,
+        "start_time": None if start_time is None else {"value": start_time, "age": age},
+        "injections": {
+            "high_water": injections.high_water,
+            "mjds": injections.mjds[-max_injections:],
+        },
+        "recent": None,
+    }
+    if runtime.recent is not None and max_peaks:
+        peaks = runtime.recent.latest(max_peaks)
+        state["recent"] = {name: col.tolist() for name, col in peaks.items()}
+    return state
+
+
+def name_mjd(name):
+    """MJD at noon of the day a candidate name (yymmddxxxx) was made on."""
+
+    day = datetime.datetime.strptime(name[:6], "%y%m%d")
+    return (day - names.MJD_EPOCH).days + 0.5
+
+
+def check_lastname(outroot, lastname, now_mjd=None):
+    """Whether lastname is still the last candidate name in outroot: it
+    was written (see eventlog.exists) and the names that would follow it
+    (the next name of its day, and the first of today) were not. Checkpoints are written after
+    the JSON files before them, so this only fails if candidates were
+    written after the checkpoint or outroot was changed.
+    """
+
+    if not eventlog.exists(outroot, lastname):
+        return False
+    now_mjd = names.mjd_now() if now_mjd is None else now_mjd
+    following = {
+        names.increment_name(name_mjd(lastname), lastname),
+        names.increment_name(now_mjd, lastname),
+    }
+    following.discard(lastname)
+    return not any(eventlog.exists(outroot, name) for name in following)
+
+
+def restore(runtime, state, max_age=MAX_AGE):
+    """Restore state (from capture) into runtime, checking it against the
+    outputs and database. Returns the lastname restored, or None if it
+    failed the check and was left to be read from outroot.
+    """
+
+    age = time.time() - state["saved"]
+    lastname = state["lastname"]
+    if lastname is not None and check_lastname(runtime.outroot, lastname):
+        runtime.lastname = lastname
+    else:
+        if lastname is not None:
+            logging.warning(
+                f"Checkpointed last name {lastname} does not match {runtime.outroot}, "
+                f"scanning it instead"
+            )
+            metrics.inc("checkpoint_lastname_mismatch")
+        runtime.lastname = names.get_lastname_grex(runtime.outroot)
+        lastname = None
+    runtime.last_trigger_time = state["last_trigger_time"]
+
+    # a database recreated since the checkpoint has fewer rows
+    injections = state["injections"]
+    (max_rowid,) = runtime.db_con.execute("SELECT max(rowid) FROM injection").fetchone()
+    if injections["high_water"] <= (max_rowid or 0):
+        runtime.injections.high_water = injections["high_water"]
+        runtime.injections.mjds = list(injections["mjds"])
+    else:
+        logging.warning("Injection table has shrunk since the checkpoint, reloading it")
+
+    if age > max_age:
+        logging.info(
+            f"Checkpoint is {age:.0f} s old, not restoring start time or peaks"
+        )
+        return lastname
+    start_time = state["start_time"]
+    if start_time is not None:
+        cluster_heimdall.set_start_time(start_time["value"], start_time["age"] + age)
+    peaks = state["recent"]
+    if runtime.recent is not None and peaks is not None:
+        added = np.asarray(peaks["added"])
+        keep = added >= time.time() - runtime.recent.max_age
+        runtime.recent.add({name: np.asarray(col)[keep] for name, col in peaks.items()})
+    return lastname
+
+
+class Checkpointer:
+    """Saves the state of a runtime to path at most every interval
+    seconds. With writer (writer.ArtifactWriter) the file is written in
+    the background after the outputs queued before it.
+    """
+
+    def __init__(self, path, interval=INTERVAL, max_peaks=MAX_PEAKS, writer=None):
+        self.path = path
+        self.interval = interval
+        self.max_peaks = max_peaks
+        self.writer = writer
+        self._last = time.monotonic()
+
+    def maybe_save(self, runtime, force=False):
+        """Checkpoint runtime if interval has passed since the last time,
+        or if force.
+        """
+
+        now = time.monotonic()
+        if not force and now - self._last < self.interval:
+            return
+        self._last = now
+        state = capture(runtime, self.max_peaks)
+        if self.writer is None:
+            self._save(state)
+        else:
+            self.writer.submit(self._save, state)
+
+    def _save(self, state):
+        t0 = time.perf_counter()
+        save(self.path, state)
+        metrics.observe("checkpoint_save_s", time.perf_counter() - t0)
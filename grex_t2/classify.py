@@ -0,0 +1,274 @@
+import importlib
+import json
+import logging
+import time
+from functools import lru_cache
+import numpy as np
+from grex_t2 import metrics
+
+# boxcar indices (ibox) with their own snr profile feature; wider boxcars
+# count in the last
+NBOX = 12
+# per-peak features of peak_features, in column order
+FEATURES = [
+    # log10 of the number of candidates in the cluster
+    "log_ncand",
+    # distinct beams, and the spread of beam numbers
+    "nbeam",
+    "beam_span",
+    # distinct DM trials, and the DM extent relative to the peak DM
+    "ndm",
+    "dm_extent",
+    # time extent in samples, and distinct boxcars
+    "time_extent",
+    "nbox",
+    "snr_peak",
+    # mean snr of the cluster over its peak snr
+    "snr_mean_ratio",
+    "ibox_peak",
+    "dm_peak",
+] + [f"snr_box{i}" for i in range(NBOX)]  # max snr per boxcar / peak snr
+# weight of the newest gulp in the running seconds-per-peak estimate of
+# model scoring, used to skip gulps predicted to overrun the budget
+COST_WEIGHT = 0.2
+# gulps skipped in a row on the predicted cost before the next is scored
+# anyway (a probe, which resets the estimate), so that one slow call does
+# not disable the classifier for good
+PROBE_EVERY = 10
+
+
+def peak_groups(cl):
+    """Peak number of each row of a clustered gulp, numbered as the peaks
+    of cluster_heimdall.get_peak: clusters in label order, then every
+    unclustered (cl == -1) row as its own peak. Returns the peak numbers,
+    the rows sorted by peak (stably) and the start of each peak in them.
+    """
+
+    cl = np.asarray(cl, dtype=np.int64)
+    unclustered = cl == -1
+    labels = cl.copy()
+    labels[unclustered] = cl.max(initial=-1) + 1 + np.arange(unclustered.sum())
+    order = np.argsort(labels, kind="stable")
+    new = np.r_[True, labels[order][1:] != labels[order][:-1]] if len(cl) else []
+    group = np.empty(len(cl), dtype=np.int64)
+    group[order] = np.cumsum(new) - 1
+    return group, order, np.flatnonzero(new)
+
+
+def _ndistinct(group, values, ngroup):
+    """Number of distinct integer values in each group."""
+
+    values = np.asarray(values, dtype=np.int64)
+    if not len(values):
+        return np.zeros(ngroup, dtype=np.int64)
+    span = values.max() - values.min() + 1
+    pairs = np.unique(group * span + (values - values.min()))
+    return np.bincount(pairs // span, minlength=ngroup)
+
+
+def peak_features(tab):
+    """(npeak, len(FEATURES)) feature matrix of the cluster peaks of tab
+    (rows labelled by cluster_data), in the order of get_peak.
+    """
+
+    group, order, starts = peak_groups(tab["cl"])
+    ngroup = len(starts)
+    X = np.zeros((ngroup, len(FEATURES)))
+    if not ngroup:
+        return X
+    snr = np.asarray(tab["snr"], dtype=float)
+    snr_sorted = snr[order]
+    ncand = np.diff(np.r_[starts, len(order)])
+    # the brightest row of each peak, ties to the first row (as get_peak)
+    snr_peak = np.maximum.reduceat(snr_sorted, starts)
+    brightest = np.flatnonzero(snr_sorted == np.repeat(snr_peak, ncand))
+    first = np.r_[True, np.diff(group[order[brightest]]) != 0]
+    peak = order[brightest[first]]
+
+    def extent(col):
+        values = np.asarray(tab[col])[order]
+        return np.maximum.reduceat(values, starts) - np.minimum.reduceat(values, starts)
+
+    dm_peak = np.asarray(tab["dm"], dtype=float)[peak]
+    X[:, 0] = np.log10(ncand)
+    X[:, 1] = _ndistinct(group, tab["ibeam"], ngroup)
+    X[:, 2] = extent("ibeam")
+    X[:, 3] = _ndistinct(group, tab["idm"], ngroup)
+    X[:, 4] = extent("dm") / np.maximum(dm_peak, 1.0)
+    X[:, 5] = extent("itime")
+    X[:, 6] = _ndistinct(group, tab["ibox"], ngroup)
+    X[:, 7] = snr_peak
+    X[:, 8] = np.bincount(group, weights=snr, minlength=ngroup) / ncand / snr_peak
+    X[:, 9] = np.asarray(tab["ibox"])[peak]
+    X[:, 10] = dm_peak
+    profile = np.zeros((ngroup, NBOX))
+    ibox = np.clip(np.asarray(tab["ibox"], dtype=np.int64), 0, NBOX - 1)
+    np.maximum.at(profile, (group, ibox), snr)
+    X[:, 11:] = profile / snr_peak[:, None]
+    return X
+
+
+def fit_logistic(X, y, l2=1e-3, niter=25):
+    """Logistic regression of labels y (1 astrophysical, 0 RFI) on the
+    standardised columns of X by iteratively reweighted least squares.
+    Returns (weights, bias, mean, scale) for LinearModel.
+    """
+
+    mean = X.mean(axis=0)
+    scale = X.std(axis=0)
+    scale[scale == 0] = 1.0
+    A = np.column_stack([np.ones(len(X)), (X - mean) / scale])
+    beta = np.zeros(A.shape[1])
+    penalty = l2 * len(X) * np.eye(A.shape[1])
+    penalty[0, 0] = 0.0
+    for _ in range(niter):
+        p = 1.0 / (1.0 + np.exp(-A @ beta))
+        w = np.maximum(p * (1.0 - p), 1e-9)
+        step = np.linalg.solve(
+            A.T @ (A * w[:, None]) + penalty, A.T @ (y - p) - penalty @ beta
+        )
+        beta += step
+        if np.abs(step).max() < 1e-8:
+            break
+    return beta[1:], float(beta[0]), mean, scale
+
+
+class LinearModel:
+    """Logistic regression on named features: the score of a peak is
+    1 / (1 + exp(-(bias + sum(weights * (x - mean) / scale)))), from 0
+    (RFI) to 1 (astrophysical).
+    """
+
+    def __init__(self, features, weights, bias=0.0, mean=None, scale=None):
+        self.features = list(features)
+        self.weights = np.asarray(weights, dtype=float)
+        self.bias = float(bias)
+        self.mean = np.zeros(len(self.features)) if mean is None else np.asarray(mean)
+        self.scale = np.ones(len(self.features)) if scale is None else np.asarray(scale)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            model = json.load(f)
+        return cls(
+            model["features"],
+            model["weights"],
+            model.get("bias", 0.0),
+            model.get("mean"),
+            model.get("scale"),
+        )
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "features": self.features,
+                    "weights": self.weights.tolist(),
+                    "bias": self.bias,
+                    "mean": self.mean.tolist(),
+                    "scale": self.scale.tolist(),
+                },
+                f,
+                indent=2,
+            )
+
+    def score(self, X):
+        """Scores of the rows of X (columns in the order of features)."""
+        z = self.bias + ((X - self.mean) / self.scale) @ self.weights
+        return 1.0 / (1.0 + np.exp(-z))
+
+
+def load_model(spec):
+    """Model named by spec: a JSON file of LinearModel, or "module:name"
+    for a callable returning an object with a features list (names from
+    FEATURES) and a score(X) method, as LinearModel.
+    """
+
+    if spec.endswith(".json"):
+        return LinearModel.load(spec)
+    module, _, name = spec.partition(":")
+    return getattr(importlib.import_module(module), name)()
+
+
+class Classifier:
+    """Scores all cluster peaks of a gulp with model in one batch call.
+
+    Computing the features and scoring must fit in budget_s seconds per
+    gulp (None for no limit): a gulp is not scored if the running cost
+    per peak predicts it would overrun, and its scores are dropped if it
+    did. Peaks of such gulps trigger on the filter cuts alone. After
+    probe_every gulps skipped in a row, the next is scored anyway and its
+    cost replaces the estimate.
+    """
+
+    def __init__(self, model, min_score=0.5, budget_s=None, probe_every=PROBE_EVERY):
+        unknown = set(model.features) - set(FEATURES)
+        if unknown:
+            raise ValueError(f"Unknown classifier features {sorted(unknown)}")
+        self.model = model
+        self.columns = [FEATURES.index(name) for name in model.features]
+        self.min_score = min_score
+        self.budget_s = budget_s
+        self.seconds_per_peak = None
+        self.probe_every = probe_every
+        self._skipped = 0
+
+    def _fallback(self, reason, npeak):
+        metrics.inc("classify_fallback")
+        logging.warning(
+            f"Classifier {reason} its {1e3 * self.budget_s:.1f} ms budget on "
+            f"{npeak} peaks, triggering on cuts alone"
+        )
+
+    def score(self, tab):
+        """Score of each peak (in get_peak order) of the clustered rows
+        tab, or None if the gulp overran the budget.
+        """
+
+        t0 = time.perf_counter()
+        X = peak_features(tab)[:, self.columns]
+        npeak = len(X)
+        budget = np.inf if self.budget_s is None else self.budget_s
+        if (
+            self.seconds_per_peak is not None
+            and time.perf_counter() - t0 + self.seconds_per_peak * npeak > budget
+            and self._skipped < self.probe_every
+        ):
+            self._skipped += 1
+            self._fallback("would overrun", npeak)
+            return None
+        probe = self._skipped > 0
+        self._skipped = 0
+
+        t1 = time.perf_counter()
+        scores = np.asarray(self.model.score(X), dtype=float)
+        t2 = time.perf_counter()
+        per_peak = (t2 - t1) / max(npeak, 1)
+        if self.seconds_per_peak is None or probe:
+            self.seconds_per_peak = per_peak
+        else:
+            self.seconds_per_peak += COST_WEIGHT * (per_peak - self.seconds_per_peak)
+        metrics.observe("classify_s", t2 - t0)
+        if t2 - t0 > budget:
+            self._fallback(f"took {1e3 * (t2 - t0):.1f} ms of", npeak)
+            return None
+        if scores.shape != (npeak,):
+            raise ValueError(f"Classifier returned {scores.shape} scores for {npeak}")
+        return scores
+
+
+def get_classifier(spec):
+    """Classifier for the "classify" config section, with its model loaded
+    once per process. None without a model.
+    """
+
+    if spec["model"] is None:
+        return None
+    return _classifier(spec["model"], spec["min_score"], spec["budget_s"])
+
+
+@lru_cache(maxsize=4)
+def _classifier(model, min_score, budget_s):
+    classifier = Classifier(load_model(model), min_score, budget_s)
+    logging.info(f"Loaded classifier {model} on {len(classifier.columns)} features")
+    return classifier
@@ -2,20 +2,97 @@ import json
 import os.path
 import socket
 import sqlite3
-import hdbscan
+import threading
+import time
 import numpy as np
-import requests
-from astropy.io import ascii
-from astropy.io.ascii.core import InconsistentTableError
-from astropy.time import Time
-from numpy.lib.recfunctions import structured_to_unstructured
-from grex_t2 import triggering, names, database
+from grex_t2 import triggering, names, database, filters, metrics, costmodel, eventlog
+from grex_t2.candidates import aligned
 import logging
 
+# hdbscan, astropy.io.ascii and requests are imported where they are used,
+# so that importing this module (and starting T2) stays fast.
+
 # half second at heimdall time resolution (after march 18)
 OFFSET = 1907
 DOWNSAMPLE = 4
 
+# approximate clustering (cluster_approx): rows to fit on, and the snr
+# above which rows are always fitted
+APPROX_FIT_ROWS = 5000
+APPROX_KEEP_SNR = 12.0
+
+# coalesce_rows grid: rows of one beam within the same time and DM bin
+# are treated as one detection
+COALESCE_TIME_BIN = 16
+COALESCE_DM_BIN = 2
+
+START_TIME_URL = "http://localhost:8083/start_time"
+# seconds a fetched start time is reused before querying again
+START_TIME_MAX_AGE = 10.0
+# seconds to wait for the start time service
+START_TIME_TIMEOUT = 5.0
+# guards the start time caches and their HTTP session, which the merge
+# thread (merge.StreamMerger.offset) shares with the processing thread
+_start_time_lock = threading.Lock()
+_start_time_cache = {"value": None, "fetched": 0.0, "session": None}
+# start times of other heimdall runs (get_stream_start_time), by URL
+_stream_start_times = {}
+# socket used by send_trigger, opened on the first trigger
+_trigger_sock = {"sock": None}
+
+
+def get_start_time(max_age=START_TIME_MAX_AGE):
+    """Start time (MJD) of the current Heimdall run, fetched over HTTP.
+    The value is cached for max_age seconds and the HTTP session is kept
+    open between queries.
+    """
+
+    return _fetch_start_time(_start_time_cache, START_TIME_URL, max_age)
+
+
+def get_stream_start_time(url, max_age=START_TIME_MAX_AGE):
+    """Start time (MJD) of another Heimdall run (e.g. of one of several
+    merged streams) served at url, cached as get_start_time.
+    """
+
+    with _start_time_lock:
+        cache = _stream_start_times.setdefault(url, {"value": None, "fetched": 0.0})
+    return _fetch_start_time(cache, url, max_age)
+
+
+def _fetch_start_time(cache, url, max_age):
+    with _start_time_lock:
+        now = time.monotonic()
+        if cache["value"] is not None and now - cache["fetched"] < max_age:
+            return cache["value"]
+
+        if _start_time_cache["session"] is None:
+            import requests
+
+            _start_time_cache["session"] = requests.Session()
+        session = _start_time_cache["session"]
+        cache["value"] = session.get(url, timeout=START_TIME_TIMEOUT).json()
+        cache["fetched"] = now
+        return cache["value"]
+
+
+def cached_start_time():
+    """The cached start time and its age in seconds, or (None, None)."""
+
+    with _start_time_lock:
+        cache = _start_time_cache
+        if cache["value"] is None:
+            return None, None
+        return cache["value"], time.monotonic() - cache["fetched"]
+
+
+def set_start_time(value, age=0.0):
+    """Seed the start time cache, as if value was fetched age seconds ago."""
+
+    with _start_time_lock:
+        _start_time_cache["value"] = value
+        _start_time_cache["fetched"] = time.monotonic() - age
+
 
 def parse_candsfile(candsfile):
     """Takes standard MBHeimdall giants output and returns full table,
@@ -23,11 +100,15 @@ def parse_candsfile(candsfile):
     (Can add cleaning here, eventually)
     """
 
+    from astropy.io import ascii
+    from astropy.io.ascii.core import InconsistentTableError
+
     if os.path.exists(candsfile):
         logging.debug(f"Candsfile {candsfile} is path, so opening it")
         candsfile = open(candsfile, "r").read()
-    else:
-        ncands = len(candsfile.split("\n")) - 1
+    elif logging.getLogger().isEnabledFor(logging.DEBUG):
+        # only count lines when the message will be logged
+        ncands = candsfile.count("\n")
         logging.debug(f"Received {ncands} candidates")
     col_heimdall = ["snr", "if", "itime", "mjds", "ibox", "idm", "dm", "ibeam"]
     col_T2old = [
@@ -58,48 +139,34 @@ def parse_candsfile(candsfile):
         "trigger",
     ]
 
-    # flag for heimdall file
-    _hdfile = False
+    # T2 output with peaks tagged by known_sources
+    col_T2known = col_T2 + ["known_source"]
 
-    try:
-        tab = ascii.read(
-            candsfile,
-            names=col_heimdall,
-            guess=True,
-            fast_reader=False,
-            format="no_header",
-        )
-        _hdfile = True
-        logging.debug("Read with heimdall columns")
-    except InconsistentTableError:
+    for cols, fmt in [
+        (col_heimdall, "heimdall"),
+        (col_T2, "T2"),
+        (col_T2known, "T2 with known sources"),
+        (col_T2old, "old style T2"),
+    ]:
         try:
             tab = ascii.read(
                 candsfile,
-                names=col_T2,
+                names=cols,
                 guess=True,
                 fast_reader=False,
                 format="no_header",
             )
-            _hdfile = False
-            logging.debug("Read with T2 columns")
         except InconsistentTableError:
-            try:
-                tab = ascii.read(
-                    candsfile,
-                    names=col_T2old,
-                    guess=True,
-                    fast_reader=False,
-                    format="no_header",
-                )
-                _hdfile = False
-                logging.debug("Read with old style T2 columns")
-            except InconsistentTableError:
-                logging.warning("Inconsistent table. Skipping...")
-                return ([], [], [])
+            continue
+        logging.debug(f"Read with {fmt} columns")
+        break
+    else:
+        logging.warning("Inconsistent table. Skipping...")
+        return ([], [], [])
 
     tab["ibeam"] = tab["ibeam"].astype(int)
 
-    start_time_mjd = requests.get("http://localhost:8083/start_time").json()
+    start_time_mjd = get_start_time()
     tab["mjds"] = tab["mjds"] / 86400.0 + start_time_mjd
 
     return tab
@@ -149,55 +216,285 @@ def cluster_data(
     return_clusterer=False,
     allow_single_cluster=True,
     cluster_selection_epsilon=10,
+    approx_min_rows=None,
+    approx_fit_rows=APPROX_FIT_ROWS,
+    approx_keep_snr=APPROX_KEEP_SNR,
+    approx_assign="nearest",
+    coalesce_time_bin=None,
+    coalesce_dm_bin=COALESCE_DM_BIN,
+    cost_model=None,
 ):
     """Take data from parse_candsfile and identify clusters
     via hamming metric.
     selectcols will take a subset of the standard MBHeimdall output
+    If approx_min_rows is set and tab has more rows, hdbscan is only fit on
+    a subsample (see cluster_approx) of at most approx_fit_rows rows.
+    If coalesce_time_bin is set, only the coalesce_rows representatives
+    are clustered and every row gets the label of its representative
+    (unclustered groups of several rows get a label of their own).
+    cost_model is the path of a calibration file (see costmodel and
+    scripts/calibrate_cluster.py) used to pick the hdbscan algorithm,
+    leaf_size and core_dist_n_jobs predicted fastest for the rows fit.
     """
 
-    data = structured_to_unstructured(
-        tab[selectcols].as_array()
-    )  # ok for single dtype (int)
+    import hdbscan
+
+    data = cluster_features(tab, selectcols)
+    snr = np.asarray(tab["snr"])
+    inverse = None
+    if coalesce_time_bin is not None:
+        rep, inverse, multiplicity = coalesce_rows(
+            tab, coalesce_time_bin, coalesce_dm_bin
+        )
+        logging.info(f"Coalesced {len(data)} candidates to {len(rep)}")
+        metrics.observe("coalesce_kept_frac", len(rep) / max(len(data), 1))
+        data = data[rep]
+        snr = snr[rep]
+    params = dict(
+        metric=metric,
+        min_cluster_size=min_cluster_size,
+        min_samples=min_samples,
+        cluster_selection_method="eom",
+        cluster_selection_epsilon=cluster_selection_epsilon,
+        allow_single_cluster=allow_single_cluster,
+    )
+    approx = approx_min_rows is not None and len(data) > approx_min_rows
+    nfit = min(len(data), approx_fit_rows) if approx else len(data)
+    model = None if cost_model is None else costmodel.get_model(cost_model)
+    if model is not None and model.ndim != data.shape[1]:
+        logging.warning(
+            f"Cost model is for {model.ndim} features, not {data.shape[1]}; ignoring it"
+        )
+        model = None
+    predicted = None
+    if model is not None:
+        settings, predicted = model.choose(nfit)
+        params.update(settings)
+    t0 = time.perf_counter()
     clusterer = None
     try:
-        clusterer = hdbscan.HDBSCAN(
-            metric=metric,
-            min_cluster_size=min_cluster_size,
-            min_samples=min_samples,
-            cluster_selection_method="eom",
-            cluster_selection_epsilon=10,
-            allow_single_cluster=allow_single_cluster,
-        ).fit(data)
-
-        cl = clusterer.labels_
+        if approx:
+            cl, clusterer = cluster_approx(
+                data,
+                snr,
+                params,
+                fit_rows=approx_fit_rows,
+                keep_snr=approx_keep_snr,
+                assign=approx_assign,
+            )
+        else:
+            clusterer = hdbscan.HDBSCAN(**params).fit(data)
+            cl = clusterer.labels_
     except ValueError:
         logging.info(
             "Clustering did not run. Each point \
                assigned to unique cluster."
         )
         cl = np.arange(len(data))
+    if predicted is not None:
+        elapsed = time.perf_counter() - t0
+        logging.info(
+            f"Clustered {nfit} rows with {params['algorithm']}, leaf_size "
+            f"{params['leaf_size']}, {params['core_dist_n_jobs']} jobs in "
+            f"{elapsed:.3f} s (predicted {predicted:.3f} s)"
+        )
+        metrics.observe("cluster_cost_ratio", elapsed / max(predicted, 1e-6))
+
+    if inverse is not None:
+        # an unclustered group is still one detection, so label it as its
+        # own cluster rather than reporting each of its rows
+        cl = np.array(cl)
+        alone = (cl == -1) & (multiplicity > 1)
+        cl[alone] = cl.max(initial=-1) + 1 + np.arange(alone.sum())
+        cl = cl[inverse]
+    assign_clusters(tab, cl)
+
+    if return_clusterer:
+        return clusterer
+
+
+def coalesce_rows(tab, time_bin=COALESCE_TIME_BIN, dm_bin=COALESCE_DM_BIN):
+    """Group repeated detections of one pulse: rows in the same beam,
+    itime // time_bin and idm // dm_bin (any ibox) form a group, and the
+    highest-snr row of each group represents it.
+
+    Returns the representative rows (in table order), the group of every
+    row (an index into the representatives) and the number of rows in
+    each group. Since each representative is the brightest row of its
+    group, labelling rows by their representative's cluster leaves every
+    cluster's peak unchanged.
+    """
 
-    # hack assumes fixed columns
-    #    bl = data[:, 3]
-    cntb, cntc = (
-        np.zeros((len(data), 1), dtype=int),
-        np.zeros((len(data), 1), dtype=int),
+    snr = np.asarray(tab["snr"])
+    keys = np.column_stack(
+        [
+            np.asarray(tab["ibeam"]),
+            np.asarray(tab["itime"]) // time_bin,
+            np.asarray(tab["idm"]) // dm_bin,
+        ]
     )
-    ucl = np.unique(cl)
+    # group rows together, brightest first within each group
+    order = np.lexsort((-snr, keys[:, 2], keys[:, 1], keys[:, 0]))
+    keys = keys[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = np.any(keys[1:] != keys[:-1], axis=1)
+    group = np.cumsum(first) - 1
+
+    rep = order[first]
+    perm = np.argsort(rep)
+    rank = np.empty_like(perm)
+    rank[perm] = np.arange(len(perm))
+    inverse = np.empty(len(order), dtype=int)
+    inverse[order] = rank[group]
+    return rep[perm], inverse, np.bincount(group)[perm]
+
+
+def subsample_rows(snr, fit_rows, keep_snr, strata=None):
+    """Choose at most fit_rows rows to fit on: every row with snr >= keep_snr
+    (the brightest fit_rows if there are more), then an evenly spaced
+    sample of the rest ordered by strata (e.g. beam, then time), so each
+    stratum is represented in proportion to its size.
+    """
 
-    for i in ucl:
-        ww = np.where(i == cl)
-        cntc[ww] = len(ww[0])
-    #        ubl = np.unique(bl[ww])
-    #        cntb[ww] = len(ubl)
+    snr = np.asarray(snr)
+    if len(snr) <= fit_rows:
+        return np.arange(len(snr))
+    high = np.flatnonzero(snr >= keep_snr)
+    if len(high) >= fit_rows:
+        return np.sort(high[np.argpartition(snr[high], -fit_rows)[-fit_rows:]])
+
+    low = np.flatnonzero(snr < keep_snr)
+    nlow = fit_rows - len(high)
+    if strata is not None:
+        low = low[np.lexsort(tuple(np.asarray(s)[low] for s in strata[::-1]))]
+    picks = low[np.linspace(0, len(low) - 1, nlow).astype(int)]
+    return np.sort(np.concatenate([high, picks]))
+
+
+def cluster_approx(
+    data,
+    snr,
+    params,
+    fit_rows=APPROX_FIT_ROWS,
+    keep_snr=APPROX_KEEP_SNR,
+    assign="nearest",
+    max_dist=None,
+):
+    """Cluster a large gulp by fitting hdbscan on a subsample and assigning
+    the remaining rows to the fitted clusters.
+
+    data is the (N, ncol) feature array, snr the candidate snrs and params
+    the hdbscan.HDBSCAN arguments. The fit uses subsample_rows, stratified
+    by the last then first feature column (beam, then time for the default
+    selectcols). assign="nearest" gives each other row the label of its
+    nearest fitted row if that is within max_dist (default
+    cluster_selection_epsilon), otherwise -1. assign="predict" uses
+    hdbscan.approximate_predict, which is closer to the exact result but
+    slower. Fit time is bounded by fit_rows and assignment is
+    O(N log fit_rows).
+    Returns labels for all rows and the fitted clusterer.
+    """
 
-    # modifies tab in place
-    tab["cl"] = cl.tolist()
-    tab["cntc"] = cntc.flatten().tolist()
-    tab["cntb"] = cntb.flatten().tolist()
+    import hdbscan
+    from scipy.spatial import cKDTree
 
-    if return_clusterer:
-        return clusterer
+    ifit = subsample_rows(snr, fit_rows, keep_snr, strata=(data[:, -1], data[:, 0]))
+    logging.info(
+        f"Approximate clustering: fitting {len(ifit)} of {len(data)} candidates"
+    )
+    clusterer = hdbscan.HDBSCAN(prediction_data=(assign == "predict"), **params)
+    clusterer.fit(data[ifit])
+
+    cl = np.full(len(data), -1, dtype=int)
+    cl[ifit] = clusterer.labels_
+    rest = np.ones(len(data), dtype=bool)
+    rest[ifit] = False
+    if assign == "predict":
+        cl[rest], _ = hdbscan.approximate_predict(clusterer, data[rest])
+    else:
+        if max_dist is None:
+            max_dist = max(params.get("cluster_selection_epsilon", 0.0), 1.0)
+        dist, nearest = cKDTree(data[ifit]).query(data[rest])
+        cl[rest] = np.where(dist <= max_dist, clusterer.labels_[nearest], -1)
+
+    return cl, clusterer
+
+
+def approx_quality(
+    tab, selectcols=["itime", "idm", "ibox", "ibeam"], min_snr=None, **kwargs
+):
+    """Compare approximate clustering of tab against the exact path.
+
+    kwargs go to cluster_data (approx_min_rows is forced below len(tab)).
+    Returns a dict with the run time of each path, the number of
+    clustered peaks of each, and:
+    peak_recall: fraction of exact cluster peaks (with snr > min_snr, if
+    set) that get_peak still returns with approximate clustering (either
+    as a cluster peak or as an unclustered candidate),
+    clustered_recall: the same, counting only approximate cluster peaks,
+    brightest_match: whether both paths give the same highest-snr peak,
+    which is what T2 triggers on.
+    """
+
+    from grex_t2.candidates import CandidateBatch
+
+    report = {}
+    peaks = {}
+    clustered = {}
+    for mode in ("exact", "approx"):
+        batch = CandidateBatch.from_columns(
+            {
+                col: np.asarray(tab[col])
+                for col in tab.colnames
+                if col not in ("cl", "cntc", "cntb", "trigger")
+            }
+        )
+        opts = dict(kwargs)
+        opts["approx_min_rows"] = None if mode == "exact" else 0
+        t0 = time.perf_counter()
+        cluster_data(batch, selectcols=selectcols, **opts)
+        report[f"{mode}_s"] = time.perf_counter() - t0
+        peaks[mode] = peak_indices(batch["cl"], batch["snr"])
+        clustered[mode] = peaks[mode][np.asarray(batch["cl"])[peaks[mode]] != -1]
+
+    snr = np.asarray(tab["snr"])
+    exact = clustered["exact"]
+    if min_snr is not None:
+        exact = exact[snr[exact] > min_snr]
+    report["nrow"] = len(tab)
+    report["exact_peaks"] = len(clustered["exact"])
+    report["approx_peaks"] = len(clustered["approx"])
+    report["peak_recall"] = (
+        np.isin(exact, peaks["approx"]).mean() if len(exact) else 1.0
+    )
+    report["clustered_recall"] = (
+        np.isin(exact, clustered["approx"]).mean() if len(exact) else 1.0
+    )
+    report["brightest_match"] = bool(
+        peaks["exact"][np.argmax(snr[peaks["exact"]])]
+        == peaks["approx"][np.argmax(snr[peaks["approx"]])]
+    )
+    return report
+
+
+def cluster_features(tab, selectcols):
+    """Stack selectcols of tab into the (N, ncol) array given to hdbscan,
+    with itime aligned across merged streams (see candidates.aligned).
+    """
+    return np.column_stack([aligned(tab, col) for col in selectcols])
+
+
+def assign_clusters(tab, cl):
+    """Set cluster labels and per-cluster counts (cl, cntc, cntb) on tab,
+    modifying it in place.
+    """
+
+    cl = np.asarray(cl, dtype=int)
+    _, inverse, counts = np.unique(cl, return_inverse=True, return_counts=True)
+    # cntb (number of beams in cluster) is not computed yet
+    tab["cl"] = cl
+    tab["cntc"] = counts[inverse]
+    tab["cntb"] = np.zeros(len(cl), dtype=int)
 
 
 def get_peak(tab):
@@ -206,23 +503,28 @@ def get_peak(tab):
     Puts unclustered candidates in as individual events.
     """
 
-    cl = tab["cl"].astype(int)
-    snrs = tab["snr"]
-    ipeak = []
-    for i in np.unique(cl):
-        if i == -1:
-            continue
-        clusterinds = np.where(i == cl)[0]
-        maxsnr = snrs[clusterinds].max()
-        imaxsnr = np.where(snrs == maxsnr)[0][0]
-        ipeak.append(imaxsnr)
-    # Append unclustered
-    ipeak += [i for i in range(len(tab)) if cl[i] == -1]
+    ipeak = peak_indices(tab["cl"], tab["snr"])
     logging.info(f"Found {len(ipeak)} cluster peaks")
 
     return tab[ipeak]
 
 
+def peak_indices(cl, snrs):
+    """Row indices of the max snr row of each cluster (in label order),
+    followed by all unclustered (cl == -1) rows.
+    """
+
+    cl = np.asarray(cl, dtype=int)
+    snrs = np.asarray(snrs)
+    clustered = np.flatnonzero(cl != -1)
+    # sort clustered rows by label, then snr descending, then row
+    order = clustered[np.lexsort((clustered, -snrs[clustered], cl[clustered]))]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = cl[order][1:] != cl[order][:-1]
+
+    return np.concatenate([order[first], np.flatnonzero(cl == -1)])
+
+
 def filter_clustered(
     tab,
     min_snr=None,
@@ -243,48 +545,19 @@ def filter_clustered(
     max_ncl is maximum number of clusters returned (sorted by SNR).
     """
 
-    if target_params is not None:
-        min_dmt, max_dmt, min_snrt = target_params
-    else:
-        min_dmt, max_dmt, min_snrt = None, None, None
-
-    good = [True] * len(tab)
-
-    if min_snr is not None:
-        if min_snrt is None:
-            good *= tab["snr"] > min_snr
-        else:
-            good0 = (tab["snr"] > min_snr) * (tab["dm"] > max_dmt)
-            good1 = (tab["snr"] > min_snr) * (tab["dm"] < min_dmt)
-            good2 = (
-                (tab["snr"] > min_snrt) * (tab["dm"] > min_dmt) * (tab["dm"] < max_dmt)
-            )
-            good *= good0 + good1 + good2
-
-    if min_dm is not None:
-        good *= tab["dm"] > min_dm
-    if max_ibox is not None:
-        good *= tab["ibox"] < max_ibox
-    if min_cntb is not None:
-        good *= tab["cntb"] > min_cntb
-    if max_cntb is not None:
-        good *= tab["cntb"] < max_cntb
-    if min_cntc is not None:
-        good *= tab["cntc"] > min_cntc
-    if max_cntc is not None:
-        good *= tab["cntc"] < max_cntc
-
-    tab_out = tab[good]
-
-    if max_ncl is not None:
-        if len(tab_out) > max_ncl:
-            min_snr_cl = sorted(tab_out["snr"])[-max_ncl]
-            good = tab_out["snr"] >= 50  # min_snr_cl
-            tab_out = tab_out[good]
-            logging.info(
-                f"Limiting output to {max_ncl} \
-                    clusters with snr>{min_snr_cl}."
-            )
+    spec = {
+        "min_snr": min_snr,
+        "min_dm": min_dm,
+        "max_ibox": max_ibox,
+        "min_cntb": min_cntb,
+        "max_cntb": max_cntb,
+        "min_cntc": min_cntc,
+        "max_cntc": max_cntc,
+        "max_ncl": max_ncl,
+        "target_params": target_params,
+    }
+    tab_out, counts = filters.get_filter(spec)(tab)
+    logging.debug(f"Filter rejections per rule: {counts}")
 
     logging.info(f"Filtering clusters from {len(tab)} to {len(tab_out)} candidates.")
 
@@ -303,6 +576,10 @@ def dump_cluster_results_json(
     snrs=None,
     outroot="./",
     last_trigger_time=0.0,
+    writer=None,
+    injections=None,
+    t_gulp_end=None,
+    candidates="json",
 ):
     """
     Takes tab from parse_candsfile and clsnr from get_peak,
@@ -312,9 +589,20 @@ def dump_cluster_results_json(
     cat is path to source catalog (default None)
     beam_model is pre-calculated beam model (default None)
     coords and snrs are parsed source file input
+    The trigger is sent before the json file is written. If writer
+    (writer.ArtifactWriter) is set, the file is written in the background.
+    injections is an optional database.InjectionCache to use instead of db_con.
+    t_gulp_end is time.perf_counter() at the end of the gulp, used to record
+    the trigger_latency_s metric.
+    candidates is where the candidate goes: "json" (its own JSON file),
+    "log" (the event log of outroot, see eventlog) or "both".
     returns row of table that triggered, along with name generated for candidate.
     """
 
+    if not len(tab):
+        logging.info(f"Not triggering on block with {len(tab)} candidates")
+        return None, lastname, last_trigger_time
+
     if coords is None or snrs is None:
         coords, snrs = triggering.parse_catalog(cat)
 
@@ -327,6 +615,24 @@ def dump_cluster_results_json(
     # if no injection file or no coincident injection
     candname = names.increment_name(mjd, lastname=lastname)
 
+    # json.dumps doesn't know how to serialize numpy integers for some insane reason
+    trigger_payload = {"candname": candname, "itime": int(itimes[imaxsnr])}
+
+    # Check to see if the max SNR candidate corresponds with an injection
+    if injections is not None:
+        isinjection = injections.is_injection(mjd)
+    else:
+        isinjection = database.is_injection(mjd, db_con)
+    if isinjection:
+        logging.info("Candidate corresponds with injection, skipping trigger")
+
+    if trigger and not isinjection:
+        send_trigger(trigger_payload)
+        if t_gulp_end is not None:
+            latency = time.perf_counter() - t_gulp_end
+            metrics.observe("trigger_latency_s", latency)
+            logging.info(f"Trigger sent {1e3 * latency:.1f} ms after end of gulp")
+
     output_dict = {candname: {}}
     if outputfile is None:
         outputfile = f"{outroot}{candname}.json"
@@ -340,38 +646,37 @@ def dump_cluster_results_json(
 
     output_dict[candname]["specnum"] = specnum
 
-    # json.dumps doesn't know how to serialize numpy integers for some insane reason
-    trigger_payload = {"candname": candname, "itime": int(itimes[imaxsnr])}
-
-    # Check to see if the max SNR candidate corresponds with an injection
-    isinjection = database.is_injection(mjd, db_con)
-    if isinjection:
-        logging.info("Candidate corresponds with injection, skipping trigger")
-
-    if len(tab) > 0:
-        with open(outputfile, "w") as f:  # encoding='utf-8'
-            logging.info(f"Writing trigger file for index {imaxsnr} with SNR={maxsnr}")
-            json.dump(output_dict, f, ensure_ascii=False, indent=4)
+    logging.info(f"Writing trigger file for index {imaxsnr} with SNR={maxsnr}")
+    jobs = []
+    if candidates in ("log", "both"):
+        jobs.append((eventlog.append, outroot, candname, output_dict[candname]))
+    if candidates in ("json", "both"):
+        jobs.append((write_json, outputfile, output_dict))
+    for func, *args in jobs:
+        if writer is None:
+            func(*args)
+        else:
+            writer.submit(func, *args)
 
-        if trigger and not isinjection:
-            send_trigger(trigger_payload)
+    return row, candname, last_trigger_time
 
-        return row, candname, last_trigger_time
 
-    else:
-        logging.info(f"Not triggering on block with {len(tab)} candidates")
-        return None, lastname, last_trigger_time
+def write_json(outputfile, output_dict):
+    with open(outputfile, "w") as f:  # encoding='utf-8'
+        json.dump(output_dict, f, ensure_ascii=False, indent=4)
 
 
 def send_trigger(trigger_payload):
     trigger_message = json.dumps(trigger_payload).encode("utf-8")
     logging.info(
-        f"Sending trigger for candidate {trigger_payload['candname']} at time index {trigger_payload['itime']} at Time {Time.now().mjd}",
+        f"Sending trigger for candidate {trigger_payload['candname']} at time index {trigger_payload['itime']} at Time {names.mjd_now()}",
     )
     UDP_PORT = 65432
     UDP_IP = "127.0.0.1"
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)  # Internet  # UDP
-    sock.sendto(trigger_message, (UDP_IP, UDP_PORT))
+    # one UDP socket for all triggers, rather than one per trigger
+    if _trigger_sock["sock"] is None:
+        _trigger_sock["sock"] = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    _trigger_sock["sock"].sendto(trigger_message, (UDP_IP, UDP_PORT))
 
 
 def dump_cluster_results_heimdall(tab, outputfile, min_snr_t2out=None, max_ncl=None):
@@ -0,0 +1,240 @@
+import copy
+import json
+import logging
+
+# Default T2 settings. A JSON config file passed to load_config only needs
+# the keys it changes. None disables a threshold.
+DEFAULT_CONFIG = {
+    # hdbscan settings (see cluster_heimdall.cluster_data)
+    "cluster": {
+        "selectcols": ["itime", "idm", "ibox", "ibeam"],
+        "min_cluster_size": 2,
+        "min_samples": 5,
+        "cluster_selection_epsilon": 10,
+        # above this many candidates, fit on a subsample of approx_fit_rows
+        # rows (keeping snr >= approx_keep_snr) and assign the rest. On
+        # scripts/bench_approx_cluster.py storm gulps (1 CPU) exact hdbscan
+        # takes up to 0.3 s at 10k rows but 1-10 s at 20k, against a 17 s
+        # gulp; fitting 5k rows takes 0.16 s at 100k rows and finds the
+        # same brightest peak (peak recall 0.97 at 20k rows)
+        "approx_min_rows": 10000,
+        "approx_fit_rows": 5000,
+        "approx_keep_snr": 12.0,
+        "approx_assign": "nearest",
+        # cluster one row per (beam, itime // coalesce_time_bin,
+        # idm // coalesce_dm_bin) group instead of every boxcar/DM trial;
+        # None clusters every row
+        "coalesce_time_bin": None,
+        "coalesce_dm_bin": 2,
+        # calibration file of scripts/calibrate_cluster.py; with it the
+        # hdbscan algorithm, leaf_size and core_dist_n_jobs predicted
+        # fastest are used for each gulp (see costmodel)
+        "cost_model": None,
+    },
+    # gulp assembly from heimdall packets (see framing.GulpFramer); None
+    # disables a limit
+    "framing": {
+        "max_bytes": 16 * 1024**2,
+        "idle_timeout": 2.0,
+        "max_span": 65536,
+    },
+    # several heimdall streams (see merge.StreamMerger): gulps in the same
+    # window of gulp_samples samples are merged, waiting at most max_wait
+    # seconds and max_pending windows. With min_streams > 1 only clusters
+    # seen by that many streams pass the filter. start_times lists the
+    # heimdall start time of each stream (an MJD, a start time URL or None
+    # for the T2 start time); candidate times are shifted onto the T2
+    # start time before merging, and clustering uses itime counted from it
+    # (tsamp seconds per sample). None: one start time.
+    "merge": {
+        "gulp_samples": 16384,
+        "max_wait": 1.0,
+        "max_pending": 8,
+        "min_streams": 1,
+        "start_times": None,
+        "tsamp": 1.048e-3,
+    },
+    # hot beams (see beams.BeamMonitor): per-beam candidate rates decay
+    # with a half-life of halflife gulps; after min_gulps gulps, beams above
+    # the median rate of active beams by k_mask scaled MADs (and min_rate
+    # candidates per gulp) are dropped before clustering until they fall
+    # below k_unmask MADs, at most max_masked beams at a time and only with
+    # min_active beams active. Off by default: masking drops real
+    # candidates of a masked beam along with its RFI
+    "beams": {
+        "enabled": False,
+        "halflife": 20.0,
+        "k_mask": 10.0,
+        "k_unmask": 5.0,
+        "min_rate": 50.0,
+        "min_gulps": 10,
+        "min_active": 8,
+        "max_masked": 32,
+    },
+    # RFI storms: time bins (of time_bin samples) with candidates in more
+    # than max_beams beams or max_dm_bins DM bins (of dm_bin trials) are
+    # excised or cut to their keep_per_bin brightest rows before clustering
+    "rfi": {
+        "enabled": True,
+        "time_bin": 256,
+        "dm_bin": 16,
+        "max_beams": 128,
+        "max_dm_bins": None,
+        "action": "summarise",
+        "keep_per_bin": 5,
+    },
+    # drop rows before clustering that are farther than guard from any row
+    # that could pass the filter (loosened by the margins). Low-DM and wide
+    # boxcar peaks are then missing from the .cand output.
+    "prefilter": {
+        "enabled": False,
+        "snr_margin": 2.0,
+        "dm_margin": 10.0,
+        "ibox_margin": 0,
+        "guard": 50.0,
+    },
+    # cuts on cluster peaks before triggering (see filters.CandidateFilter)
+    "filter": {
+        "min_snr": 10.0,
+        "min_dm": 50.0,
+        "max_ibox": 64,
+        "max_cntb": None,
+        "max_ncl": None,
+        # [min_dm, max_dm, min_snr] for Galactic bursts
+        "target_params": [50.0, 100.0, 20.0],
+        "rules": [],
+    },
+    # classifier of cluster peaks (see classify.Classifier): model is a
+    # JSON file of classify.LinearModel (scripts/train_classifier.py) or
+    # "module:name" of a callable returning a model. Peaks scoring below
+    # min_score are rejected; gulps whose features and scoring would take
+    # more than budget_s seconds trigger on the filter cuts alone. None
+    # for model disables it.
+    "classify": {
+        "model": None,
+        "min_score": 0.5,
+        "budget_s": 0.05,
+    },
+    # degradation when gulps queue up (see shedding.LoadShedder): from a
+    # backlog of thresholds[0] gulps cluster with the "cluster" overrides,
+    # from thresholds[1] keep only the top_k snr rows, from thresholds[2]
+    # skip the .cand/.csv outputs. Triggers are always sent.
+    "shedding": {
+        "enabled": True,
+        "thresholds": [4, 8, 16],
+        "recover": 0.5,
+        "cluster": {"approx_min_rows": 2000, "approx_fit_rows": 2000},
+        "top_k": 5000,
+    },
+    # peaks matching a known periodic source of catalog (e.g.
+    # data/catalog.txt, see known_sources.read_known_sources) in DM, pulse
+    # phase and beam are tagged in their known_source column and do not
+    # trigger. Beams are placed from the site longitude (degrees east);
+    # peaks match within beam_tol beams, and sources only within half the
+    # primary beam of pointing_dec (degrees, None to skip). None for
+    # catalog disables the check.
+    "known_sources": {
+        "catalog": None,
+        "longitude": -118.2834,
+        "pointing_dec": None,
+        "beam_tol": 4,
+    },
+    # profiles of gulps slower than threshold_s seconds (see
+    # profiling.GulpProfiler), written to outdir (None for
+    # <outroot>/profiles/); SIGUSR1 runs the next cprofile_gulps gulps
+    # under cProfile
+    "profiling": {
+        "enabled": True,
+        "threshold_s": 2.0,
+        "sample_interval": 0.01,
+        "outdir": None,
+        "max_captures": 100,
+        "cprofile_gulps": 10,
+    },
+    # per-gulp RSS accounting (see memory.MemoryTracker); a leak is reported
+    # when RSS grows throughout window gulps by more than
+    # leak_bytes_per_gulp per gulp. trace adds tracemalloc stage peaks and
+    # top allocation sites every top_every gulps, at a large speed cost.
+    "memory": {
+        "enabled": True,
+        "trace": False,
+        "window": 100,
+        "leak_bytes_per_gulp": 64 * 1024,
+        "top_every": 100,
+        "top_n": 10,
+    },
+    # stream of framed JSON messages with each gulp's cluster peaks and
+    # trigger decision (see events.EventPublisher), on "unix:/path" or
+    # "tcp:host:port"; subscribers with more than max_buffer bytes unsent
+    # are dropped. None disables the stream.
+    "events": {
+        "address": None,
+        "max_buffer": 4 * 1024**2,
+    },
+    # recent cluster peaks held in memory (see recent.RecentPeaks) and
+    # served as JSON on http://host:port/peaks; peaks older than max_age
+    # seconds or beyond capacity are written to spill_dir (or dropped if
+    # None). None for port disables the service.
+    "recent": {
+        "port": None,
+        "host": "127.0.0.1",
+        "capacity": 200000,
+        "max_age": 6 * 3600.0,
+        "spill_dir": None,
+    },
+    # with workers > 0, gulps are clustered in that many worker processes,
+    # up to max_inflight (default 2 * workers) at a time, and committed
+    # (named, triggered, written) in order (see pipeline.process_gulps)
+    "pipeline": {
+        "workers": 0,
+        "max_inflight": None,
+    },
+    # runtime state (last name, trigger holdoff, start time, injection
+    # cache, max_peaks recent peaks) saved every interval seconds to path
+    # (None: outroot/.t2_checkpoint) and restored at startup; start time
+    # and peaks are only restored from checkpoints younger than max_age
+    # seconds (see checkpoint)
+    "checkpoint": {
+        "enabled": True,
+        "path": None,
+        "interval": 30.0,
+        "max_age": 3600.0,
+        "max_peaks": 5000,
+    },
+    # cuts on the clustered .cand output, and where triggered candidates
+    # are written: "log" (per-day event log in outroot/eventlog, see
+    # eventlog), "json" (one JSON file each in outroot) or "both"
+    "output": {
+        "min_snr_t2out": 10.0,
+        "max_ncl": None,
+        "candidates": "log",
+    },
+}
+
+
+def merge(base, update):
+    """Recursively merge dict update into a copy of base."""
+
+    merged = copy.deepcopy(base)
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def load_config(path=None):
+    """Return DEFAULT_CONFIG updated with the JSON file at path (if given)."""
+
+    if path is None:
+        return copy.deepcopy(DEFAULT_CONFIG)
+
+    with open(path, "r") as f:
+        update = json.load(f)
+    unknown = set(update) - set(DEFAULT_CONFIG)
+    if unknown:
+        logging.warning(f"Ignoring unknown config sections {sorted(unknown)}")
+        update = {key: value for key, value in update.items() if key in DEFAULT_CONFIG}
+    logging.info(f"Loaded T2 config from {path}")
+    return merge(DEFAULT_CONFIG, update)
@@ -0,0 +1,105 @@
+import json
+import logging
+import numpy as np
+
+# hdbscan settings that change run time but not (much) the clustering; the
+# first entry of each is what cluster_data uses without a cost model
+ALGORITHMS = ["boruvka_kdtree", "prims_kdtree", "boruvka_balltree"]
+LEAF_SIZES = [40, 20, 80]
+CORE_DIST_N_JOBS = [4, 1]
+DEFAULT = {"algorithm": "boruvka_kdtree", "leaf_size": 40, "core_dist_n_jobs": 4}
+
+# cost models loaded by get_model, by path
+_models = {}
+
+
+def settings_grid(
+    algorithms=ALGORITHMS, leaf_sizes=LEAF_SIZES, n_jobs=CORE_DIST_N_JOBS
+):
+    """Every combination of the settings, skipping core_dist_n_jobs other
+    than 1 for prims (which computes core distances on one thread).
+    """
+
+    grid = []
+    for algorithm in algorithms:
+        for leaf_size in leaf_sizes:
+            for jobs in n_jobs:
+                if algorithm.startswith("prims") and jobs != 1:
+                    continue
+                grid.append(
+                    {
+                        "algorithm": algorithm,
+                        "leaf_size": leaf_size,
+                        "core_dist_n_jobs": jobs,
+                    }
+                )
+    return grid
+
+
+def fit_power_law(nrows, seconds):
+    """Least-squares fit of seconds = exp(a) * nrows**b in log space.
+    Returns (a, b).
+    """
+
+    b, a = np.polyfit(np.log(nrows), np.log(seconds), 1)
+    return float(a), float(b)
+
+
+class CostModel:
+    """Predicted hdbscan run time of each calibrated group of settings, as
+    a power law of the number of rows clustered.
+
+    Each entry of entries holds the hdbscan settings, the fit (a, b), the
+    calibrated range of rows and whether its clusters were equivalent to
+    those of DEFAULT on the calibration gulps. ndim is the number of
+    features clustered.
+    """
+
+    def __init__(self, entries, ndim=4, machine=None):
+        self.entries = entries
+        self.ndim = ndim
+        self.machine = machine
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            model = json.load(f)
+        return cls(model["entries"], model["ndim"], model.get("machine"))
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(
+                {"ndim": self.ndim, "machine": self.machine, "entries": self.entries},
+                f,
+                indent=2,
+            )
+
+    def predict(self, entry, nrow):
+        return float(np.exp(entry["a"]) * max(nrow, 1) ** entry["b"])
+
+    def choose(self, nrow):
+        """The hdbscan settings (a dict for hdbscan.HDBSCAN) predicted to
+        cluster nrow rows fastest among the equivalent ones, and the
+        predicted seconds (None without any equivalent settings).
+        """
+
+        equivalent = [e for e in self.entries if e["equivalent"]]
+        if not equivalent:
+            return dict(DEFAULT), None
+        best = min(equivalent, key=lambda e: self.predict(e, nrow))
+        return dict(best["settings"]), self.predict(best, nrow)
+
+
+def get_model(path):
+    """CostModel from the calibration file at path, loaded once. None if it
+    cannot be read, in which case DEFAULT settings are used.
+    """
+
+    if path not in _models:
+        try:
+            _models[path] = CostModel.load(path)
+            logging.info(f"Loaded hdbscan cost model {path}")
+        except (OSError, ValueError, KeyError) as exc:
+            logging.warning(f"Could not load hdbscan cost model {path}: {exc}")
+            _models[path] = None
+    return _models[path]
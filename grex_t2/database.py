@@ -1,6 +1,10 @@
+import bisect
 import sqlite3
 import logging
 
+# Not sure why the offset from T0 is this much
+INJECTION_OFFSET = 15 / 86400  # Seconds to days
+
 
 def connect(path: str) -> sqlite3.Connection:
     """Connect to the SQLite database"""
@@ -12,17 +16,48 @@ def connect(path: str) -> sqlite3.Connection:
 def is_injection(mjd: float, con: sqlite3.Connection) -> bool:
     """Run a SQL query to see if T0 performed an injection near candidate time"""
 
-    # Not sure why the offset from T0 is this much
-    OFFSET = 15 / 86400  # Seconds to days
     cur = con.cursor()
     logging.debug(f"Testing if candidate at {mjd} corresponds to an injection")
     cur.execute(
         "SELECT COUNT(*) FROM injection WHERE mjd BETWEEN ? AND ?",
         (
-            mjd - OFFSET / 2,
-            mjd + OFFSET / 2,
+            mjd - INJECTION_OFFSET / 2,
+            mjd + INJECTION_OFFSET / 2,
         ),
     )
     res = cur.fetchone()
     logging.debug(f"SQL Query Result: {res}")
     return res[0] == 1
+
+
+class InjectionCache:
+    """In-memory sorted copy of the injection MJDs.
+
+    Only rows added since the last refresh (rowid above high_water) are
+    read from the database, so checking a candidate costs one small
+    indexed query plus a binary search instead of a range scan.
+    """
+
+    def __init__(self, con: sqlite3.Connection, high_water: int = 0):
+        self.con = con
+        self.high_water = high_water
+        self.mjds = []
+
+    def refresh(self):
+        rows = self.con.execute(
+            "SELECT rowid, mjd FROM injection WHERE rowid > ? ORDER BY rowid",
+            (self.high_water,),
+        ).fetchall()
+        for _, mjd in rows:
+            bisect.insort(self.mjds, mjd)
+        if rows:
+            self.high_water = rows[-1][0]
+            logging.debug(f"Loaded {len(rows)} new injections")
+
+    def is_injection(self, mjd: float) -> bool:
+        """Same test as is_injection, against the cached injections"""
+
+        self.refresh()
+        lo = bisect.bisect_left(self.mjds, mjd - INJECTION_OFFSET / 2)
+        hi = bisect.bisect_right(self.mjds, mjd + INJECTION_OFFSET / 2)
+        return hi - lo == 1
@@ -0,0 +1,239 @@
+import glob
+import json
+import logging
+import os
+import re
+import numpy as np
+from grex_t2 import names
+
+# directory of the event log in outroot
+EVENT_DIR = "eventlog"
+# candidate name suffix length (see names.increment_name)
+SUFFIX_LENGTH = 4
+# index record of a candidate: its MJD and 1 + the byte offset of its line
+# in the day's log (0 for names not logged), at position suffix number
+INDEX_DTYPE = np.dtype([("mjd", "<f8"), ("offset", "<u8")])
+# candidate JSON files written by cluster_heimdall.dump_cluster_results_json
+JSON_NAME = re.compile(r"^\d{6}[a-z]{%d}\.json$" % SUFFIX_LENGTH)
+
+# One append-only file of JSON lines per day (<yymmdd>.jsonl), each line
+# {"candname": ..., <fields of the candidate JSON file>}, and a fixed-width
+# side index (<yymmdd>.idx) addressed by the number of the name's suffix,
+# so that any candidate is found with one seek in each file.
+
+
+def event_dir(outroot):
+    return os.path.join(outroot, EVENT_DIR)
+
+
+def _paths(outroot, day):
+    base = os.path.join(event_dir(outroot), day)
+    return base + ".jsonl", base + ".idx"
+
+
+def _split(candname):
+    """(day, index position) of a candidate name."""
+
+    candname = candname.split("_inj")[0]
+    return candname[:-SUFFIX_LENGTH], names.suffixtonumber(candname[-SUFFIX_LENGTH:])
+
+
+def _name(day, number):
+    return f"{day}{names.numbertosuffix(number):a>{SUFFIX_LENGTH}}"
+
+
+def append(outroot, candname, fields):
+    """Append the candidate candname (fields as in its JSON file, mjds
+    included) to the event log of its day.
+    """
+
+    day, number = _split(candname)
+    log_path, index_path = _paths(outroot, day)
+    os.makedirs(event_dir(outroot), exist_ok=True)
+    line = json.dumps({"candname": candname, **fields}, default=float) + "\n"
+    with open(log_path, "a+b") as f:
+        offset = f.seek(0, os.SEEK_END)
+        if offset:
+            # end a line cut short by a crash, so that it is skipped on reading
+            f.seek(offset - 1)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+                offset += 1
+        f.write(line.encode())
+    record = np.array([(fields.get("mjds", np.nan), offset + 1)], dtype=INDEX_DTYPE)
+    # the line is written first, so an index entry never points past the log
+    with open(index_path, "r+b" if os.path.exists(index_path) else "wb") as f:
+        f.seek(number * INDEX_DTYPE.itemsize)
+        f.write(record.tobytes())
+
+
+def _read_line(log_path, offset):
+    with open(log_path, "rb") as f:
+        f.seek(offset)
+        return json.loads(f.readline())
+
+
+def lookup(outroot, candname):
+    """The logged record of candname, or None."""
+
+    day, number = _split(candname)
+    log_path, index_path = _paths(outroot, day)
+    try:
+        with open(index_path, "rb") as f:
+            f.seek(number * INDEX_DTYPE.itemsize)
+            data = f.read(INDEX_DTYPE.itemsize)
+    except FileNotFoundError:
+        return None
+    if len(data) < INDEX_DTYPE.itemsize:
+        return None
+    offset = int(np.frombuffer(data, dtype=INDEX_DTYPE)["offset"][0])
+    return _read_line(log_path, offset - 1) if offset else None
+
+
+def exists(outroot, candname):
+    """Whether candname was written, to the event log or as a JSON file."""
+
+    return lookup(outroot, candname) is not None or os.path.exists(
+        os.path.join(outroot, f"{candname}.json")
+    )
+
+
+def read_index(outroot, day):
+    """Index records of a day (see INDEX_DTYPE), by suffix number."""
+
+    _, index_path = _paths(outroot, day)
+    try:
+        return np.fromfile(index_path, dtype=INDEX_DTYPE)
+    except FileNotFoundError:
+        return np.zeros(0, dtype=INDEX_DTYPE)
+
+
+def find_mjd(outroot, mjd, tol=None):
+    """The logged record closest in MJD to mjd on its day (within tol days
+    if given), or None.
+    """
+
+    dt = names.mjd_to_datetime(mjd)
+    day = f"{str(dt.year)[2:]}{dt.month:02d}{dt.day:02d}"
+    index = read_index(outroot, day)
+    logged = np.flatnonzero(index["offset"])
+    if not len(logged):
+        return None
+    nearest = logged[np.argmin(np.abs(index["mjd"][logged] - mjd))]
+    if tol is not None and abs(index["mjd"][nearest] - mjd) > tol:
+        return None
+    log_path, _ = _paths(outroot, day)
+    return _read_line(log_path, int(index["offset"][nearest]) - 1)
+
+
+def days(outroot):
+    """Days (yymmdd) with an event log, in order."""
+
+    paths = glob.glob(os.path.join(event_dir(outroot), "*.jsonl"))
+    return sorted(os.path.basename(p)[: -len(".jsonl")] for p in paths)
+
+
+def iter_events(outroot, day=None):
+    """Records of the event log in the order they were written, of one day
+    or of every day.
+    """
+
+    for d in [day] if day is not None else days(outroot):
+        log_path, _ = _paths(outroot, d)
+        with open(log_path, "rb") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logging.warning(f"Skipping broken line in {log_path}")
+
+
+def _parses(line):
+    try:
+        json.loads(line)
+    except ValueError:
+        return False
+    return True
+
+
+def rebuild_index(outroot, day):
+    """Rewrite the index of a day from its log (e.g. after a crash between
+    writing a line and its index entry). Returns the number of records.
+    """
+
+    log_path, index_path = _paths(outroot, day)
+    entries = []
+    offset = 0
+    with open(log_path, "rb") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logging.warning(f"Skipping broken line at {offset} of {log_path}")
+            else:
+                _, number = _split(record["candname"])
+                entries.append((number, record.get("mjds", np.nan), offset + 1))
+            offset += len(line)
+    index = np.zeros(max((e[0] for e in entries), default=-1) + 1, dtype=INDEX_DTYPE)
+    for number, mjd, line_offset in entries:
+        index[number] = (mjd, line_offset)
+    tmp = index_path + ".tmp"
+    index.tofile(tmp)
+    os.replace(tmp, index_path)
+    return len(entries)
+
+
+def last_name(outroot):
+    """Highest candidate name in the event log, or None without a log.
+    The index of the last day is rebuilt first if it misses lines.
+    """
+
+    logged_days = days(outroot)
+    if not logged_days:
+        return None
+    day = logged_days[-1]
+    log_path, _ = _paths(outroot, day)
+    index = read_index(outroot, day)
+    logged = np.flatnonzero(index["offset"])
+    end = 0
+    with open(log_path, "rb") as f:
+        if len(logged):
+            offset = int(index["offset"][logged].max()) - 1
+            f.seek(offset)
+            end = offset + len(f.readline())
+        # only broken lines (cut short by a crash) may follow the last
+        # indexed one, as they never get an index entry
+        f.seek(end)
+        behind = any(_parses(line) for line in f)
+    if behind:
+        logging.warning(f"Event log index of {day} is behind its log, rebuilding it")
+        rebuild_index(outroot, day)
+        index = read_index(outroot, day)
+        logged = np.flatnonzero(index["offset"])
+    return _name(day, int(logged[-1])) if len(logged) else None
+
+
+def migrate_json(outroot, remove=False):
+    """Append the candidate JSON files of outroot to its event log, in name
+    order, skipping candidates already logged. With remove, each file is
+    deleted once its record reads back from the log. Returns the numbers
+    of files logged and skipped.
+    """
+
+    paths = sorted(
+        os.path.join(outroot, f) for f in os.listdir(outroot) if JSON_NAME.match(f)
+    )
+    nlogged = nskipped = 0
+    for path in paths:
+        with open(path, "r") as f:
+            ((candname, fields),) = json.load(f).items()
+        if lookup(outroot, candname) is None:
+            append(outroot, candname, fields)
+            nlogged += 1
+        else:
+            nskipped += 1
+        if remove:
+            if lookup(outroot, candname) != {"candname": candname, **fields}:
+                raise RuntimeError(f"{candname} does not read back from the event log")
+            os.remove(path)
+    return nlogged, nskipped
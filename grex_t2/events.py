@@ -0,0 +1,281 @@
+import json
+import logging
+import os
+import selectors
+import socket
+import struct
+import threading
+import numpy as np
+from grex_t2 import metrics
+
+# messages are a 4-byte big-endian length followed by that many bytes of
+# compact JSON
+FRAME = struct.Struct(">I")
+# bytes queued for one subscriber before it is dropped
+MAX_BUFFER = 4 * 1024**2
+# columns of the cluster peaks published with each gulp (score only with
+# a classifier, see classify, and known_source with a known-source catalog)
+PEAK_COLUMNS = [
+    "snr",
+    "itime",
+    "mjds",
+    "ibox",
+    "idm",
+    "dm",
+    "ibeam",
+    "cl",
+    "cntc",
+    "cntb",
+    "trigger",
+    "score",
+    "known_source",
+]
+
+
+def encode(message):
+    """One framed message."""
+
+    body = json.dumps(message, separators=(",", ":"), default=_to_json).encode()
+    return FRAME.pack(len(body)) + body
+
+
+def _to_json(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot publish {type(value).__name__}")
+
+
+def parse_address(address):
+    """Socket family and address of "unix:/path" or "tcp:host:port"."""
+
+    kind, _, rest = address.partition(":")
+    if kind == "unix":
+        return socket.AF_UNIX, rest
+    if kind == "tcp":
+        host, _, port = rest.rpartition(":")
+        return socket.AF_INET, (host or "127.0.0.1", int(port))
+    raise ValueError(
+        f"Event stream address {address} is not unix:PATH or tcp:HOST:PORT"
+    )
+
+
+class EventPublisher:
+    """Publishes framed messages to any number of subscribers connected to
+    a Unix or TCP socket.
+
+    publish() only encodes the message and appends it to the buffer of
+    every subscriber; a thread sends the buffers without blocking. A
+    subscriber with more than max_buffer bytes waiting (stuck or too
+    slow) is disconnected, so a consumer can never hold up T2. Messages
+    are not kept for subscribers that connect later.
+    """
+
+    def __init__(self, address, max_buffer=MAX_BUFFER):
+        self.address = address
+        self.max_buffer = max_buffer
+        family, self._bind = parse_address(address)
+        if family == socket.AF_UNIX and os.path.exists(self._bind):
+            os.remove(self._bind)
+        self._server = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind(self._bind)
+        self._server.listen()
+        self._server.setblocking(False)
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._lock = threading.Lock()
+        # socket -> bytearray of unsent bytes
+        self._buffers = {}
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="t2-events", daemon=True)
+        self._thread.start()
+        logging.info(f"Publishing candidate events on {address}")
+
+    @property
+    def nsubscriber(self):
+        with self._lock:
+            return len(self._buffers)
+
+    def publish(self, message):
+        """Queue message (a JSON-serialisable dict) for every subscriber."""
+
+        frame = encode(message)
+        dropped = []
+        with self._lock:
+            for sock, buffer in self._buffers.items():
+                if len(buffer) + len(frame) > self.max_buffer:
+                    dropped.append(sock)
+                else:
+                    buffer += frame
+            for sock in dropped:
+                del self._buffers[sock]
+        for sock in dropped:
+            logging.warning(
+                f"Dropping event subscriber with {self.max_buffer} bytes unsent"
+            )
+            metrics.inc("events_subscribers_dropped")
+        metrics.inc("events_published")
+        self._wake()
+
+    def close(self):
+        """Stop publishing and disconnect all subscribers."""
+
+        if self._closed:
+            return
+        self._closed = True
+        self._wake()
+        self._thread.join()
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b"\0")
+        except BlockingIOError:
+            # already woken
+            pass
+
+    def _run(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self._server, selectors.EVENT_READ, "accept")
+        selector.register(self._wake_r, selectors.EVENT_READ, "wake")
+        registered = {}
+        while not self._closed:
+            for key, events in selector.select(timeout=1.0):
+                if key.data == "accept":
+                    self._accept(selector, registered)
+                elif key.data == "wake":
+                    try:
+                        while self._wake_r.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                else:
+                    if events & selectors.EVENT_READ:
+                        self._receive(key.fileobj)
+                    if events & selectors.EVENT_WRITE:
+                        self._send(key.fileobj)
+
+            # close subscribers dropped by publish() or that hung up, and
+            # watch for writability where there is something to send
+            with self._lock:
+                live = {sock: len(buffer) for sock, buffer in self._buffers.items()}
+            for sock in list(registered):
+                if sock not in live:
+                    selector.unregister(sock)
+                    sock.close()
+                    del registered[sock]
+                    continue
+                mask = selectors.EVENT_READ
+                if live[sock]:
+                    mask |= selectors.EVENT_WRITE
+                if registered[sock] != mask:
+                    selector.modify(sock, mask)
+                    registered[sock] = mask
+
+        for sock in registered:
+            sock.close()
+        with self._lock:
+            self._buffers.clear()
+        selector.close()
+        self._server.close()
+        self._wake_r.close()
+        self._wake_w.close()
+        if isinstance(self._bind, str) and os.path.exists(self._bind):
+            os.remove(self._bind)
+
+    def _accept(self, selector, registered):
+        try:
+            sock, _ = self._server.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        with self._lock:
+            self._buffers[sock] = bytearray()
+        selector.register(sock, selectors.EVENT_READ)
+        registered[sock] = selectors.EVENT_READ
+        metrics.inc("events_subscribers")
+        logging.info(f"Event subscriber connected, {len(registered)} in total")
+
+    def _send(self, sock):
+        with self._lock:
+            buffer = self._buffers.get(sock)
+            if not buffer:
+                return
+            try:
+                sent = sock.send(buffer)
+            except BlockingIOError:
+                return
+            except OSError:
+                del self._buffers[sock]
+                return
+            del buffer[:sent]
+
+    def _receive(self, sock):
+        # subscribers only listen; EOF or an error means they hung up
+        try:
+            data = sock.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            with self._lock:
+                self._buffers.pop(sock, None)
+
+
+def read_message(sock):
+    """Next message from a subscriber socket, or None at end of stream."""
+
+    header = _recv_exactly(sock, FRAME.size)
+    if header is None:
+        return None
+    body = _recv_exactly(sock, FRAME.unpack(header)[0])
+    if body is None:
+        return None
+    return json.loads(body)
+
+
+def _recv_exactly(sock, n):
+    data = bytearray()
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+def subscribe(address, timeout=None):
+    """Connect to a publisher at address and yield its messages."""
+
+    family, bind = parse_address(address)
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(bind)
+        while True:
+            message = read_message(sock)
+            if message is None:
+                return
+            yield message
+
+
+def gulp_message(gulp_id, peaks, candname=None, triggered=False, injection=False):
+    """Message describing one gulp: its cluster peaks (columns of the
+    CandidateBatch peaks, mjds in MJD) and the trigger decision: candname
+    is the name given to the brightest peak passing the filter, if any,
+    triggered whether a trigger was sent for it and injection whether it
+    matched an injection.
+    """
+
+    return {
+        "type": "gulp",
+        "gulp": gulp_id,
+        "npeak": len(peaks),
+        "peaks": {name: peaks[name] for name in PEAK_COLUMNS if name in peaks},
+        "candname": candname,
+        "triggered": bool(triggered),
+        "injection": bool(injection),
+    }
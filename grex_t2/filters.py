@@ -0,0 +1,207 @@
+import json
+import logging
+from functools import lru_cache
+import numpy as np
+from grex_t2.candidates import aligned
+
+# comparison for each threshold key of a filter spec: key -> (column, ufunc)
+THRESHOLDS = {
+    "min_snr": ("snr", np.greater),
+    "min_dm": ("dm", np.greater),
+    "max_ibox": ("ibox", np.less),
+    "min_cntb": ("cntb", np.greater),
+    "max_cntb": ("cntb", np.less),
+    "min_cntc": ("cntc", np.greater),
+    "max_cntc": ("cntc", np.less),
+}
+
+OPS = {
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "<": np.less,
+    "<=": np.less_equal,
+    "==": np.equal,
+    "!=": np.not_equal,
+}
+
+
+class CandidateFilter:
+    """Compiled candidate selection.
+
+    A filter is a list of named rules, each writing a boolean row of one
+    preallocated (nrule, N) mask array, which is reduced once to the
+    selection. Along with the selection, a filter reports the number of
+    candidates each rule rejects (counted independently of the other
+    rules) and the number removed by the max_ncl top-N cut.
+    """
+
+    def __init__(self, rules, max_ncl=None):
+        self.rules = rules
+        self.max_ncl = max_ncl
+
+    @classmethod
+    def from_spec(cls, spec):
+        """Compile a filter spec.
+
+        The spec is a dict (e.g. the "filter" section of the T2 config) with
+        any of the threshold keys in THRESHOLDS, target_params
+        ([min_dmt, max_dmt, min_snrt], the snr threshold inside a DM
+        window), max_ncl (keep at most this many, highest snr first) and
+        rules, a list of extra {"name", "column", "op", "value"} cuts.
+        Thresholds set to None are skipped.
+        """
+
+        rules = []
+        target_params = spec.get("target_params")
+        for key, (column, ufunc) in THRESHOLDS.items():
+            value = spec.get(key)
+            if value is None or (key == "min_snr" and target_params is not None):
+                continue
+            rules.append((key, _compare_rule(column, ufunc, value)))
+
+        if spec.get("min_snr") is not None and target_params is not None:
+            rules.append(("min_snr", _target_rule(spec["min_snr"], *target_params)))
+
+        for rule in spec.get("rules", []):
+            name = rule.get("name", f"{rule['column']}{rule['op']}{rule['value']}")
+            rules.append(
+                (name, _compare_rule(rule["column"], OPS[rule["op"]], rule["value"]))
+            )
+
+        max_ncl = spec.get("max_ncl")
+        if max_ncl is not None:
+            max_ncl = int(max_ncl) if np.isfinite(max_ncl) else None
+        return cls(rules, max_ncl=max_ncl)
+
+    def select(self, tab):
+        """Indices of the rows of tab passing the filter (in table order),
+        and a dict of rejection counts per rule.
+        """
+
+        nrow = len(tab)
+        masks = np.empty((len(self.rules), nrow), dtype=bool)
+        for irule, (_, rule) in enumerate(self.rules):
+            rule(tab, masks[irule])
+
+        counts = dict(
+            zip((name for name, _ in self.rules), (nrow - masks.sum(axis=1)).tolist())
+        )
+        if len(self.rules):
+            good = np.flatnonzero(np.logical_and.reduce(masks, axis=0))
+        else:
+            good = np.arange(nrow)
+
+        counts["max_ncl"] = 0
+        if self.max_ncl is not None and len(good) > self.max_ncl:
+            snr = np.asarray(tab["snr"])[good]
+            top = np.sort(np.argpartition(snr, -self.max_ncl)[-self.max_ncl :])
+            counts["max_ncl"] = len(good) - len(top)
+            logging.info(
+                f"Limiting output to {self.max_ncl} clusters with snr>={snr[top].min()}."
+            )
+            good = good[top]
+
+        return good, counts
+
+    def __call__(self, tab):
+        """Return the rows of tab passing the filter, and rejection counts."""
+        good, counts = self.select(tab)
+        return tab[good], counts
+
+
+def _compare_rule(column, ufunc, value):
+    def rule(tab, out):
+        ufunc(tab[column], value, out=out)
+
+    return rule
+
+
+def _target_rule(min_snr, min_dmt, max_dmt, min_snrt):
+    """snr > min_snrt for min_dmt < dm < max_dmt and snr > min_snr outside
+    the window. DMs exactly on a window edge are rejected, as before.
+    """
+
+    def rule(tab, out):
+        dm = np.asarray(tab["dm"])
+        inside = (dm > min_dmt) & (dm < max_dmt)
+        np.greater(tab["snr"], np.where(inside, min_snrt, min_snr), out=out)
+        out &= (dm != min_dmt) & (dm != max_dmt)
+
+    return rule
+
+
+@lru_cache(maxsize=16)
+def _compile(spec_json):
+    return CandidateFilter.from_spec(json.loads(spec_json))
+
+
+def get_filter(spec):
+    """Compiled filter for spec, reused across gulps with the same spec."""
+    return _compile(json.dumps(spec, sort_keys=True, default=float))
+
+
+# filter keys whose cuts depend on the whole cluster (its counts), or are
+# arbitrary, so that pruning rows before clustering can change the result;
+# "classify" is set by socket_grex.prefilter_candidates when a classifier
+# scores peaks on cluster features
+CLUSTER_KEYS = ["min_cntc", "max_cntc", "min_cntb", "max_cntb", "rules", "classify"]
+
+
+def prefilter_conflicts(spec):
+    """Keys of spec that rule out prefiltering (see CLUSTER_KEYS)."""
+    return [key for key in CLUSTER_KEYS if spec.get(key)]
+
+
+@lru_cache(maxsize=None)
+def _warn_prefilter_off(keys):
+    logging.warning(f"Prefilter disabled: the filter sets {list(keys)}")
+
+
+def prefilter(
+    tab,
+    spec,
+    selectcols=("itime", "idm", "ibox", "ibeam"),
+    snr_margin=2.0,
+    dm_margin=10.0,
+    ibox_margin=0,
+    guard=50.0,
+):
+    """Rows of tab that can still matter after clustering and filtering.
+
+    Seeds are rows that could pass the min_snr/target_params, min_dm and
+    max_ibox cuts of spec, loosened by the margins. A row is kept if it is
+    a seed or lies within guard (euclidean, in the selectcols space used
+    for clustering) of a seed. This is a heuristic: rows farther than
+    guard rarely join a cluster with a seed, but hdbscan gives no such
+    bound, so guard should be well above cluster_selection_epsilon.
+    Pruning changes cluster counts, so every row is kept (with a warning)
+    if spec has cuts on them or custom rules (see prefilter_conflicts).
+    Returns the indices of the kept rows.
+    """
+
+    conflicts = prefilter_conflicts(spec)
+    if conflicts:
+        _warn_prefilter_off(tuple(conflicts))
+        return np.arange(len(tab))
+
+    from scipy.spatial import cKDTree
+
+    seed = np.ones(len(tab), dtype=bool)
+    min_snr = spec.get("min_snr")
+    if min_snr is not None:
+        if spec.get("target_params") is not None:
+            min_snr = min(min_snr, spec["target_params"][2])
+        seed &= np.asarray(tab["snr"]) > min_snr - snr_margin
+    if spec.get("min_dm") is not None:
+        seed &= np.asarray(tab["dm"]) > spec["min_dm"] - dm_margin
+    if spec.get("max_ibox") is not None:
+        seed &= np.asarray(tab["ibox"]) < spec["max_ibox"] + ibox_margin
+
+    iseed = np.flatnonzero(seed)
+    if len(iseed) == 0 or len(iseed) == len(tab):
+        return iseed
+
+    data = np.column_stack([aligned(tab, col).astype(float) for col in selectcols])
+    rest = np.flatnonzero(~seed)
+    dist, _ = cKDTree(data[iseed]).query(data[rest], distance_upper_bound=guard)
+    return np.sort(np.concatenate([iseed, rest[np.isfinite(dist)]]))
@@ -0,0 +1,126 @@
+import logging
+from grex_t2 import metrics, wire
+
+# end-of-gulp marker sent by heimdall as a datagram of its own
+END_OF_GULP = b"\x03"
+# flush a gulp at this many bytes, so a lost marker cannot grow it forever
+MAX_BYTES = 16 * 1024**2
+# flush a gulp when no packet has arrived for this many seconds
+IDLE_TIMEOUT = 2.0
+# flush a gulp when a candidate's itime is this far from the gulp's first
+# candidate, as happens when the marker between two gulps was lost
+MAX_SPAN = 65536
+
+
+class GulpFramer:
+    """Assembles heimdall packets into gulps.
+
+    A gulp normally ends at the END_OF_GULP marker. It is also ended
+    ("flushed") early, with a warning, when adding a packet would take it
+    past max_bytes, when a packet's itime is more than max_span samples
+    from the gulp's first (a lost marker), or by poll() once no packet
+    has arrived for idle_timeout seconds (heimdall stalled mid-gulp).
+    Memory held is at most max_bytes plus one packet. None disables a
+    limit.
+
+    Packets may be heimdall text lines or binary packets (see wire); a
+    gulp switching between the two is ended with reason "format", and
+    binary packets with a bad header are dropped.
+
+    feed() and poll() return the completed gulps as (payload, npackets,
+    reason) tuples, reason being "marker", "size", "span", "idle" or
+    "format". The payload is the candidate text, or for binary packets
+    the bytes of the concatenated records (wire.decode_records).
+    """
+
+    def __init__(
+        self, max_bytes=MAX_BYTES, idle_timeout=IDLE_TIMEOUT, max_span=MAX_SPAN
+    ):
+        self.max_bytes = max_bytes
+        self.idle_timeout = idle_timeout
+        self.max_span = max_span
+        self._chunks = []
+        self._nbytes = 0
+        self._itime0 = None
+        self._last = None
+        self._binary = False
+
+    def __len__(self):
+        """Number of packets in the current gulp."""
+        return len(self._chunks)
+
+    def feed(self, data, now):
+        """Add one datagram received at time now (seconds)."""
+
+        self._last = now
+        if data == END_OF_GULP:
+            return self._flush("marker")
+
+        done = []
+        binary = wire.is_binary(data)
+        if binary:
+            try:
+                itime = wire.first_itime(data)
+                data = wire.packet_records(data)
+            except ValueError as exc:
+                logging.warning(f"Dropping candidate packet: {exc}")
+                metrics.inc("packets_invalid")
+                return done
+        else:
+            itime = _itime(data)
+        if self._chunks and binary != self._binary:
+            done += self._flush("format")
+        self._binary = binary
+
+        if self.max_bytes is not None and self._nbytes + len(data) > self.max_bytes:
+            done += self._flush("size")
+        if self.max_span is not None and itime is not None:
+            if self._itime0 is None:
+                self._itime0 = itime
+            elif abs(itime - self._itime0) > self.max_span:
+                done += self._flush("span")
+                self._itime0 = itime
+
+        self._chunks.append(data)
+        self._nbytes += len(data)
+        return done
+
+    def poll(self, now):
+        """Flush the current gulp if it has been idle for idle_timeout."""
+
+        if (
+            self.idle_timeout is not None
+            and self._chunks
+            and now - self._last > self.idle_timeout
+        ):
+            return self._flush("idle")
+        return []
+
+    def _flush(self, reason):
+        chunks, self._chunks = self._chunks, []
+        nbytes, self._nbytes = self._nbytes, 0
+        self._itime0 = None
+        if not chunks and reason != "marker":
+            return []
+        metrics.inc(f"gulps_{reason}")
+        if reason != "marker":
+            logging.warning(
+                f"Ending gulp of {len(chunks)} packets ({nbytes} bytes) "
+                f"without end marker: {reason}"
+            )
+        payload = b"".join(chunks)
+        if not self._binary:
+            payload = payload.decode("utf-8", errors="replace")
+        return [(payload, len(chunks), reason)]
+
+
+def _itime(data):
+    """itime (third field) of the first candidate line in data, or None."""
+
+    fields = data.split(maxsplit=3)
+    if len(fields) < 3:
+        return None
+    try:
+        return int(float(fields[2]))
+    except ValueError:
+        return None
@@ -0,0 +1,226 @@
+import logging
+import time
+from functools import lru_cache
+import numpy as np
+from grex_t2 import metrics, triggering
+
+# site longitude (degrees east, OVRO), for the hour angle of a source
+LONGITUDE = -118.2834
+# beams from the beam a source is expected in within which a peak matches
+BEAM_TOL = 4
+# known_source value of peaks not matching a known source, as "trigger"
+NO_SOURCE = "0"
+# fields of a catalog line after "ra dec minsnr" (see read_known_sources)
+FIELDS = [
+    "name",
+    "dm",
+    "dm_tol",
+    "period_s",
+    "pdot",
+    "epoch_mjd",
+    "phase_tol",
+    "valid_from",
+    "valid_to",
+]
+
+
+class KnownSourceIndex:
+    """Known periodic sources (e.g. bright pulsars), indexed by DM window.
+
+    The DM windows [dm - dm_tol, dm + dm_tol) are cut at all their edges
+    into segments, and the sources covering each segment are stored once,
+    so finding the sources consistent with a DM is a binary search over
+    the segment edges. A peak matches a source if its DM is in the
+    source's window, its arrival time is within the ephemeris validity
+    range [valid_from, valid_to] and within phase_tol (in rotations) of a
+    pulse predicted from epoch, period and pdot, and its beam is within
+    beam_tol of the beam the source is in at that time (see
+    expected_beam). ra and dec are in degrees.
+    """
+
+    def __init__(
+        self,
+        names,
+        ra,
+        dec,
+        dm,
+        dm_tol,
+        period,
+        pdot,
+        epoch,
+        phase_tol,
+        valid_from,
+        valid_to,
+    ):
+        self.names = list(names)
+        self.ra = np.asarray(ra, dtype=float)
+        self.dec = np.asarray(dec, dtype=float)
+        self.period = np.asarray(period, dtype=float)
+        self.pdot = np.asarray(pdot, dtype=float)
+        self.epoch = np.asarray(epoch, dtype=float)
+        self.phase_tol = np.asarray(phase_tol, dtype=float)
+        self.valid_from = np.asarray(valid_from, dtype=float)
+        self.valid_to = np.asarray(valid_to, dtype=float)
+
+        dm = np.asarray(dm, dtype=float)
+        dm_tol = np.asarray(dm_tol, dtype=float)
+        lo, hi = dm - dm_tol, dm + dm_tol
+        self.edges = np.unique(np.r_[lo, hi])
+        # source i covers segments first[i] .. last[i] - 1
+        first = np.searchsorted(self.edges, lo)
+        last = np.searchsorted(self.edges, hi)
+        nseg = max(len(self.edges) - 1, 0)
+        members = [[] for _ in range(nseg)]
+        for isrc in range(len(dm)):
+            for iseg in range(first[isrc], last[isrc]):
+                members[iseg].append(isrc)
+        self.counts = np.array([len(m) for m in members], dtype=int)
+        self.offsets = np.r_[0, np.cumsum(self.counts)].astype(int)
+        self.members = np.array([i for m in members for i in m], dtype=int)
+
+    def __len__(self):
+        return len(self.names)
+
+    def match(
+        self, dm, mjd, ibeam, longitude=LONGITUDE, pointing_dec=None, beam_tol=BEAM_TOL
+    ):
+        """Index of the first known source matching each (dm, mjd, ibeam)
+        peak, or -1. Sources more than half the primary beam from
+        pointing_dec (degrees, None to skip the test) never match.
+        """
+
+        dm = np.asarray(dm, dtype=float)
+        mjd = np.asarray(mjd, dtype=float)
+        ibeam = np.asarray(ibeam, dtype=float)
+        found = np.full(len(dm), -1, dtype=int)
+        if not len(self.counts) or not len(dm):
+            return found
+
+        # windows are half-open, [dm - dm_tol, dm + dm_tol)
+        seg = np.searchsorted(self.edges, dm, side="right") - 1
+        inside = (seg >= 0) & (seg < len(self.counts))
+        seg = np.where(inside, seg, 0)
+        count = np.where(inside, self.counts[seg], 0)
+
+        for j in range(count.max(initial=0)):
+            todo = (count > j) & (found == -1)
+            if not todo.any():
+                break
+            src = self.members[self.offsets[seg[todo]] + j]
+            ok = self._in_phase(src, mjd[todo])
+            beam = expected_beam(self.ra[src], self.dec[src], mjd[todo], longitude)
+            ok &= np.abs(ibeam[todo] - beam) <= beam_tol
+            if pointing_dec is not None:
+                ok &= np.abs(self.dec[src] - pointing_dec) <= primary_beam() / 2
+            found[np.flatnonzero(todo)[ok]] = src[ok]
+        return found
+
+    def _in_phase(self, src, mjd):
+        period = self.period[src]
+        dt = (mjd - self.epoch[src]) * 86400.0
+        # rotations since epoch, with f = 1 / P and fdot = -Pdot / P**2
+        phase = np.mod(dt / period - 0.5 * self.pdot[src] * dt**2 / period**2, 1.0)
+        offset = np.minimum(phase, 1.0 - phase)
+        valid = (mjd >= self.valid_from[src]) & (mjd <= self.valid_to[src])
+        return valid & (offset <= self.phase_tol[src])
+
+
+def primary_beam():
+    """Primary beam width (degrees) of the dishes (see triggering)."""
+    return np.degrees(triggering.lamb / triggering.Ddish)
+
+
+def expected_beam(ra, dec, mjd, longitude=LONGITUDE):
+    """Fractional beam number a source at ra, dec (degrees) is in at mjd,
+    with the beams of triggering (nbeam beams of beam_separation
+    arcminutes across hour angle, beam 0 east) centred on HA_pointing.
+    Outside the beams the result is below 0 or above nbeam - 1.
+    """
+
+    gmst = 280.46061837 + 360.98564736629 * (np.asarray(mjd) - 51544.5)
+    ha = np.mod(gmst + longitude - ra - triggering.HA_pointing + 180.0, 360.0) - 180.0
+    theta = ha * 60.0 * np.cos(np.radians(dec))
+    return (theta - triggering.theta_min) / triggering.beam_separation
+
+
+def _sexagesimal(value):
+    """Degrees (or hours) of a [+-]dd:mm:ss.s string."""
+
+    sign = -1.0 if value.startswith("-") else 1.0
+    d, m, s = (abs(float(part)) for part in value.split(":"))
+    return sign * (d + m / 60.0 + s / 3600.0)
+
+
+def read_known_sources(path):
+    """Read the known sources of a source catalog (e.g. data/catalog.txt):
+    lines of "ra dec minsnr" (see triggering.parse_catalog) followed, for
+    known periodic sources, by the FIELDS "name dm dm_tol period_s pdot
+    epoch_mjd phase_tol valid_from valid_to" (# starts a comment). Lines
+    with a "-" in any field after the name have no usable ephemeris and
+    are skipped with a warning, rather than matched on DM alone.
+    """
+
+    rows = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            fields = line.split()
+            if len(fields) == 3:
+                continue
+            if len(fields) != 3 + len(FIELDS):
+                raise ValueError(f"Bad source catalog line in {path}: {line}")
+            ra, dec, _, name, *values = fields
+            if "-" in values:
+                logging.warning(f"Skipping known source {name}: incomplete ephemeris")
+                continue
+            rows.append(
+                [name, 15.0 * _sexagesimal(ra), _sexagesimal(dec)]
+                + [float(v) for v in values]
+            )
+    names = [row[0] for row in rows]
+    values = np.array([row[1:] for row in rows], dtype=float).reshape(-1, 10)
+    logging.info(f"Read {len(names)} known sources from {path}")
+    return KnownSourceIndex(names, *values.T)
+
+
+@lru_cache(maxsize=4)
+def get_index(path):
+    """KnownSourceIndex for the file at path, read once."""
+    return read_known_sources(path)
+
+
+def tag_known(tab, index, longitude=LONGITUDE, pointing_dec=None, beam_tol=BEAM_TOL):
+    """Write the name of the known source matching each cluster peak of
+    tab (with mjds in MJD), or NO_SOURCE, to its known_source column,
+    recording the lookup latency.
+    """
+
+    t0 = time.perf_counter()
+    known = index.match(
+        tab["dm"], tab["mjds"], tab["ibeam"], longitude, pointing_dec, beam_tol
+    )
+    metrics.observe("known_source_lookup_s", time.perf_counter() - t0)
+    names = np.array([NO_SOURCE] + index.names, dtype="U16")
+    tab["known_source"] = names[known + 1]
+
+
+def reject_known(tab):
+    """Split cluster peaks tab, tagged by tag_known, into those not
+    matching a known source and the matches, logging the matched source
+    names and recording rejection counts.
+    """
+
+    known = np.asarray(tab["known_source"])
+    matched = known != NO_SOURCE
+    if matched.any():
+        sources, counts = np.unique(known[matched], return_counts=True)
+        for source, count in zip(sources, counts):
+            metrics.inc(f"known_source_rejected.{source}", int(count))
+        metrics.inc("known_source_rejected", int(matched.sum()))
+        logging.info(
+            "Suppressed known-source peaks: "
+            + ", ".join(f"{source} x{count}" for source, count in zip(sources, counts))
+        )
+    return tab[~matched], tab[matched]
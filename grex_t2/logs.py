@@ -0,0 +1,144 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import time
+
+LOG_FORMAT = "[%(asctime)s] [%(levelname)s] %(message)s"
+# rotate the log file at this size, keeping BACKUP_COUNT old files
+MAX_BYTES = 100 * 1024**2
+BACKUP_COUNT = 10
+
+# listener thread started by setup_logging
+_listener = None
+
+# id of the gulp being processed in the current thread, added to records
+_gulp_id = contextvars.ContextVar("gulp_id", default=None)
+
+
+def set_gulp(gulp_id):
+    """Tag log records from this thread with gulp_id (None to clear)."""
+    _gulp_id.set(gulp_id)
+
+
+def current_gulp():
+    """Gulp id set with set_gulp in this thread, or None."""
+    return _gulp_id.get()
+
+
+class GulpFilter(logging.Filter):
+    """Adds the current gulp id to every record as record.gulp."""
+
+    def filter(self, record):
+        if not hasattr(record, "gulp"):
+            record.gulp = _gulp_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record with time, level, message, gulp and,
+    if passed with extra=, stages (a dict of stage timings in seconds).
+    """
+
+    def format(self, record):
+        entry = {
+            "time": record.created,
+            "level": record.levelname,
+            "message": record.getMessage(),
+            "gulp": getattr(record, "gulp", None),
+        }
+        stages = getattr(record, "stages", None)
+        if stages is not None:
+            entry["stages"] = stages
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class StageTimer:
+    """Collects the time spent in consecutive stages of a gulp into
+    stages (name -> seconds); mark(name) ends the stage called name, and
+    calls on_mark(name) if given.
+    """
+
+    def __init__(self, stages=None, on_mark=None):
+        self.stages = {} if stages is None else stages
+        self.on_mark = on_mark
+        self._t = time.perf_counter()
+
+    def mark(self, name):
+        t = time.perf_counter()
+        self.stages[name] = self.stages.get(name, 0.0) + t - self._t
+        if self.on_mark is not None:
+            self.on_mark(name)
+        self._t = time.perf_counter()
+
+
+def setup_logging(
+    logfile="output.log",
+    level=logging.INFO,
+    json_format=False,
+    max_bytes=MAX_BYTES,
+    backup_count=BACKUP_COUNT,
+    when=None,
+    stream=True,
+):
+    """Log through a queue so that the calling threads never wait on disk.
+
+    The root logger gets a QueueHandler, and a listener thread passes the
+    records to a rotating file handler (rotated at max_bytes, or every
+    `when` interval, e.g. "midnight", if set) and optionally stderr.
+    With json_format the file gets JsonFormatter records. Records carry
+    the gulp id set with set_gulp. The listener is stopped (flushing queued
+    records) by stop_logging, which runs at exit.
+    """
+
+    global _listener
+    stop_logging()
+
+    if when is not None:
+        file_handler = logging.handlers.TimedRotatingFileHandler(
+            logfile, when=when, backupCount=backup_count
+        )
+    else:
+        file_handler = logging.handlers.RotatingFileHandler(
+            logfile, maxBytes=max_bytes, backupCount=backup_count
+        )
+    file_handler.setFormatter(
+        JsonFormatter() if json_format else logging.Formatter(LOG_FORMAT)
+    )
+    handlers = [file_handler]
+    if stream:
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        handlers.append(stream_handler)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(GulpFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Write out queued records and stop the setup_logging listener."""
+
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
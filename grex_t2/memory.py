@@ -0,0 +1,174 @@
+import logging
+import os
+import resource
+import tracemalloc
+from collections import deque
+import numpy as np
+from grex_t2 import metrics
+
+# gulps of RSS history used for leak detection
+WINDOW = 100
+# RSS growth per gulp, sustained over WINDOW gulps, reported as a leak
+LEAK_BYTES_PER_GULP = 64 * 1024
+# with tracing, log the top allocation sites every TOP_EVERY gulps
+TOP_EVERY = 100
+TOP_N = 10
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_bytes():
+    """Current resident set size of this process, in bytes (the peak RSS
+    where /proc is not available).
+    """
+
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def reset_peak():
+    """Reset the tracemalloc peak. tracemalloc.reset_peak is new in
+    Python 3.9; before that the peak is never reset, so mem_peak.<stage>
+    is the peak since tracing started.
+    """
+
+    if hasattr(tracemalloc, "reset_peak"):
+        tracemalloc.reset_peak()
+
+
+def growth(rss):
+    """Least-squares slope (bytes per gulp) of the RSS series rss, and
+    whether it grew throughout: every value in its last quarter above
+    every value in its first.
+    """
+
+    rss = np.asarray(rss, dtype=float)
+    if len(rss) < 4:
+        return 0.0, False
+    slope = np.polyfit(np.arange(len(rss)), rss, 1)[0]
+    quarter = len(rss) // 4
+    return float(slope), bool(rss[-quarter:].min() > rss[:quarter].max())
+
+
+class MemoryTracker:
+    """Per-gulp memory accounting and leak detection.
+
+    For each gulp the RSS after every stage (mark, called by
+    logs.StageTimer) is recorded as the rss_delta.<stage> metric, and the
+    RSS after the gulp as the rss_bytes gauge. With trace, tracemalloc
+    also records the peak Python allocation of each stage
+    (mem_peak.<stage>), and every top_every gulps the top_n allocation
+    sites that grew since the last look are logged. Tracing slows
+    processing down severalfold, so it is for debugging only.
+
+    Once window gulps have been seen, an RSS that grew throughout the
+    window by more than leak_bytes_per_gulp per gulp sets the
+    memory_leak_suspected gauge and logs a warning.
+    """
+
+    def __init__(
+        self,
+        trace=False,
+        window=WINDOW,
+        leak_bytes_per_gulp=LEAK_BYTES_PER_GULP,
+        top_every=TOP_EVERY,
+        top_n=TOP_N,
+    ):
+        self.trace = trace
+        self.window = window
+        self.leak_bytes_per_gulp = leak_bytes_per_gulp
+        self.top_every = top_every
+        self.top_n = top_n
+        self.rss = deque(maxlen=window)
+        self.stages = {}
+        self.leak = False
+        self.top = []
+        self._ngulp = 0
+        self._rss = None
+        self._snapshot = None
+        self._started_tracing = False
+        if trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def start_gulp(self):
+        """Start accounting for a gulp."""
+
+        self.stages = {}
+        self._rss = rss_bytes()
+        if self.trace:
+            reset_peak()
+
+    def mark(self, stage):
+        """End the stage called stage of the current gulp."""
+
+        if self._rss is None:
+            return
+        rss = rss_bytes()
+        entry = {"rss_delta": rss - self._rss}
+        self._rss = rss
+        metrics.observe(f"rss_delta.{stage}", entry["rss_delta"])
+        if self.trace:
+            entry["peak"] = tracemalloc.get_traced_memory()[1]
+            reset_peak()
+            metrics.observe(f"mem_peak.{stage}", entry["peak"])
+        self.stages[stage] = entry
+
+    def end_gulp(self):
+        """Finish the current gulp, checking for leaks. Returns its RSS."""
+
+        rss = rss_bytes()
+        self._rss = None
+        self._ngulp += 1
+        self.rss.append(rss)
+        metrics.set_gauge("rss_bytes", rss)
+
+        if len(self.rss) == self.window:
+            slope, grew = growth(self.rss)
+            metrics.set_gauge("rss_slope_bytes_per_gulp", slope)
+            leak = grew and slope > self.leak_bytes_per_gulp
+            if leak and not self.leak:
+                metrics.inc("memory_leak_warnings")
+                logging.warning(
+                    f"Memory grew by {slope / 1024:.1f} KiB per gulp over the "
+                    f"last {self.window} gulps, to {rss / 1024**2:.1f} MiB RSS"
+                )
+            self.leak = leak
+            metrics.set_gauge("memory_leak_suspected", int(leak))
+
+        if self.trace and self.top_every and self._ngulp % self.top_every == 0:
+            self.log_top()
+        return rss
+
+    def log_top(self):
+        """Log the top_n allocation sites by growth since the last call."""
+
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+        if self._snapshot is None:
+            stats = snapshot.statistics("lineno")
+        else:
+            stats = snapshot.compare_to(self._snapshot, "lineno")
+        self._snapshot = snapshot
+        self.top = [
+            (str(stat.traceback), stat.size, getattr(stat, "size_diff", stat.size))
+            for stat in stats[: self.top_n]
+        ]
+        logging.info(
+            "Top allocation sites (size, growth): "
+            + "; ".join(
+                f"{site} {size / 1024:.0f} KiB {diff / 1024:+.0f} KiB"
+                for site, size, diff in self.top
+            )
+        )
+
+    def close(self):
+        """Stop tracemalloc if this tracker started it."""
+
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
@@ -0,0 +1,196 @@
+import logging
+import queue
+import time
+import numpy as np
+from grex_t2 import cluster_heimdall, metrics, wire
+from grex_t2.candidates import CandidateBatch, col_aligned
+
+# itime samples per gulp; gulps of different streams in the same window
+# of GULP_SAMPLES samples are merged
+GULP_SAMPLES = 16384
+# seconds per itime sample, to convert between candidate times and itime
+TSAMP = 1.048e-3
+# seconds to wait for the other streams after a stream's gulp arrives
+MAX_WAIT = 1.0
+# gulp windows held while waiting; the oldest is merged when exceeded
+MAX_PENDING = 8
+
+
+def parse_payload(payload):
+    """CandidateBatch from a gulp payload (text or binary records)."""
+
+    if isinstance(payload, bytes):
+        return CandidateBatch.from_records(wire.decode_records(payload))
+    return CandidateBatch.from_text(payload)
+
+
+class StreamMerger:
+    """Bounded reorder buffer merging the gulps of nstream streams (e.g.
+    heimdall processes each searching part of the beams).
+
+    Streams may come from heimdall runs started at different times:
+    start_times holds the start time of each stream, as an MJD, the URL
+    of its start time service (cluster_heimdall.get_stream_start_time) or
+    None for the T2 start time (cluster_heimdall.get_start_time). The
+    candidate times (mjds, in seconds since the start) of each stream are
+    shifted to count from the T2 start time before merging. itime stays
+    the stream's own sample number, as triggers and voltage dumps need,
+    and the sample number counted from the T2 start time (tsamp seconds
+    per sample) is added as candidates.col_aligned, which clustering uses
+    instead. Without start_times all streams share the T2 start time.
+
+    A gulp is filed under the window of gulp_samples samples holding the
+    time of its median candidate. A window is merged, as one
+    CandidateBatch with a "stream" column, once every stream has sent a gulp for it, max_wait seconds
+    after its first gulp arrived, or when more than max_pending windows
+    are waiting. Windows are always merged in time order. An empty gulp
+    counts towards the oldest window its stream has not sent yet. A gulp
+    arriving for a window already merged is passed on by itself.
+
+    add() and poll() return the merged gulps as (batch, npackets, time of
+    the last gulp) tuples.
+    """
+
+    def __init__(
+        self,
+        nstream,
+        gulp_samples=GULP_SAMPLES,
+        max_wait=MAX_WAIT,
+        max_pending=MAX_PENDING,
+        start_times=None,
+        tsamp=TSAMP,
+    ):
+        if start_times is not None and len(start_times) != nstream:
+            raise ValueError(f"{len(start_times)} start times for {nstream} streams")
+        self.nstream = nstream
+        self.start_times = start_times
+        self.tsamp = tsamp
+        self.gulp_samples = gulp_samples
+        self.max_wait = max_wait
+        self.max_pending = max_pending
+        # window -> {"first": time, "last": time, "parts": {stream: (batch, npackets)}}
+        self._pending = {}
+        self._done = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def offset(self, stream):
+        """Seconds from the T2 start time to the start time of stream."""
+
+        start = None if self.start_times is None else self.start_times[stream]
+        if start is None:
+            return 0.0
+        if isinstance(start, str):
+            start = cluster_heimdall.get_stream_start_time(start)
+        return (start - cluster_heimdall.get_start_time()) * 86400.0
+
+    def add(self, stream, payload, npackets, now):
+        """File a gulp of stream received at time now (seconds)."""
+
+        batch = parse_payload(payload)
+        if self.start_times is not None:
+            offset = self.offset(stream) if len(batch) else 0.0
+            batch["mjds"] = batch["mjds"] + offset
+            batch[col_aligned] = batch["itime"] + int(round(offset / self.tsamp))
+        if len(batch):
+            # the time in samples, rounded so that float error in mjds does
+            # not move a gulp across a window edge
+            sample = np.rint(np.median(batch["mjds"]) / self.tsamp)
+            window = int(sample) // self.gulp_samples
+        else:
+            waiting = [
+                w for w, e in sorted(self._pending.items()) if stream not in e["parts"]
+            ]
+            if not waiting:
+                return self.poll(now)
+            window = waiting[0]
+
+        if self._done is not None and window <= self._done:
+            logging.warning(
+                f"Gulp from stream {stream} for window {window} arrived after "
+                "it was merged"
+            )
+            metrics.inc("merge_late")
+            return [self._merge({stream: (batch, npackets)}, now)]
+
+        entry = self._pending.setdefault(window, {"first": now, "parts": {}})
+        entry["last"] = now
+        if stream in entry["parts"]:
+            # a second gulp of one stream in a window: keep both
+            old, nold = entry["parts"][stream]
+            batch = CandidateBatch.concatenate([old, batch])
+            npackets += nold
+        entry["parts"][stream] = (batch, npackets)
+        return self.poll(now)
+
+    def poll(self, now):
+        """Merge the windows that are complete, timed out or over the limit."""
+
+        merged = []
+        while self._pending:
+            window = min(self._pending)
+            entry = self._pending[window]
+            if len(entry["parts"]) >= self.nstream:
+                reason = None
+            elif len(self._pending) > self.max_pending:
+                reason = "full"
+            elif now - entry["first"] > self.max_wait:
+                reason = "timeout"
+            else:
+                break
+
+            del self._pending[window]
+            self._done = window
+            if reason is not None:
+                metrics.inc(f"merge_{reason}")
+                logging.warning(
+                    f"Merging window {window} with {len(entry['parts'])} of "
+                    f"{self.nstream} streams ({reason})"
+                )
+            merged.append(self._merge(entry["parts"], entry["last"]))
+        metrics.set_gauge("merge_pending", len(self._pending))
+        return merged
+
+    def _merge(self, parts, t_last):
+        batches = []
+        npackets = 0
+        for stream, (batch, n) in sorted(parts.items()):
+            batch["stream"] = np.full(len(batch), stream, dtype=int)
+            batches.append(batch)
+            npackets += n
+        return CandidateBatch.concatenate(batches), npackets, t_last
+
+
+def merge_streams(streams, gulps, merger):
+    """Move gulps from the streams queue, holding (stream, payload,
+    npackets, time) items from socket_grex.receive_gulps, through merger
+    onto the gulps queue, forever.
+    """
+
+    while True:
+        try:
+            stream, payload, npackets, t_end = streams.get(
+                timeout=min(merger.max_wait, 0.1)
+            )
+        except queue.Empty:
+            done = merger.poll(time.perf_counter())
+        else:
+            done = merger.add(stream, payload, npackets, t_end)
+        for item in done:
+            gulps.put(item)
+
+
+def stream_counts(cl, stream):
+    """Number of distinct streams in the cluster of each row (1 for
+    unclustered rows).
+    """
+
+    cl = np.asarray(cl)
+    stream = np.asarray(stream)
+    clustered = cl != -1
+    pairs = np.unique(np.column_stack([cl[clustered], stream[clustered]]), axis=0)
+    labels, counts = np.unique(pairs[:, 0], return_counts=True)
+    nstream = np.ones(len(cl), dtype=int)
+    nstream[clustered] = counts[np.searchsorted(labels, cl[clustered])]
+    return nstream
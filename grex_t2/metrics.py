@@ -0,0 +1,142 @@
+import logging
+import threading
+import time
+from collections import deque
+import numpy as np
+
+# number of recent observations kept per summary for quantiles
+SUMMARY_WINDOW = 1000
+
+
+class Registry:
+    """Thread-safe store of counters, gauges and summaries.
+
+    Counters only go up, gauges hold the last value set and summaries keep
+    count/sum/min/max of observed values plus a window of recent values
+    for quantiles.
+    """
+
+    def __init__(self, window=SUMMARY_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.summaries = {}
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name, value):
+        with self._lock:
+            summary = self.summaries.get(name)
+            if summary is None:
+                summary = self.summaries[name] = {
+                    "count": 0,
+                    "sum": 0.0,
+                    "min": np.inf,
+                    "max": -np.inf,
+                    "recent": deque(maxlen=self.window),
+                }
+            summary["count"] += 1
+            summary["sum"] += value
+            summary["min"] = min(summary["min"], value)
+            summary["max"] = max(summary["max"], value)
+            summary["recent"].append(value)
+
+    def snapshot(self):
+        """Plain-dict copy of all metrics, with summary quantiles."""
+
+        with self._lock:
+            summaries = {}
+            for name, summary in self.summaries.items():
+                recent = np.fromiter(summary["recent"], dtype=float)
+                p50, p90, p99 = np.quantile(recent, [0.5, 0.9, 0.99])
+                summaries[name] = {
+                    "count": summary["count"],
+                    "mean": summary["sum"] / summary["count"],
+                    "min": summary["min"],
+                    "max": summary["max"],
+                    "last": summary["recent"][-1],
+                    "p50": p50,
+                    "p90": p90,
+                    "p99": p99,
+                }
+            return {
+                "time": time.time(),
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "summaries": summaries,
+            }
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.summaries.clear()
+
+    def drain(self):
+        """Counters, gauges and recent observations recorded since the last
+        drain, clearing them (e.g. to pass a worker process's metrics on
+        to absorb in the parent).
+        """
+
+        with self._lock:
+            drained = {
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "observations": {
+                    name: list(summary["recent"])
+                    for name, summary in self.summaries.items()
+                },
+            }
+            self.counters.clear()
+            self.gauges.clear()
+            self.summaries.clear()
+        return drained
+
+    def absorb(self, drained):
+        """Record the metrics of another registry's drain()."""
+
+        for name, value in drained["counters"].items():
+            self.inc(name, value)
+        for name, value in drained["gauges"].items():
+            self.set_gauge(name, value)
+        for name, values in drained["observations"].items():
+            for value in values:
+                self.observe(name, value)
+
+
+# process-wide registry used by the module-level helpers
+registry = Registry()
+
+
+def inc(name, value=1):
+    registry.inc(name, value)
+
+
+def set_gauge(name, value):
+    registry.set_gauge(name, value)
+
+
+def observe(name, value):
+    registry.observe(name, value)
+
+
+def snapshot():
+    return registry.snapshot()
+
+
+def log_summary(names=None):
+    """Log count, mean and p90 of the summaries in names (default all)."""
+
+    for name, summary in snapshot()["summaries"].items():
+        if names is None or name in names:
+            logging.info(
+                f"{name}: n={summary['count']} mean={summary['mean']:.4g} "
+                f"p90={summary['p90']:.4g} max={summary['max']:.4g}"
+            )
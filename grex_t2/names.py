@@ -3,10 +3,22 @@ import os
 import string
 import datetime
 import glob
-from astropy import time
+import time
+
+# MJD 0 as a naive UTC datetime, and the MJD of the unix epoch
+MJD_EPOCH = datetime.datetime(1858, 11, 17)
+MJD_UNIX_EPOCH = 40587.0
 
 
 def get_lastname_grex(outroot):
+    """Last candidate name in outroot: the highest in its event log if it
+    has one (see eventlog), else that of the newest JSON file.
+    """
+
+    from grex_t2 import eventlog
+
+    if eventlog.days(outroot):
+        return eventlog.last_name(outroot)
     files = glob.glob(outroot + "/*.json")
 
     if len(files):
@@ -17,10 +29,20 @@ def get_lastname_grex(outroot):
         return None
 
 
+def mjd_to_datetime(mjd):
+    """Convert a UTC MJD to a naive datetime (leap seconds are ignored)."""
+    return MJD_EPOCH + datetime.timedelta(days=float(mjd))
+
+
+def mjd_now():
+    """Current UTC time as an MJD."""
+    return time.time() / 86400.0 + MJD_UNIX_EPOCH
+
+
 def increment_name(mjd, lastname=None, suffixlength=4):
     """Use mjd to create unique name for event."""
 
-    dt = time.Time(mjd, format="mjd", scale="utc").to_datetime()
+    dt = mjd_to_datetime(mjd)
     if lastname is None:  # generate new name for this yymmdd
         suffix = string.ascii_lowercase[0] * suffixlength
     else:
@@ -0,0 +1,328 @@
+import logging
+import multiprocessing
+import queue
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from grex_t2 import classify, logs, metrics, socket_grex
+from grex_t2.candidates import CandidateBatch
+
+# seconds to wait for a new gulp while earlier ones are still clustering
+POLL_INTERVAL = 0.01
+
+# state of a worker process, set by _init_worker
+_worker = {"config": None, "records": []}
+
+
+def to_shared(columns):
+    """Copy a mapping of arrays into one new shared memory block.
+    Returns the block and the layout to pass to from_shared with its name.
+    """
+
+    layout = []
+    size = 0
+    for name, col in columns.items():
+        col = np.asarray(col)
+        layout.append((name, col.dtype.str, col.shape, size))
+        # keep every array 8-byte aligned
+        size += -(-col.nbytes // 8) * 8
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    for (name, dtype, shape, offset), col in zip(layout, columns.values()):
+        np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=offset)[...] = col
+    return block, layout
+
+
+def from_shared(name, layout, unlink=False):
+    """Copy the arrays of the shared memory block name out of it, and
+    unlink (free) the block if unlink.
+    """
+
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        columns = {
+            col: np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=offset).copy()
+            for col, dtype, shape, offset in layout
+        }
+    finally:
+        block.close()
+        if unlink:
+            block.unlink()
+    return columns
+
+
+def payload_columns(candsfile):
+    """A gulp payload (text, binary records or CandidateBatch) as
+    (kind, arrays) for to_shared.
+    """
+
+    if isinstance(candsfile, CandidateBatch):
+        return "batch", {name: candsfile[name] for name in candsfile.colnames}
+    if isinstance(candsfile, bytes):
+        return "records", {"data": np.frombuffer(candsfile, dtype=np.uint8)}
+    return "text", {"data": np.frombuffer(candsfile.encode(), dtype=np.uint8)}
+
+
+def payload_from_columns(kind, columns):
+    """Inverse of payload_columns."""
+
+    if kind == "batch":
+        return CandidateBatch.from_columns(columns)
+    if kind == "records":
+        return columns["data"].tobytes()
+    return columns["data"].tobytes().decode()
+
+
+class _RecordHandler(logging.Handler):
+    def emit(self, record):
+        _worker["records"].append((record.levelno, record.getMessage()))
+
+
+def _init_worker(config, level):
+    _worker["config"] = config
+    root = logging.getLogger()
+    root.handlers[:] = [_RecordHandler()]
+    root.setLevel(level)
+    # pay for the hdbscan import and classifier model before the first gulp
+    import hdbscan  # noqa: F401
+
+    classify.get_classifier(config["classify"])
+
+
+def _cluster_job(kind, name, layout, shed_level, beam_mask):
+    """Run cluster_gulp on the payload in shared memory block name, in a
+    worker process. The peaks are returned in a new shared memory block,
+    along with the beam statistics, log records and metrics recorded.
+    """
+
+    _worker["records"] = []
+    candsfile = payload_from_columns(kind, from_shared(name, layout))
+    stages = {}
+    beam_stats = {}
+    peaks = socket_grex.cluster_gulp(
+        candsfile,
+        _worker["config"],
+        shed_level,
+        logs.StageTimer(stages),
+        beam_mask=beam_mask,
+        beam_stats=beam_stats,
+    )
+    result = {"stages": stages, "block": None, "beam_stats": beam_stats}
+    if peaks is not None:
+        tab2, tab3, rejected = peaks
+        passed = np.isin(tab2.index, tab3.index)
+        tab2 = tab2.copy()
+        columns = {name: tab2[name] for name in tab2.colnames}
+        columns["_passed"] = passed
+        block, result["layout"] = to_shared(columns)
+        block.close()
+        result["block"] = block.name
+        result["rejected"] = rejected
+    result["records"] = _worker["records"]
+    result["metrics"] = metrics.registry.drain()
+    return result
+
+
+def peaks_from_result(result):
+    """(tab2, tab3, rejected) for commit_gulp from a _cluster_job result,
+    freeing its shared memory.
+    """
+
+    columns = from_shared(result["block"], result["layout"], unlink=True)
+    passed = columns.pop("_passed")
+    tab2 = CandidateBatch(columns)
+    return tab2, tab2[passed], result["rejected"]
+
+
+def make_pool(config, workers):
+    """A pool of workers processes for process_gulps."""
+
+    return ProcessPoolExecutor(
+        workers,
+        mp_context=multiprocessing.get_context("forkserver"),
+        initializer=_init_worker,
+        initargs=(config, logging.getLogger().level),
+    )
+
+
+def process_gulps(
+    gulps, runtime, workers, max_inflight=None, trigger=True, on_gulp=None, pool=None
+):
+    """Like socket_grex.process_gulps, but cluster up to max_inflight gulps
+    (default 2 * workers) at a time in a pool of worker processes.
+
+    Parsing, clustering, peak finding and filtering (cluster_gulp) run in
+    the workers, with the gulp and its peaks passed through shared memory.
+    Everything with side effects (naming, triggering, events, outputs:
+    commit_gulp) runs in this process, in gulp order. The load shedding
+    level of a gulp is set when it is submitted. Log records and metrics
+    of the workers are passed back and recorded with the gulp. Hot beams
+    are masked as of the submission of a gulp, and their rates updated as
+    it is committed. The runtime's profiler only sees the commit in this
+    process, not the clustering in the workers: its captures hold the
+    commit stages, and the gulp is captured if committing it took longer
+    than threshold_s. A pool (make_pool) passed in is reused and left
+    running.
+    """
+
+    max_inflight = 2 * workers if max_inflight is None else max_inflight
+    own_pool = pool is None
+    if own_pool:
+        pool = make_pool(runtime.config, workers)
+    inflight = deque()
+    gulp_id = 0
+    done = False
+    try:
+        while True:
+            if not done and len(inflight) < max_inflight:
+                try:
+                    item = gulps.get(timeout=POLL_INTERVAL if inflight else None)
+                except queue.Empty:
+                    pass
+                else:
+                    if item is None:
+                        done = True
+                    else:
+                        gulp_id += 1
+                        inflight.append(_submit(pool, gulps, runtime, gulp_id, item))
+                    continue
+
+            if not inflight:
+                if done:
+                    break
+                continue
+            if not done and len(inflight) < max_inflight and not _ready(inflight[0]):
+                continue
+            _commit(inflight.popleft(), runtime, trigger, on_gulp)
+    finally:
+        if own_pool:
+            if sys.version_info >= (3, 9):
+                pool.shutdown(cancel_futures=True)
+            else:
+                for job in inflight:
+                    if job["future"] is not None:
+                        job["future"].cancel()
+                pool.shutdown()
+        for job in inflight:
+            _free(job)
+            future = job["future"]
+            if future is not None and future.done() and not future.cancelled():
+                if future.exception() is None and future.result()["block"]:
+                    block = shared_memory.SharedMemory(name=future.result()["block"])
+                    block.close()
+                    block.unlink()
+        logs.set_gulp(None)
+    return runtime.last_trigger_time
+
+
+def _submit(pool, gulps, runtime, gulp_id, item):
+    candstr_list, cand_count, t_gulp_end = item
+    backlog = gulps.qsize()
+    level = 0 if runtime.shedder is None else runtime.shedder.update(backlog)
+    job = {
+        "gulp": gulp_id,
+        "ncand": cand_count,
+        "t_gulp_end": t_gulp_end,
+        "backlog": backlog,
+        "level": level,
+        "t_submit": time.perf_counter(),
+        "block": None,
+        "future": None,
+    }
+    if cand_count > 0:
+        kind, columns = payload_columns(candstr_list)
+        job["block"], layout = to_shared(columns)
+        beam_mask = None if runtime.beams is None else runtime.beams.mask
+        job["future"] = pool.submit(
+            _cluster_job, kind, job["block"].name, layout, level, beam_mask
+        )
+    return job
+
+
+def _ready(job):
+    return job["future"] is None or job["future"].done()
+
+
+def _free(job):
+    if job["block"] is not None:
+        job["block"].close()
+        job["block"].unlink()
+        job["block"] = None
+
+
+def _commit(job, runtime, trigger, on_gulp):
+    logs.set_gulp(job["gulp"])
+    logging.info(f"Number of candidates {job['ncand']}")
+    stages = {}
+    try:
+        result = None if job["future"] is None else job["future"].result()
+    finally:
+        _free(job)
+
+    # the stages of the commit, timed in this process
+    commit_stages = {}
+    if runtime.profiler is not None:
+        runtime.profiler.start_gulp()
+    if runtime.memory is not None:
+        runtime.memory.start_gulp()
+    t0 = time.perf_counter()
+    if result is not None:
+        for level, message in result["records"]:
+            logging.log(level, message)
+        metrics.registry.absorb(result["metrics"])
+        stages.update(result["stages"])
+        beam_stats = result["beam_stats"]
+        if runtime.beams is not None and beam_stats:
+            runtime.beams.update(beam_stats["counts"], beam_stats["snr_counts"])
+        if result["block"] is not None:
+            on_mark = None if runtime.memory is None else runtime.memory.mark
+            logging.info(f"Filtering, last trig was {runtime.last_trigger_time}")
+            runtime.last_trigger_time = socket_grex.commit_gulp(
+                *peaks_from_result(result),
+                runtime.outroot,
+                runtime.db_con,
+                trigger=trigger,
+                last_trigger_time=runtime.last_trigger_time,
+                config=runtime.config,
+                runtime=runtime,
+                t_gulp_end=job["t_gulp_end"],
+                shed_level=job["level"],
+                timer=logs.StageTimer(commit_stages, on_mark=on_mark),
+            )
+    t1 = time.perf_counter()
+    for name, seconds in commit_stages.items():
+        stages[name] = stages.get(name, 0.0) + seconds
+    rss = None if runtime.memory is None else runtime.memory.end_gulp()
+    logging.info(
+        f"Gulp {job['gulp']} processed in {t1 - job['t_submit']:.3f} s "
+        f"(committed in {t1 - t0:.3f} s), {t1 - job['t_gulp_end']:.3f} s after it arrived",
+        extra={"stages": stages},
+    )
+    metrics.observe("gulp_s", t1 - job["t_submit"])
+    metrics.observe("gulp_lag_s", t1 - job["t_gulp_end"])
+    if runtime.checkpointer is not None:
+        runtime.checkpointer.maybe_save(runtime)
+    if runtime.profiler is not None:
+        runtime.profiler.end_gulp(
+            job["gulp"],
+            t1 - t0,
+            commit_stages,
+            ncand=job["ncand"],
+            backlog=job["backlog"],
+            level=job["level"],
+            lag_s=t1 - job["t_gulp_end"],
+            process_s=t1 - job["t_submit"],
+        )
+    if on_gulp is not None:
+        on_gulp(
+            {
+                "backlog": job["backlog"],
+                "level": job["level"],
+                "ncand": job["ncand"],
+                "process_s": t1 - job["t_submit"],
+                "lag_s": t1 - job["t_gulp_end"],
+                "rss": rss,
+            }
+        )
@@ -1,13 +1,18 @@
 import matplotlib
 import numpy as np
 import matplotlib.pyplot as plt
-import seaborn as sns
 import logging
 from mpl_toolkits.axes_grid1 import make_axes_locatable
+from matplotlib.colors import LogNorm
 from matplotlib.ticker import FormatStrFormatter, NullLocator
 
 matplotlib.use("Agg")
 
+# above this many candidates, plot_giants switches to binned rendering
+AGGREGATE_MIN_ROWS = 20000
+# number of brightest candidates overplotted individually in binned mode
+NBRIGHT = 200
+
 
 def plot_clustered(clusterer, clsnr, snrs, data, tab, cols, plot_dir="./"):
     """
@@ -21,6 +26,8 @@ def plot_clustered(clusterer, clsnr, snrs, data, tab, cols, plot_dir="./"):
     cols : parameters to plot.
     plot_dir : where to save output plots.
     """
+    import seaborn as sns
+
     # grey for unclustered noise, pure color for well clustered points.
     palette = sns.color_palette()
     cluster_colors = [
@@ -67,8 +74,126 @@ def plot_clustered(clusterer, clsnr, snrs, data, tab, cols, plot_dir="./"):
                 plt.close("all")
 
 
+def brightest(tab, nbright=NBRIGHT):
+    """Return indices of the nbright highest-SNR candidates (unordered)."""
+    snr = np.asarray(tab["snr"])
+    if len(snr) <= nbright:
+        return np.arange(len(snr))
+    return np.argpartition(snr, -nbright)[-nbright:]
+
+
+def _log_edges(values, vmin, nbins):
+    """Log-spaced bin edges from vmin to the max of values."""
+    vmax = max(float(values.max()), vmin)
+    if vmax <= vmin:
+        vmax = 10.0 * vmin
+    return np.logspace(np.log10(vmin), np.log10(vmax), nbins + 1)
+
+
+def bin_candidates(
+    tab,
+    nbins_time=512,
+    nbins_dm=256,
+    nbins_snr=128,
+    nbins_hist=30,
+    dm_min=1.0,
+    snr_min=6.0,
+    nbeam=None,
+):
+    """
+    Precompute the 2D histograms used for aggregated (binned) rendering.
+
+    Parameters
+    ----------
+    tab : ascii table
+        MBHeimdall giants output full table from parse_candsfile or parse_socket.
+    nbins_time, nbins_dm, nbins_snr : int
+        Bin numbers along time, DM (log) and SNR (log).
+    nbins_hist : int
+        Number of log DM bins for the per-beam DM histograms.
+    dm_min, snr_min : float
+        Lower edges of the DM and SNR axes. Smaller values go in the first bin.
+    nbeam : int, optional. The default is the largest beam index + 1.
+
+    Returns
+    -------
+    dict with the edges and counts of the time x DM, SNR x DM and
+    beam x time histograms, and a beam x DM array holding the DM
+    histogram of every beam (all beams built in a single pass).
+    """
+    mjds = np.asarray(tab["mjds"], dtype=float)
+    dm = np.clip(np.asarray(tab["dm"], dtype=float), dm_min, None)
+    snr = np.clip(np.asarray(tab["snr"], dtype=float), snr_min, None)
+    ibeam = np.asarray(tab["ibeam"], dtype=int)
+
+    if nbeam is None:
+        nbeam = int(ibeam.max()) + 1
+    t0, t1 = float(mjds.min()), float(mjds.max())
+    if t1 <= t0:
+        t1 = t0 + 1.0
+
+    time_edges = np.linspace(t0, t1, nbins_time + 1)
+    dm_edges = _log_edges(dm, dm_min, nbins_dm)
+    snr_edges = _log_edges(snr, snr_min, nbins_snr)
+    hist_edges = _log_edges(dm, dm_min, nbins_hist)
+    beam_edges = np.arange(nbeam + 1) - 0.5
+
+    # bin log quantities on uniform grids, which is much cheaper than
+    # searching non-uniform edges for every candidate
+    logdm = np.log10(dm)
+    logdm_range = (np.log10(dm_edges[0]), np.log10(dm_edges[-1]))
+    time_dm, _, _ = np.histogram2d(
+        mjds, logdm, bins=[nbins_time, nbins_dm], range=[(t0, t1), logdm_range]
+    )
+    snr_dm, _, _ = np.histogram2d(
+        np.log10(snr),
+        logdm,
+        bins=[nbins_snr, nbins_dm],
+        range=[(np.log10(snr_edges[0]), np.log10(snr_edges[-1])), logdm_range],
+    )
+    beam_time, _, _ = np.histogram2d(
+        ibeam, mjds, bins=[nbeam, nbins_time], range=[beam_edges[[0, -1]], (t0, t1)]
+    )
+    beam_dm, _, _ = np.histogram2d(
+        ibeam,
+        logdm,
+        bins=[nbeam, nbins_hist],
+        range=[
+            beam_edges[[0, -1]],
+            (np.log10(hist_edges[0]), np.log10(hist_edges[-1])),
+        ],
+    )
+
+    return {
+        "time_edges": time_edges,
+        "dm_edges": dm_edges,
+        "snr_edges": snr_edges,
+        "hist_edges": hist_edges,
+        "beam_edges": beam_edges,
+        "time_dm": time_dm,
+        "snr_dm": snr_dm,
+        "beam_time": beam_time,
+        "beam_dm": beam_dm,
+    }
+
+
+def _plot_density(ax, xedges, yedges, counts):
+    """Draw a rasterized log-scaled count image under the scatter layer."""
+    return ax.pcolormesh(
+        xedges,
+        yedges,
+        np.ma.masked_equal(counts, 0),
+        cmap="Greys",
+        norm=LogNorm(vmin=1),
+        rasterized=True,
+        zorder=0,
+    )
+
+
 # Below are functions to plot giants.
-def plot_dm_hist(tab, nbins=30, plot_dir="./", multibeam=False, data_name=None):
+def plot_dm_hist(
+    tab, nbins=30, plot_dir="./", multibeam=False, data_name=None, binned=None
+):
     """
     plot the giants DM histogram
 
@@ -82,6 +207,9 @@ def plot_dm_hist(tab, nbins=30, plot_dir="./", multibeam=False, data_name=None):
     multibeam : bool, optional. The default is False.
         If True, plot a histogram for each beam.
     data_name : bool, optional. The default is None.
+    binned : dict, optional. The default is None.
+        Output of bin_candidates. Per-beam histograms are taken from it
+        instead of being rebuilt.
 
     Returns
     -------
@@ -92,15 +220,14 @@ def plot_dm_hist(tab, nbins=30, plot_dir="./", multibeam=False, data_name=None):
     dm_min = 1.0
     # tab['ibeam'] = tab['ibeam'].astype(int)
     if multibeam:
-        for beam in range(tab["ibeam"].max() + 1):  # due to zero based indexing
-            if beam in tab["ibeam"]:
-                cands = tab[tab["ibeam"] == beam]
-                logbins = np.logspace(
-                    np.log10(dm_min), np.log10(cands["dm"].max()), nbins + 1
-                )
-                vals, edges = np.histogram(cands["dm"], bins=logbins)
-                ax.step(edges, np.append(vals, 0.0), where="post", label=str(beam))
-                ax.legend(loc=9, ncol=4, fontsize=8)
+        # one pass over the table for all beams, on common DM bins
+        if binned is None:
+            binned = bin_candidates(tab, nbins_hist=nbins, dm_min=dm_min)
+        edges = binned["hist_edges"]
+        for beam in np.flatnonzero(binned["beam_dm"].sum(axis=1)):
+            vals = binned["beam_dm"][beam]
+            ax.step(edges, np.append(vals, 0.0), where="post", label=str(beam))
+        ax.legend(loc=9, ncol=4, fontsize=8)
     else:
         logbins = np.logspace(np.log10(dm_min), np.log10(tab["dm"].max()), nbins + 1)
         ax.hist(tab["dm"], bins=logbins, histtype="step", label=data_name)
@@ -125,7 +252,7 @@ def plot_dm_hist(tab, nbins=30, plot_dir="./", multibeam=False, data_name=None):
     plt.close("all")
 
 
-def plot_dm_snr(ax, ax_cbar, tab, tsamp=1048e-6):
+def plot_dm_snr(ax, ax_cbar, tab, tsamp=1048e-6, binned=None, nbright=NBRIGHT):
     """
 
 
@@ -136,6 +263,10 @@ def plot_dm_snr(ax, ax_cbar, tab, tsamp=1048e-6):
     tab : ascii table
         MBHeimdall giants output full table from parse_candsfile or parse_socket.
     tsamp : optional. The default is 1048e-6.
+    binned : dict, optional. The default is None.
+        Output of bin_candidates. If set, draw the SNR x DM density and
+        only scatter the nbright brightest candidates.
+    nbright : optional. The default is NBRIGHT.
 
     Returns
     -------
@@ -172,6 +303,10 @@ def plot_dm_snr(ax, ax_cbar, tab, tsamp=1048e-6):
             "The SNR of a candidate is higher than the maximum SNRs plotted!"
         )
 
+    if binned is not None:
+        _plot_density(ax, binned["snr_edges"], binned["dm_edges"], binned["snr_dm"].T)
+        tab = tab[brightest(tab, nbright)]
+
     colormap = ax.scatter(
         tab["snr"],
         tab["dm"],
@@ -208,8 +343,13 @@ def plot_time_dm(
     mps=30.0,
     axrange=True,
     axlabel=True,
+    binned=None,
+    nbright=NBRIGHT,
 ):
-    """Plot time versus DM."""
+    """Plot time versus DM.
+    If binned (from bin_candidates) is set, draw the time x DM density
+    and only scatter the nbright brightest candidates.
+    """
 
     ax.cla()
     max_point_size = mps  # diameter in points
@@ -234,6 +374,10 @@ def plot_time_dm(
     yformat = FormatStrFormatter("%i")
     ax.yaxis.set_major_formatter(yformat)
 
+    if binned is not None:
+        _plot_density(ax, binned["time_edges"], binned["dm_edges"], binned["time_dm"].T)
+        tab = tab[brightest(tab, nbright)]
+
     ax.scatter(
         tab["mjds"],
         tab["dm"],
@@ -248,9 +392,18 @@ def plot_time_dm(
     )
 
 
-def plot_beam_time(tab, plot_dir="./"):
+def plot_beam_time(tab, plot_dir="./", binned=None, nbright=NBRIGHT):
+    """Plot beam number versus time.
+    If binned (from bin_candidates) is set, draw the beam x time density
+    and only scatter the nbright brightest candidates.
+    """
     fig, ax = plt.subplots()
     ax.cla()
+    if binned is not None:
+        _plot_density(
+            ax, binned["time_edges"], binned["beam_edges"], binned["beam_time"]
+        )
+        tab = tab[brightest(tab, nbright)]
     colormap = ax.scatter(
         tab["mjds"],
         tab["ibeam"],
@@ -269,20 +422,36 @@ def plot_beam_time(tab, plot_dir="./"):
     ax.set_ylabel("$\\rm beam number$", size=12)
     ax.set_title("giants snr for each beam")
     fig.savefig(plot_dir + "giants_beam_time.pdf")
+    plt.close(fig)
 
 
-def plot_giants(tab, plot_dir="./"):
+def plot_giants(tab, plot_dir="./", aggregate=None, nbright=NBRIGHT):
     """
     Plot the un-clustere heimdall output giants.out
     Parameters
     ----------
     tab : full table from parse_candsfile.
     plot_dir : optional. The default is "./".
+    aggregate : bool, optional. The default is None.
+        Render binned densities plus the nbright brightest candidates
+        instead of scattering every candidate. None switches it on
+        above AGGREGATE_MIN_ROWS candidates.
+    nbright : optional. The default is NBRIGHT.
     """
 
+    if aggregate is None:
+        aggregate = len(tab) > AGGREGATE_MIN_ROWS
+    binned = bin_candidates(tab) if aggregate else None
+    if aggregate:
+        logging.info(
+            f"Plotting {len(tab)} candidates binned, with {nbright} brightest overplotted"
+        )
+
     plot_dm_hist(tab, nbins=30, plot_dir=plot_dir, multibeam=False, data_name=None)
-    plot_dm_hist(tab, nbins=30, plot_dir=plot_dir, multibeam=True, data_name=None)
-    plot_beam_time(tab, plot_dir=plot_dir)
+    plot_dm_hist(
+        tab, nbins=30, plot_dir=plot_dir, multibeam=True, data_name=None, binned=binned
+    )
+    plot_beam_time(tab, plot_dir=plot_dir, binned=binned, nbright=nbright)
 
     # subplot or just save plots in each function?
     fig2, ax2 = plt.subplots(1, 2, sharey=True)
@@ -293,10 +462,12 @@ def plot_giants(tab, plot_dir="./"):
         mps=3.0,
         axrange=True,
         axlabel=True,
+        binned=binned,
+        nbright=nbright,
     )
     divider = make_axes_locatable(ax2[1])
     cbar_ax = divider.append_axes("right", size="5%", pad=0.1)
-    plot_dm_snr(ax2[1], cbar_ax, tab)
+    plot_dm_snr(ax2[1], cbar_ax, tab, binned=binned, nbright=nbright)
     fig2.savefig(plot_dir + "giants_dm_time_snr.pdf")
     # fig2.clf()
     plt.close("all")
@@ -0,0 +1,248 @@
+import cProfile
+import glob
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from grex_t2 import metrics
+
+# gulps slower than this many seconds are captured
+THRESHOLD_S = 2.0
+# seconds between stack samples of the processing thread
+SAMPLE_INTERVAL = 0.01
+# samples kept per gulp; later samples of a very long gulp are dropped
+MAX_SAMPLES = 100000
+# captures kept in the profile directory; the oldest are removed
+MAX_CAPTURES = 100
+# gulps run under cProfile after request_cprofile() (e.g. on SIGUSR1)
+CPROFILE_GULPS = 10
+
+
+def stack_key(frame):
+    """Collapsed stack of frame, outermost first, as "file:function;..."."""
+
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def stage_of(offsets, stages):
+    """Stage containing each time offset (seconds since the gulp started),
+    given the consecutive stage timings of a gulp (logs.StageTimer).
+    """
+
+    bounds = []
+    end = 0.0
+    for name, seconds in stages.items():
+        end += seconds
+        bounds.append((end, name))
+    found = []
+    for offset in offsets:
+        for end, name in bounds:
+            if offset <= end:
+                found.append(name)
+                break
+        else:
+            found.append("other")
+    return found
+
+
+class GulpProfiler:
+    """Captures profiles of slow gulps.
+
+    While a gulp is processed (between start_gulp and end_gulp), a daemon
+    thread samples the stack of the processing thread every
+    sample_interval seconds, which costs well under a percent of a core
+    at the default interval. If the gulp took longer than threshold_s, its
+    samples, grouped by the stage they fell in, are written with the gulp
+    metadata to outdir as gulp<id>_<time>.json. After request_cprofile(n)
+    the next n gulps also run under cProfile, and are written whatever
+    their time, with the cProfile stats in a .prof file next to the JSON.
+    At most max_captures captures are kept.
+    """
+
+    def __init__(
+        self,
+        outdir,
+        threshold_s=THRESHOLD_S,
+        sample_interval=SAMPLE_INTERVAL,
+        max_captures=MAX_CAPTURES,
+        cprofile_gulps=CPROFILE_GULPS,
+        writer=None,
+    ):
+        self.outdir = outdir
+        self.threshold_s = threshold_s
+        self.sample_interval = sample_interval
+        self.max_captures = max_captures
+        self.cprofile_gulps = cprofile_gulps
+        self.writer = writer
+        self._lock = threading.Lock()
+        self._thread_id = None
+        self._t0 = None
+        self._samples = []
+        self._cprofile_left = 0
+        self._cprofile = None
+        self._stop = threading.Event()
+        self._sampler = None
+        if sample_interval:
+            self._sampler = threading.Thread(
+                target=self._sample, name="t2-profiler", daemon=True
+            )
+            self._sampler.start()
+
+    def request_cprofile(self, ngulps=None):
+        """Run the next ngulps gulps (default cprofile_gulps) under
+        cProfile. Safe to call from a signal handler.
+        """
+
+        self._cprofile_left = self.cprofile_gulps if ngulps is None else ngulps
+
+    def start_gulp(self):
+        """Start profiling a gulp processed by the calling thread."""
+
+        if self._cprofile_left > 0:
+            self._cprofile_left -= 1
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        with self._lock:
+            self._samples = []
+            self._thread_id = threading.get_ident()
+            self._t0 = time.perf_counter()
+
+    def end_gulp(self, gulp_id, wall_s, stages=None, **meta):
+        """Stop profiling the gulp, and capture it if its wall time wall_s
+        exceeded threshold_s or it ran under cProfile. stages holds its
+        stage timings and meta any other metadata to store.
+        Returns the path of the capture, or None.
+        """
+
+        with self._lock:
+            samples, self._samples = self._samples, []
+            self._thread_id = None
+        cprofile, self._cprofile = self._cprofile, None
+        if cprofile is not None:
+            cprofile.disable()
+
+        slow = self.threshold_s is not None and wall_s > self.threshold_s
+        if not slow and cprofile is None:
+            return None
+
+        stages = {} if stages is None else dict(stages)
+        by_stage = {}
+        if samples:
+            offsets, keys = zip(*samples)
+            for stage, key in zip(stage_of(offsets, stages), keys):
+                by_stage.setdefault(stage, Counter())[key] += 1
+        capture = {
+            "gulp": gulp_id,
+            "time": time.time(),
+            "wall_s": wall_s,
+            "threshold_s": self.threshold_s,
+            "stages": stages,
+            "sample_interval": self.sample_interval,
+            "samples": {stage: dict(counts) for stage, counts in by_stage.items()},
+            "cprofile": cprofile is not None,
+            **meta,
+        }
+        path = os.path.join(
+            self.outdir, f"gulp{gulp_id}_{int(capture['time'] * 1000)}.json"
+        )
+        metrics.inc("profiles_captured")
+        logging.warning(
+            f"Gulp {gulp_id} took {wall_s:.3f} s, writing profile to {path}"
+            if slow
+            else f"Writing cProfile of gulp {gulp_id} to {path}"
+        )
+        if self.writer is None:
+            self._write(path, capture, cprofile)
+        else:
+            self.writer.submit(self._write, path, capture, cprofile)
+        return path
+
+    def close(self):
+        """Stop the sampling thread."""
+
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+    def _sample(self):
+        while not self._stop.wait(self.sample_interval):
+            with self._lock:
+                thread_id = self._thread_id
+                if thread_id is None or len(self._samples) >= MAX_SAMPLES:
+                    continue
+                frame = sys._current_frames().get(thread_id)
+                if frame is not None:
+                    self._samples.append(
+                        (time.perf_counter() - self._t0, stack_key(frame))
+                    )
+                del frame
+
+    def _write(self, path, capture, cprofile):
+        os.makedirs(self.outdir, exist_ok=True)
+        if cprofile is not None:
+            capture["cprofile_file"] = path[: -len(".json")] + ".prof"
+            cprofile.dump_stats(capture["cprofile_file"])
+        with open(path, "w") as f:
+            json.dump(capture, f)
+
+        captures = sorted(
+            glob.glob(os.path.join(self.outdir, "gulp*.json")), key=os.path.getmtime
+        )
+        for old in captures[: max(len(captures) - self.max_captures, 0)]:
+            for name in (old, old[: -len(".json")] + ".prof"):
+                if os.path.exists(name):
+                    os.remove(name)
+
+
+def read_captures(paths):
+    """Profile captures (GulpProfiler JSON files) at paths."""
+
+    captures = []
+    for path in paths:
+        with open(path, "r") as f:
+            captures.append(json.load(f))
+    return captures
+
+
+def summarise(captures, top=10):
+    """Per-stage summary of profile captures: for each stage the number of
+    captures it appears in, total and maximum seconds, share of the total
+    wall time, and the top functions (innermost frames) it was sampled in.
+    """
+
+    wall = sum(capture["wall_s"] for capture in captures)
+    summary = {}
+
+    def stage_entry(stage):
+        if stage not in summary:
+            summary[stage] = {
+                "captures": 0,
+                "total_s": 0.0,
+                "max_s": 0.0,
+                "functions": Counter(),
+            }
+        return summary[stage]
+
+    for capture in captures:
+        for stage, seconds in capture["stages"].items():
+            entry = stage_entry(stage)
+            entry["captures"] += 1
+            entry["total_s"] += seconds
+            entry["max_s"] = max(entry["max_s"], seconds)
+        for stage, counts in capture["samples"].items():
+            entry = stage_entry(stage)
+            for key, count in counts.items():
+                entry["functions"][key.rsplit(";", 1)[-1]] += count
+
+    for entry in summary.values():
+        entry["share"] = entry["total_s"] / wall if wall else 0.0
+        entry["functions"] = entry["functions"].most_common(top)
+    return dict(sorted(summary.items(), key=lambda item: -item[1]["total_s"]))
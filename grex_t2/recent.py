@@ -0,0 +1,345 @@
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+from grex_t2 import known_sources, metrics
+
+# columns of the cluster peaks kept, plus the gulp id and the time added
+COLUMNS = {
+    "snr": np.float64,
+    "itime": np.int64,
+    "mjds": np.float64,
+    "ibox": np.int64,
+    "idm": np.int64,
+    "dm": np.float64,
+    "ibeam": np.int64,
+    "cl": np.int64,
+    "cntb": np.int64,
+    "cntc": np.int64,
+    "trigger": "U16",
+    "known_source": "U16",
+    "gulp": np.int64,
+    "added": np.float64,
+}
+# peaks held in memory
+CAPACITY = 200000
+# seconds a peak is held in memory before it is spilled to disk
+MAX_AGE = 6 * 3600.0
+# default number of points and columns returned by an HTTP query
+MAX_POINTS = 2000
+QUERY_COLUMNS = ["mjds", "snr", "dm", "ibox", "ibeam", "trigger"]
+
+
+def downsample(mjds, snr, max_points):
+    """Indices of at most max_points rows: the brightest row in each of
+    max_points equal bins of mjds, in time order.
+    """
+
+    if len(mjds) <= max_points:
+        return np.argsort(mjds, kind="stable")
+    lo, hi = mjds.min(), mjds.max()
+    scale = max_points / (hi - lo) if hi > lo else 0.0
+    bins = ((mjds - lo) * scale).astype(np.intp)
+    np.minimum(bins, max_points - 1, out=bins)
+    # brightest snr per bin without sorting all rows
+    best = np.full(max_points, -np.inf)
+    np.maximum.at(best, bins, snr)
+    candidates = np.flatnonzero(snr == best[bins])
+    _, first = np.unique(bins[candidates], return_index=True)
+    return candidates[first]
+
+
+def select(
+    columns,
+    mjd_min=None,
+    mjd_max=None,
+    dm_min=None,
+    dm_max=None,
+    snr_min=None,
+    beams=None,
+):
+    """Boolean mask of the rows of columns passing the query filters."""
+
+    mask = np.ones(len(columns["mjds"]), dtype=bool)
+    for name, lo, hi in (("mjds", mjd_min, mjd_max), ("dm", dm_min, dm_max)):
+        if lo is not None:
+            mask &= columns[name] >= lo
+        if hi is not None:
+            mask &= columns[name] <= hi
+    if snr_min is not None:
+        mask &= columns["snr"] >= snr_min
+    if beams is not None:
+        mask &= np.isin(columns["ibeam"], beams)
+    return mask
+
+
+class RecentPeaks:
+    """Ring buffer of the most recent cluster peaks, in columns.
+
+    Peaks are added per gulp and kept in arrival order. Peaks older than
+    max_age seconds, or pushed out when capacity is reached, are written
+    to spill_dir as .npz files (named by their MJD range) if it is set,
+    and dropped otherwise; with writer (writer.ArtifactWriter) the files
+    are written in the background. query() selects from memory and, on
+    request, from the spill files.
+    """
+
+    def __init__(self, capacity=CAPACITY, max_age=MAX_AGE, spill_dir=None, writer=None):
+        self.capacity = capacity
+        self.max_age = max_age
+        self.spill_dir = spill_dir
+        self.writer = writer
+        self._columns = {
+            name: np.zeros(capacity, dtype=dtype) for name, dtype in COLUMNS.items()
+        }
+        self._start = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def add(self, peaks, gulp_id=None, now=None):
+        """Add the cluster peaks of one gulp (a CandidateBatch or mapping
+        of columns, mjds in MJD). gulp and added columns in peaks, as
+        returned by latest(), take precedence over gulp_id and now.
+        """
+
+        now = time.time() if now is None else now
+        # a gulp larger than the buffer only keeps its last capacity peaks
+        skip = max(len(peaks["mjds"]) - self.capacity, 0)
+        npeak = len(peaks["mjds"]) - skip
+        with self._lock:
+            self._expire(now)
+            overflow = self._count + npeak - self.capacity
+            if overflow > 0:
+                self._evict(overflow, "full")
+            rows = (self._start + self._count + np.arange(npeak)) % self.capacity
+            for name, col in self._columns.items():
+                if name in peaks:
+                    col[rows] = np.asarray(peaks[name])[skip:]
+                elif name == "gulp":
+                    col[rows] = -1 if gulp_id is None else gulp_id
+                elif name == "added":
+                    col[rows] = now
+                elif name == "known_source":
+                    col[rows] = known_sources.NO_SOURCE
+            self._count += npeak
+        metrics.set_gauge("recent_peaks", self._count)
+
+    def expire(self, now=None):
+        """Spill or drop the peaks older than max_age."""
+
+        with self._lock:
+            self._expire(time.time() if now is None else now)
+
+    def query(self, spilled=False, max_points=MAX_POINTS, columns=None, **filters):
+        """Peaks passing the filters of select(), at most max_points of
+        them (see downsample), as (columns, number of peaks matched).
+        columns selects the columns returned (default all). With spilled,
+        the spill files overlapping the MJD range are read as well.
+        """
+
+        columns = list(COLUMNS) if columns is None else columns
+        unknown = set(columns) - set(COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown columns {sorted(unknown)}")
+        with self._lock:
+            # filter the live part of the ring in place, downsample on
+            # mjds and snr, and copy out only the rows returned
+            rows = [
+                np.flatnonzero(
+                    select({n: c[seg] for n, c in self._columns.items()}, **filters)
+                )
+                + seg.start
+                for seg in self._segments()
+            ]
+            rows = np.concatenate(rows) if rows else np.zeros(0, dtype=int)
+            if not (spilled and self.spill_dir is not None):
+                mjds = self._columns["mjds"][rows]
+                snr = self._columns["snr"][rows]
+                keep = rows[downsample(mjds, snr, max_points)]
+                found = {name: self._columns[name][keep] for name in columns}
+                return found, len(rows)
+            found = {name: col[rows] for name, col in self._columns.items()}
+
+        parts = [found] + self._read_spilled(filters)
+        found = {
+            name: np.concatenate([part[name] for part in parts]) for name in COLUMNS
+        }
+        keep = downsample(found["mjds"], found["snr"], max_points)
+        return {name: found[name][keep] for name in columns}, len(found["mjds"])
+
+    def latest(self, n):
+        """Copy of all columns of the n most recently added peaks."""
+
+        with self._lock:
+            n = min(n, self._count)
+            rows = (self._start + self._count - n + np.arange(n)) % self.capacity
+            return {name: col[rows] for name, col in self._columns.items()}
+
+    def stats(self):
+        """Number of peaks held and the MJD range they cover."""
+
+        with self._lock:
+            mjds = [self._columns["mjds"][seg] for seg in self._segments()]
+            npeak = self._count
+        return {
+            "npeak": npeak,
+            "capacity": self.capacity,
+            "mjd_min": min(float(m.min()) for m in mjds) if npeak else None,
+            "mjd_max": max(float(m.max()) for m in mjds) if npeak else None,
+        }
+
+    def _segments(self):
+        """Slices of the live part of the ring, oldest first."""
+
+        end = self._start + self._count
+        if end <= self.capacity:
+            return [slice(self._start, end)] if self._count else []
+        return [slice(self._start, self.capacity), slice(0, end - self.capacity)]
+
+    def _expire(self, now):
+        if self.max_age is None:
+            return
+        # peaks are in arrival order, so the old ones are at the start
+        nold = 0
+        for seg in self._segments():
+            added = self._columns["added"][seg]
+            nseg = int(np.searchsorted(added, now - self.max_age))
+            nold += nseg
+            if nseg < len(added):
+                break
+        if nold:
+            self._evict(nold, "age")
+
+    def _evict(self, n, reason):
+        rows = (self._start + np.arange(n)) % self.capacity
+        if self.spill_dir is not None:
+            columns = {name: col[rows] for name, col in self._columns.items()}
+            if self.writer is None:
+                self._spill(columns)
+            else:
+                self.writer.submit(self._spill, columns)
+        self._start = (self._start + n) % self.capacity
+        self._count -= n
+        metrics.inc(f"recent_evicted_{reason}", n)
+
+    def _spill(self, columns):
+        os.makedirs(self.spill_dir, exist_ok=True)
+        mjds = columns["mjds"]
+        path = os.path.join(
+            self.spill_dir,
+            f"recent_{mjds.min():.8f}_{mjds.max():.8f}_{time.time_ns()}.npz",
+        )
+        np.savez(path, **columns)
+        logging.info(f"Spilled {len(mjds)} recent peaks to {path}")
+
+    def _read_spilled(self, filters):
+        mjd_min = filters.get("mjd_min")
+        mjd_max = filters.get("mjd_max")
+        parts = []
+        for path in sorted(glob.glob(os.path.join(self.spill_dir, "recent_*.npz"))):
+            lo, hi = (float(x) for x in os.path.basename(path).split("_")[1:3])
+            if (mjd_max is not None and lo > mjd_max) or (
+                mjd_min is not None and hi < mjd_min
+            ):
+                continue
+            with np.load(path) as f:
+                columns = {name: f[name] for name in COLUMNS if name in f.files}
+            # spilled before peaks were tagged with known sources
+            columns.setdefault(
+                "known_source",
+                np.full(len(columns["mjds"]), known_sources.NO_SOURCE, dtype="U16"),
+            )
+            mask = select(columns, **filters)
+            parts.append({name: col[mask] for name, col in columns.items()})
+        return parts
+
+
+def parse_query(query):
+    """Keyword arguments of RecentPeaks.query from a URL query string, e.g.
+    "mjd_min=60000.1&dm_min=100&snr_min=8&beam=10,11&max_points=1000&
+    columns=mjds,snr,gulp" (by default MAX_POINTS points of QUERY_COLUMNS).
+    """
+
+    params = {key: values[-1] for key, values in parse_qs(query).items()}
+    kwargs = {}
+    for name in ("mjd_min", "mjd_max", "dm_min", "dm_max", "snr_min"):
+        if name in params:
+            kwargs[name] = float(params.pop(name))
+    if "beam" in params:
+        kwargs["beams"] = [int(b) for b in params.pop("beam").split(",") if b]
+    kwargs["max_points"] = int(params.pop("max_points", MAX_POINTS))
+    kwargs["columns"] = QUERY_COLUMNS
+    if "columns" in params:
+        kwargs["columns"] = [c for c in params.pop("columns").split(",") if c]
+    if "spilled" in params:
+        kwargs["spilled"] = params.pop("spilled").lower() in ("1", "true", "yes")
+    if params:
+        raise ValueError(f"Unknown query parameters {sorted(params)}")
+    return kwargs
+
+
+class RecentHandler(BaseHTTPRequestHandler):
+    """GET /peaks?<filters> (see parse_query) returns {"nmatch": ...,
+    "columns": {...}}, GET /stats the buffer and T2 metrics and GET
+    /beams the per-beam rates and mask (with a beams.BeamMonitor).
+    """
+
+    recent = None
+    beams = None
+
+    def do_GET(self):
+        t0 = time.perf_counter()
+        url = urlparse(self.path)
+        try:
+            if url.path == "/peaks":
+                columns, nmatch = self.recent.query(**parse_query(url.query))
+                body = {
+                    "nmatch": nmatch,
+                    "npoint": len(next(iter(columns.values()), [])),
+                    "columns": {name: col.tolist() for name, col in columns.items()},
+                }
+            elif url.path == "/stats":
+                body = {"recent": self.recent.stats(), "metrics": metrics.snapshot()}
+            elif url.path == "/beams" and self.beams is not None:
+                body = self.beams.snapshot()
+            else:
+                self.send_error(404)
+                return
+        except ValueError as exc:
+            self.send_error(400, str(exc))
+            return
+        data = json.dumps(body, separators=(",", ":"), default=float).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        metrics.observe("recent_query_s", time.perf_counter() - t0)
+
+    def log_message(self, format, *args):
+        logging.debug("Recent peaks query: " + format % args)
+
+
+def serve(recent, host="127.0.0.1", port=8084, beams=None):
+    """Serve recent (RecentPeaks), and the state of beams
+    (beams.BeamMonitor) if given, over HTTP from a daemon thread. Returns
+    the server; server.shutdown() stops it.
+    """
+
+    handler = type("Handler", (RecentHandler,), {"recent": recent, "beams": beams})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(
+        target=server.serve_forever, name="t2-recent", daemon=True
+    )
+    thread.start()
+    logging.info(f"Serving recent peaks on http://{host}:{server.server_port}/peaks")
+    return server
@@ -0,0 +1,103 @@
+import logging
+import queue
+import socket
+import threading
+import time
+from grex_t2 import socket_grex, wire
+from grex_t2.candidates import CandidateBatch
+
+# itime samples per replayed gulp when splitting a candidate file
+GULP_SAMPLES = 4096
+
+
+def split_gulps(candstr, gulp_samples=GULP_SAMPLES):
+    """Split heimdall candidate text into gulps of gulp_samples samples
+    (by itime), in time order.
+    """
+
+    gulps = {}
+    for line in candstr.splitlines():
+        fields = line.split()
+        if len(fields) < 3:
+            continue
+        gulps.setdefault(int(fields[2]) // gulp_samples, []).append(line)
+    return ["\n".join(lines) + "\n" for _, lines in sorted(gulps.items())]
+
+
+def encode_gulp(candstr):
+    """Binary packets (see wire) for one gulp of candidate text."""
+    return wire.encode(CandidateBatch.from_text(candstr))
+
+
+def gulp_packets(candstr, binary=False):
+    """The datagrams heimdall would send for one gulp, end marker included."""
+
+    if binary:
+        packets = encode_gulp(candstr)
+    else:
+        packets = [line.encode() + b"\n" for line in candstr.splitlines()]
+    return packets + [b"\x03"]
+
+
+def send(gulps, address, interval=0.0, binary=False):
+    """Send gulps of candidate text over UDP to a running T2 at address
+    (host, port), as text lines or binary packets, one gulp every
+    interval seconds.
+    """
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        for candstr in gulps:
+            for packet in gulp_packets(candstr, binary=binary):
+                sock.sendto(packet, address)
+            if interval:
+                time.sleep(interval)
+    finally:
+        sock.close()
+
+
+def replay(gulps, runtime, interval=0.0, trigger=False, binary=False):
+    """Feed gulps (candidate text) to the T2 processing loop as if they
+    arrived from heimdall every interval seconds. With binary, each gulp
+    is passed on as binary records, as received from binary packets.
+
+    Gulps are queued by a separate thread while socket_grex.process_gulps
+    consumes them with runtime, so a gulp taking longer than interval
+    builds up backlog and load shedding as in the service. With interval
+    0 all gulps are queued before the first is processed. Returns a list
+    of per-gulp statistics (backlog, level, ncand, process_s, lag_s, rss).
+    """
+
+    pending = queue.Queue()
+    records = []
+
+    if binary:
+        gulps = [
+            b"".join(wire.packet_records(p) for p in encode_gulp(candstr))
+            for candstr in gulps
+        ]
+
+    def feed():
+        for candstr in gulps:
+            if binary:
+                ncand = len(candstr) // wire.RECORD.itemsize
+            else:
+                ncand = candstr.count("\n")
+            pending.put((candstr, ncand, time.perf_counter()))
+            if interval:
+                time.sleep(interval)
+        pending.put(None)
+
+    t0 = time.perf_counter()
+    if interval:
+        feeder = threading.Thread(target=feed, name="t2-replay", daemon=True)
+        feeder.start()
+    else:
+        # everything arrives at once: queue it all before processing starts
+        feed()
+    socket_grex.process_gulps(pending, runtime, trigger=trigger, on_gulp=records.append)
+    logging.info(
+        f"Replayed {len(records)} gulps in {time.perf_counter() - t0:.3f} s, "
+        f"max level {max((r['level'] for r in records), default=0)}"
+    )
+    return records
@@ -0,0 +1,105 @@
+import logging
+import numpy as np
+from grex_t2 import triggering
+from grex_t2.candidates import aligned
+
+# occupancy grid: itime samples per time bin and idm trials per DM bin
+TIME_BIN = 256
+DM_BIN = 16
+# a time bin is a storm if more beams (or DM bins) than this have candidates
+MAX_BEAMS = triggering.nbeam // 2
+MAX_DM_BINS = None
+# rows kept per storm bin by action="summarise"
+KEEP_PER_BIN = 5
+
+
+def occupancy(tab, time_bin=TIME_BIN, dm_bin=DM_BIN, nbeam=triggering.nbeam):
+    """Candidate counts per time bin x beam and per time bin x DM bin.
+
+    Only time bins holding candidates are counted, so the grid is bounded
+    by the number of rows rather than the time span of the gulp.
+    Returns the time bin of every row and the (ntime, nbeam) and
+    (ntime, ndm) count arrays.
+    """
+
+    itime = aligned(tab, "itime")
+    ibeam = np.asarray(tab["ibeam"])
+    idm = np.asarray(tab["idm"]) // dm_bin
+    _, tbin = np.unique(itime // time_bin, return_inverse=True)
+    ntime = tbin.max() + 1
+    nbeam = max(nbeam, ibeam.max() + 1)
+    ndm = idm.max() + 1
+
+    beam_counts = np.bincount(tbin * nbeam + ibeam, minlength=ntime * nbeam)
+    dm_counts = np.bincount(tbin * ndm + idm, minlength=ntime * ndm)
+    return tbin, beam_counts.reshape(ntime, nbeam), dm_counts.reshape(ntime, ndm)
+
+
+def storm_rows(
+    tab,
+    time_bin=TIME_BIN,
+    dm_bin=DM_BIN,
+    max_beams=MAX_BEAMS,
+    max_dm_bins=MAX_DM_BINS,
+    action="summarise",
+    keep_per_bin=KEEP_PER_BIN,
+):
+    """Flag RFI storms: time bins where candidates hit more than max_beams
+    beams or more than max_dm_bins DM bins (None skips a test).
+
+    action="excise" drops every row of a storm bin and "summarise" keeps
+    only its keep_per_bin highest-snr rows.
+    Returns the indices of the rows to keep and a dict of storm statistics.
+    """
+
+    if action not in ("excise", "summarise"):
+        raise ValueError(f"Unknown storm action {action}")
+
+    nrow = len(tab)
+    stats = {
+        "nrow": nrow,
+        "time_bins": 0,
+        "storm_bins": 0,
+        "rows_flagged": 0,
+        "rows_removed": 0,
+        "max_beams_hit": 0,
+        "max_dm_bins_hit": 0,
+    }
+    if not nrow:
+        return np.arange(0), stats
+
+    tbin, beam_counts, dm_counts = occupancy(tab, time_bin=time_bin, dm_bin=dm_bin)
+    beams_hit = np.count_nonzero(beam_counts, axis=1)
+    dm_bins_hit = np.count_nonzero(dm_counts, axis=1)
+    storm = np.zeros(len(beams_hit), dtype=bool)
+    if max_beams is not None:
+        storm |= beams_hit > max_beams
+    if max_dm_bins is not None:
+        storm |= dm_bins_hit > max_dm_bins
+
+    flagged = storm[tbin]
+    stats["time_bins"] = len(storm)
+    stats["storm_bins"] = int(storm.sum())
+    stats["rows_flagged"] = int(flagged.sum())
+    stats["max_beams_hit"] = int(beams_hit.max())
+    stats["max_dm_bins_hit"] = int(dm_bins_hit.max())
+
+    keep = ~flagged
+    if action == "summarise" and stats["rows_flagged"]:
+        # rank the flagged rows of each bin by snr and keep the first few
+        rows = np.flatnonzero(flagged)
+        rows = rows[np.lexsort((-np.asarray(tab["snr"])[rows], tbin[rows]))]
+        bins = tbin[rows]
+        start = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+        rank = np.arange(len(rows)) - np.repeat(start, np.diff(np.r_[start, len(rows)]))
+        keep[rows[rank < keep_per_bin]] = True
+
+    good = np.flatnonzero(keep)
+    stats["rows_removed"] = nrow - len(good)
+    if stats["storm_bins"]:
+        logging.warning(
+            f"RFI storm in {stats['storm_bins']} of {stats['time_bins']} time bins "
+            f"(up to {stats['max_beams_hit']} beams, {stats['max_dm_bins_hit']} DM bins): "
+            f"removed {stats['rows_removed']} of {nrow} candidates"
+        )
+    return good, stats
@@ -0,0 +1,63 @@
+import logging
+import numpy as np
+from grex_t2 import metrics
+from grex_t2.config import merge
+
+# degradation levels, each including the ones below it
+NORMAL = 0
+CHEAP_CLUSTERING = 1
+TOP_K = 2
+SKIP_OUTPUTS = 3
+LEVEL_NAMES = ["normal", "cheap clustering", "top-K rows", "skip outputs"]
+
+
+class LoadShedder:
+    """Degradation level chosen from the processing backlog.
+
+    thresholds[i] is the backlog (gulps waiting) at which level i + 1 is
+    entered. A level is left only once the backlog falls to recover times
+    its threshold, so the level does not flap around a threshold.
+    """
+
+    def __init__(self, thresholds=(4, 8, 16), recover=0.5):
+        self.thresholds = list(thresholds)
+        self.recover = recover
+        self.level = NORMAL
+
+    def update(self, backlog):
+        """Set and return the level for the given backlog."""
+
+        level = self.level
+        while level < len(self.thresholds) and backlog >= self.thresholds[level]:
+            level += 1
+        while level > NORMAL and backlog <= self.recover * self.thresholds[level - 1]:
+            level -= 1
+
+        if level != self.level:
+            log = logging.warning if level > self.level else logging.info
+            log(
+                f"Backlog of {backlog} gulps: load shedding level {level} "
+                f"({LEVEL_NAMES[level]}), was {self.level}"
+            )
+            metrics.inc("shed_level_changes")
+            self.level = level
+        metrics.set_gauge("shed_level", level)
+        metrics.set_gauge("backlog_gulps", backlog)
+        return level
+
+
+def cluster_settings(config, level):
+    """config["cluster"] with the shedding overrides applied from level 1."""
+
+    if level >= CHEAP_CLUSTERING:
+        return merge(config["cluster"], config["shedding"]["cluster"])
+    return config["cluster"]
+
+
+def top_rows(tab, k):
+    """The k highest-snr rows of tab, in table order."""
+
+    if len(tab) <= k:
+        return tab
+    snr = np.asarray(tab["snr"])
+    return tab[np.sort(np.argpartition(snr, -k)[-k:])]
@@ -1,15 +1,134 @@
+import logging
 import os
+import queue
+import socket
 import sqlite3
+import threading
 import numpy as np
 import time
-from astropy.time import Time
-from astropy.io import ascii
-from grex_t2 import cluster_heimdall, names
+from grex_t2 import (
+    beams,
+    checkpoint,
+    classify,
+    cluster_heimdall,
+    names,
+    filters,
+    database,
+    writer,
+    metrics,
+    rfi,
+    shedding,
+    logs,
+    framing,
+    wire,
+    merge,
+    known_sources,
+    profiling,
+    memory,
+    events,
+    recent,
+)
+from grex_t2.config import DEFAULT_CONFIG, load_config
+from grex_t2.candidates import CandidateBatch, col_heimdall, col_extra
 from collections import deque
-import requests
 
 nbeams_queue = deque(maxlen=10)
 
+# synthetic heimdall gulp used to exercise the processing path at startup
+WARMUP_NCANDS = 64
+
+
+class T2Runtime:
+    """State and services kept by the T2 service between gulps.
+
+    lastname is read from outroot once and then tracked in memory, since
+    JSON files may still be queued on the writer when the next gulp names
+    its candidate. With a checkpoint, lastname and the rest of the state
+    are restored from it instead (see checkpoint.restore).
+    """
+
+    def __init__(self, outroot, db_con, config=None, background=True):
+        self.outroot = outroot
+        self.db_con = db_con
+        self.config = load_config() if config is None else config
+        self.writer = writer.ArtifactWriter() if background else None
+        self.injections = database.InjectionCache(db_con)
+        # load the classifier model once, before the first gulp
+        self.classifier = classify.get_classifier(self.config["classify"])
+        bm = dict(self.config["beams"])
+        self.beams = beams.BeamMonitor(**bm) if bm.pop("enabled") else None
+        self.lastname = None
+        self.last_trigger_time = 0.0
+        shed = self.config["shedding"]
+        self.shedder = (
+            shedding.LoadShedder(shed["thresholds"], shed["recover"])
+            if shed["enabled"]
+            else None
+        )
+        prof = dict(self.config["profiling"])
+        self.profiler = None
+        if prof.pop("enabled"):
+            if prof["outdir"] is None:
+                prof["outdir"] = os.path.join(outroot, "profiles")
+            self.profiler = profiling.GulpProfiler(writer=self.writer, **prof)
+        mem = dict(self.config["memory"])
+        self.memory = memory.MemoryTracker(**mem) if mem.pop("enabled") else None
+        ev = self.config["events"]
+        self.events = None
+        if ev["address"] is not None:
+            self.events = events.EventPublisher(ev["address"], ev["max_buffer"])
+        rec = self.config["recent"]
+        self.recent = None
+        self.recent_server = None
+        if rec["port"] is not None:
+            self.recent = recent.RecentPeaks(
+                rec["capacity"], rec["max_age"], rec["spill_dir"], writer=self.writer
+            )
+            self.recent_server = recent.serve(
+                self.recent, rec["host"], rec["port"], beams=self.beams
+            )
+
+        ckpt = dict(self.config["checkpoint"])
+        self.checkpointer = None
+        state = None
+        if ckpt.pop("enabled"):
+            path = ckpt["path"] or os.path.join(outroot, checkpoint.FILENAME)
+            self.checkpointer = checkpoint.Checkpointer(
+                path, ckpt["interval"], ckpt["max_peaks"], writer=self.writer
+            )
+            state = checkpoint.load(path)
+        if state is None:
+            self.lastname = names.get_lastname_grex(outroot)
+        else:
+            t0 = time.perf_counter()
+            checkpoint.restore(self, state, ckpt["max_age"])
+            logging.info(
+                f"Restored checkpoint {path} (last name {self.lastname}) in "
+                f"{1e3 * (time.perf_counter() - t0):.1f} ms"
+            )
+
+    @property
+    def keeps_peaks(self):
+        """Whether gulp peaks go to an event stream or recent-peak buffer."""
+        return self.events is not None or self.recent is not None
+
+    def close(self):
+        """Stop the profiler, memory tracing, event stream and query
+        service, save a checkpoint and flush pending output writes."""
+        if self.checkpointer is not None:
+            self.checkpointer.maybe_save(self, force=True)
+        if self.recent_server is not None:
+            self.recent_server.shutdown()
+            self.recent_server.server_close()
+        if self.events is not None:
+            self.events.close()
+        if self.profiler is not None:
+            self.profiler.close()
+        if self.memory is not None:
+            self.memory.close()
+        if self.writer is not None:
+            self.writer.close()
+
 
 def filter_candidates(
     candsfile,
@@ -18,61 +137,225 @@ def filter_candidates(
     output=True,
     trigger=True,
     last_trigger_time=0.0,
+    config=None,
+    runtime=None,
+    t_gulp_end=None,
+    shed_level=None,
+    stages=None,
 ):
     """Take a single gulp of candidates,
     parse, cluster, and then filter to
     produce highest S/N candidate and save
-    to a json file
+    to a json file.
+    candsfile is heimdall text, bytes of binary records (wire) or a
+    CandidateBatch (e.g. merged from several streams by merge.StreamMerger).
+    config is the T2 config (config.load_config), defaults if None.
+    runtime (T2Runtime) supplies config, last name, injection cache and the
+    background writer; without it outputs are written synchronously.
+    t_gulp_end is time.perf_counter() when the gulp finished arriving.
+    The trigger is sent before any output is written.
+    shed_level is the load shedding level (see shedding), by default that
+    of the runtime's shedder, or 0.
+    stages, if given, is a dict filled with the time spent in each stage.
+    Returns last_trigger_time.
     """
 
-    col_heimdall = ["snr", "if", "itime", "mjds", "ibox", "idm", "dm", "ibeam"]
-    min_dm = 50
-    max_ibox = 64
-    min_snr = 10.0
-    min_snr_t2out = 10.0
-    max_ncl = np.inf
-    max_cntb = np.inf
-    target_params = (50.0, 100.0, 20.0)  # Galactic bursts
-
-    tab = ascii.read(
-        candsfile, names=col_heimdall, guess=True, fast_reader=False, format="no_header"
+    if runtime is not None:
+        config = runtime.config
+    elif config is None:
+        config = DEFAULT_CONFIG
+    if shed_level is None:
+        shed_level = 0
+        if runtime is not None and runtime.shedder is not None:
+            shed_level = runtime.shedder.level
+    on_mark = None
+    if runtime is not None and runtime.memory is not None:
+        on_mark = runtime.memory.mark
+    timer = logs.StageTimer(stages, on_mark=on_mark)
+    monitor = None if runtime is None else runtime.beams
+    beam_stats = None if monitor is None else {}
+
+    peaks = cluster_gulp(
+        candsfile,
+        config,
+        shed_level,
+        timer,
+        beam_mask=None if monitor is None else monitor.mask,
+        beam_stats=beam_stats,
     )
+    if beam_stats:
+        monitor.update(beam_stats["counts"], beam_stats["snr_counts"])
+    if peaks is None:
+        return last_trigger_time
+    return commit_gulp(
+        *peaks,
+        outroot,
+        db_con,
+        trigger=trigger,
+        last_trigger_time=last_trigger_time,
+        config=config,
+        runtime=runtime,
+        t_gulp_end=t_gulp_end,
+        shed_level=shed_level,
+        timer=timer,
+    )
+
+
+def cluster_gulp(
+    candsfile, config, shed_level=0, timer=None, beam_mask=None, beam_stats=None
+):
+    """The part of filter_candidates without side effects: parse, mask hot
+    beams, excise RFI, prefilter, cluster, find and classify the cluster
+    peaks and filter them.
+    Returns (tab2, tab3, rejected): the peaks, those passing the filter
+    (a selection of tab2) and the rows rejected per rule, or None if no
+    peaks are left.
+    beam_mask (bool per beam, see beams.BeamMonitor) drops the rows of
+    masked beams. beam_stats, if given, is a dict filled with the "counts"
+    and "snr_counts" per beam of the gulp before masking (beams.beam_stats).
+    """
+
+    if timer is None:
+        timer = logs.StageTimer()
+    cand_filter = filters.get_filter(config["filter"])
+
+    # columnar batch; tab2/tab3 below are index views into it, and
+    # astropy Tables are only built for the outputs
+    if isinstance(candsfile, CandidateBatch):
+        tab = candsfile
+    elif isinstance(candsfile, bytes):
+        tab = CandidateBatch.from_records(wire.decode_records(candsfile))
+    else:
+        tab = CandidateBatch.from_text(candsfile)
+    timer.mark("parse")
 
     # Ensure that the candidate table is not empty
     if not len(tab):
-        return
+        return None
+
+    if beam_stats is not None:
+        beam_stats["counts"], beam_stats["snr_counts"] = beams.beam_stats(tab)
+    if beam_mask is not None and beam_mask.any():
+        nrow = len(tab)
+        tab = beams.mask_rows(tab, beam_mask)
+        metrics.inc("beam_rows_masked", nrow - len(tab))
+        metrics.observe("beam_masked_fraction", 1.0 - len(tab) / nrow)
+        timer.mark("beams")
+        if not len(tab):
+            return None
 
+    if config["rfi"]["enabled"]:
+        tab = excise_storms(tab, config)
+        timer.mark("rfi")
+        if not len(tab):
+            return None
+
+    if config["prefilter"]["enabled"]:
+        tab = prefilter_candidates(tab, config)
+        timer.mark("prefilter")
+        if not len(tab):
+            return None
+
+    if shed_level >= shedding.TOP_K:
+        tab = shedding.top_rows(tab, config["shedding"]["top_k"])
+
+    timer.mark("shed")
     cluster_heimdall.cluster_data(
-        tab, metric="euclidean", allow_single_cluster=True, return_clusterer=False
+        tab,
+        metric="euclidean",
+        allow_single_cluster=True,
+        return_clusterer=False,
+        **shedding.cluster_settings(config, shed_level),
     )
+    timer.mark("cluster")
+    metrics.observe("cluster_s", timer.stages["cluster"])
+
+    # rules added to the filter for this gulp
+    rules = []
+    min_streams = config["merge"]["min_streams"]
+    if "stream" in tab and min_streams > 1:
+        # cross-stream coincidence: keep clusters seen by enough streams
+        tab["nstream"] = merge.stream_counts(tab["cl"], tab["stream"])
+        rules.append(
+            {
+                "name": "min_streams",
+                "column": "nstream",
+                "op": ">=",
+                "value": min_streams,
+            }
+        )
 
     tab2 = cluster_heimdall.get_peak(tab)
-    col_trigger = np.zeros(len(tab2), dtype=int)
 
     # Ensure that the candidate table is not empty
     if not len(tab2):
-        return
+        return None
+
+    classifier = classify.get_classifier(config["classify"])
+    if classifier is not None:
+        scores = classifier.score(tab)
+        timer.mark("classify")
+        if scores is not None:
+            tab2["score"] = scores
+            rules.append(
+                {
+                    "name": "classifier",
+                    "column": "score",
+                    "op": ">=",
+                    "value": classifier.min_score,
+                }
+            )
+
+    if rules:
+        spec = dict(config["filter"])
+        spec["rules"] = list(spec.get("rules", [])) + rules
+        cand_filter = filters.get_filter(spec)
+    tab3, rejected = cand_filter(tab2)
+    timer.mark("filter")
+    return tab2, tab3, rejected
+
+
+def commit_gulp(
+    tab2,
+    tab3,
+    rejected,
+    outroot,
+    db_con,
+    trigger=True,
+    last_trigger_time=0.0,
+    config=DEFAULT_CONFIG,
+    runtime=None,
+    t_gulp_end=None,
+    shed_level=0,
+    timer=None,
+):
+    """The side effects of filter_candidates, for the peaks tab2 and those
+    passing the filter tab3 (a selection of tab2) from cluster_gulp:
+    naming, triggering, publishing and writing outputs. Gulps must be
+    committed in order. Returns last_trigger_time.
+    """
 
-    tab3 = cluster_heimdall.filter_clustered(
-        tab2,
-        min_snr=min_snr,
-        min_dm=min_dm,
-        max_ibox=max_ibox,
-        max_cntb=max_cntb,
-        max_ncl=max_ncl,
-        target_params=target_params,
+    if timer is None:
+        timer = logs.StageTimer()
+    min_snr_t2out = config["output"]["min_snr_t2out"]
+    max_ncl = config["output"]["max_ncl"]
+    logging.info(
+        f"Filtering clusters from {len(tab2)} to {len(tab3)} candidates. "
+        f"Rejected per rule: {rejected}"
     )
 
     # Ensure that the candidate table is not empty
     if not len(tab3):
-        return
+        if runtime is not None and runtime.keeps_peaks:
+            tab2["mjds"] = tab2["mjds"] / 86400.0 + cluster_heimdall.get_start_time()
+            tag_known_sources(tab2, config)
+            publish_peaks(runtime, tab2)
+        return last_trigger_time
 
-    # itimes = tab3["itime"]
-    # maxsnr = tab3["snr"].max()
-    # imaxsnr = np.where(tab3["snr"] == maxsnr)[0][0]
-    # itime_imax = str(itimes[imaxsnr])
-    #   mjd = tab3["mjds"][imaxsnr]
-    lastname = names.get_lastname_grex(outroot)
+    if runtime is not None:
+        lastname = runtime.lastname
+    else:
+        lastname = names.get_lastname_grex(outroot)
     cat = None
     coords = None
     snrs = None
@@ -80,10 +363,15 @@ def filter_candidates(
     # min_timedelt = 60.0
 
     # Query for the start-time in MJD
-    start_time = requests.get("http://localhost:8083/start_time").json()
-    tab3["mjds"] = tab3["mjds"] / 86400.0 + start_time
+    start_time = cluster_heimdall.get_start_time()
+    # tab3 is a selection of tab2, so this converts both
     tab2["mjds"] = tab2["mjds"] / 86400.0 + start_time
 
+    # tag peaks from known pulsars, and keep them from triggering
+    if tag_known_sources(tab2, config):
+        tab3, _ = known_sources.reject_known(tab3)
+        timer.mark("known_sources")
+
     tab4, lastname, last_trigger_time = cluster_heimdall.dump_cluster_results_json(
         tab3,
         db_con,
@@ -94,67 +382,360 @@ def filter_candidates(
         snrs=snrs,
         outroot=outroot,
         last_trigger_time=last_trigger_time,
+        writer=None if runtime is None else runtime.writer,
+        injections=None if runtime is None else runtime.injections,
+        t_gulp_end=t_gulp_end,
+        candidates=config["output"]["candidates"],
     )
+    if runtime is not None:
+        runtime.lastname = lastname
+    timer.mark("trigger")
 
     if tab4 is not None and trigger:
-        col_trigger = np.where(tab4 == tab2, lastname, 0)  # if trigger, then overload
+        # if trigger, then overload the trigger column of the peak row
+        itrig = tab3.index[np.argmax(tab3["snr"])]
+        tab2[tab2.index == itrig]["trigger"] = lastname
+
+    if runtime is not None and runtime.keeps_peaks:
+        publish_peaks(runtime, tab2, tab4, lastname, trigger)
+        timer.mark("events")
 
     # write T2 clustered/filtered results
-    if outroot is not None and len(tab2):
-        tab2["trigger"] = col_trigger
+    if shed_level >= shedding.SKIP_OUTPUTS:
+        metrics.inc("shed_outputs_skipped")
+    elif outroot is not None and len(tab2):
         output_file = (
             outroot
             + "cluster_output"
             + str(np.floor(time.time()).astype("int"))
             + ".cand"
         )
-        outputted = cluster_heimdall.dump_cluster_results_heimdall(
-            tab2, output_file, min_snr_t2out=min_snr_t2out, max_ncl=max_ncl
+        colnames = col_heimdall + col_extra
+        if "known_source" in tab2:
+            colnames = colnames + ["known_source"]
+        args = (
+            tab2.to_table(colnames),
+            output_file,
+            outroot,
+            names.mjd_now(),
         )
+        kwargs = {"min_snr_t2out": min_snr_t2out, "max_ncl": max_ncl}
+        if runtime is None or runtime.writer is None:
+            write_cluster_output(*args, **kwargs)
+        else:
+            runtime.writer.submit(write_cluster_output, *args, **kwargs)
+    timer.mark("output")
 
-        # aggregate files
-        if outputted:
-            a = Time.now().mjd
-            output_mjd = str(int(a))
-            old_mjd = str(int(a) - 1)
-
-            os.system("cat " + output_file + " >> " + outroot + output_mjd + ".csv")
-            os.system(
-                "if ! grep -Fxq 'snr,if,specnum,mjds,ibox,idm,dm,ibeam,cl,cntc,cntb,trigger' "
-                + outroot
-                + output_mjd
-                + ".csv; then sed -i '1s/^/snr,if,specnum,mjds,ibox,idm,dm,ibeam,cl,cntc,cntb,trigger\\n/' "
-                + outroot
-                + output_mjd
-                + ".csv; fi"
-            )
+    return last_trigger_time
+
+
+def tag_known_sources(tab2, config):
+    """Tag the cluster peaks tab2 (mjds in MJD) matching a source of the
+    known_sources catalog in their known_source column (see
+    known_sources.tag_known). Returns whether a catalog is configured.
+    """
+
+    settings = dict(config["known_sources"])
+    catalog = settings.pop("catalog")
+    if catalog is None:
+        return False
+    known_sources.tag_known(tab2, known_sources.get_index(catalog), **settings)
+    return True
+
+
+def publish_peaks(runtime, tab2, row=None, candname=None, trigger=False):
+    """Publish the cluster peaks tab2 of the current gulp on the runtime's
+    event stream, with the trigger decision for row (the peak that was
+    named candname, if any), and add them to its recent peaks.
+    """
+
+    if runtime.recent is not None:
+        runtime.recent.add(tab2, logs.current_gulp())
+    if runtime.events is None:
+        return
+    injection = False
+    if row is not None:
+        injection = runtime.injections.is_injection(row["mjds"])
+    runtime.events.publish(
+        events.gulp_message(
+            logs.current_gulp(),
+            tab2,
+            candname=None if row is None else candname,
+            triggered=row is not None and trigger and not injection,
+            injection=injection,
+        )
+    )
+
+
+def receive_gulps(sock, gulps, framer=None, stream=None):
+    """Read heimdall packets from sock forever, putting each complete gulp
+    on the gulps queue as (candidate text or binary records, number of
+    packets, time the gulp ended). Gulps are assembled by framer (framing.GulpFramer,
+    default limits if None): a gulp normally ends with a single \x03
+    byte, but is also cut at the framer's size, itime span and idle
+    limits. If stream is set, items are prefixed with it, for
+    merge.merge_streams.
+    """
+
+    if framer is None:
+        framer = framing.GulpFramer()
+    if framer.idle_timeout is not None:
+        # wake up regularly to flush a gulp that stalled
+        sock.settimeout(min(framer.idle_timeout, 1.0))
+
+    while True:
+        try:
+            # Recieve 512 bytes
+            data, address = sock.recvfrom(512)
+        except socket.timeout:
+            done = framer.poll(time.perf_counter())
+        else:
+            done = framer.feed(data, time.perf_counter())
+
+        for candstr, npackets, reason in done:
+            item = (candstr, npackets, time.perf_counter())
+            gulps.put(item if stream is None else (stream,) + item)
+
+
+def start_receivers(socks, gulps, config=DEFAULT_CONFIG):
+    """Start a receive_gulps thread per socket, each with its own framer.
+    With several sockets (heimdall streams), their gulps are aligned and
+    merged by a merge.StreamMerger on another thread before reaching the
+    gulps queue. Returns the started threads.
+    """
 
-            os.system(
-                "echo 'snr,if,specnum,mjds,ibox,idm,dm,ibeam,cl,cntc,cntb,trigger' > "
-                + outroot
-                + "cluster_output.csv"
+    def start(target, args, name):
+        thread = threading.Thread(target=target, args=args, name=name, daemon=True)
+        thread.start()
+        return thread
+
+    framers = [framing.GulpFramer(**config["framing"]) for _ in socks]
+    if len(socks) == 1:
+        return [start(receive_gulps, (socks[0], gulps, framers[0]), "t2-recv")]
+
+    streams = queue.Queue()
+    merge_settings = {
+        key: value for key, value in config["merge"].items() if key != "min_streams"
+    }
+    merger = merge.StreamMerger(len(socks), **merge_settings)
+    threads = [
+        start(receive_gulps, (sock, streams, framer, i), f"t2-recv-{i}")
+        for i, (sock, framer) in enumerate(zip(socks, framers))
+    ]
+    threads.append(start(merge.merge_streams, (streams, gulps, merger), "t2-merge"))
+    return threads
+
+
+def process_gulps(gulps, runtime, trigger=True, on_gulp=None):
+    """Run filter_candidates on each gulp taken from the gulps queue (as
+    put there by receive_gulps) until None is taken. The load shedding
+    level is updated from the queue length before each gulp. on_gulp, if
+    given, is called with a dict of per-gulp statistics.
+    """
+
+    gulp_id = 0
+    while True:
+        item = gulps.get()
+        if item is None:
+            logs.set_gulp(None)
+            return runtime.last_trigger_time
+        candstr_list, cand_count, t_gulp_end = item
+        gulp_id += 1
+        logs.set_gulp(gulp_id)
+        backlog = gulps.qsize()
+        level = 0 if runtime.shedder is None else runtime.shedder.update(backlog)
+        logging.info(f"Number of candidates {cand_count}")
+
+        stages = {}
+        if runtime.profiler is not None:
+            runtime.profiler.start_gulp()
+        if runtime.memory is not None:
+            runtime.memory.start_gulp()
+        t0 = time.perf_counter()
+        if cand_count > 0:
+            logging.info(f"Filtering, last trig was {runtime.last_trigger_time}")
+            runtime.last_trigger_time = filter_candidates(
+                candstr_list,
+                outroot=runtime.outroot,
+                db_con=runtime.db_con,
+                trigger=trigger,
+                last_trigger_time=runtime.last_trigger_time,
+                runtime=runtime,
+                t_gulp_end=t_gulp_end,
+                shed_level=level,
+                stages=stages,
             )
-            os.system(
-                "test -f "
-                + outroot
-                + old_mjd
-                + ".csv && tail -n +2 "
-                + outroot
-                + old_mjd
-                + ".csv | tr ' ' ',' >> "
-                + outroot
-                + "cluster_output.csv"
+        t1 = time.perf_counter()
+        rss = None if runtime.memory is None else runtime.memory.end_gulp()
+        logging.info(
+            f"Gulp {gulp_id} processed in {t1 - t0:.3f} s, "
+            f"{t1 - t_gulp_end:.3f} s after it arrived",
+            extra={"stages": stages},
+        )
+        metrics.observe("gulp_s", t1 - t0)
+        metrics.observe("gulp_lag_s", t1 - t_gulp_end)
+        if runtime.checkpointer is not None:
+            runtime.checkpointer.maybe_save(runtime)
+        if runtime.profiler is not None:
+            runtime.profiler.end_gulp(
+                gulp_id,
+                t1 - t0,
+                stages,
+                ncand=cand_count,
+                backlog=backlog,
+                level=level,
+                lag_s=t1 - t_gulp_end,
             )
-            os.system(
-                "tail -n +2 "
-                + outroot
-                + output_mjd
-                + ".csv | tr ' ' ',' >> "
-                + outroot
-                + "cluster_output.csv"
+        if on_gulp is not None:
+            on_gulp(
+                {
+                    "backlog": backlog,
+                    "level": level,
+                    "ncand": cand_count,
+                    "process_s": t1 - t0,
+                    "lag_s": t1 - t_gulp_end,
+                    "rss": rss,
+                }
             )
 
 
+def excise_storms(tab, config):
+    """Remove or summarise RFI-storm time bins of tab (see rfi.storm_rows)
+    and record the storm statistics.
+    """
+
+    settings = {key: value for key, value in config["rfi"].items() if key != "enabled"}
+    keep, stats = rfi.storm_rows(tab, **settings)
+    metrics.inc("rfi_storm_bins", stats["storm_bins"])
+    metrics.inc("rfi_rows_removed", stats["rows_removed"])
+    metrics.set_gauge("rfi_max_beams_hit", stats["max_beams_hit"])
+    metrics.set_gauge("rfi_max_dm_bins_hit", stats["max_dm_bins_hit"])
+    if not stats["rows_removed"]:
+        return tab
+    return tab[keep]
+
+
+def prefilter_candidates(tab, config):
+    """Select the rows of tab worth clustering (see filters.prefilter).
+    Pruned rows keep cl=-1 and are left out of the peaks and outputs.
+    """
+
+    settings = {
+        key: value for key, value in config["prefilter"].items() if key != "enabled"
+    }
+    spec = config["filter"]
+    if config["classify"]["model"] is not None:
+        spec = dict(spec, classify=True)
+    nrow = len(tab)
+    keep = filters.prefilter(
+        tab, spec, selectcols=config["cluster"]["selectcols"], **settings
+    )
+    npruned = nrow - len(keep)
+    metrics.inc("prefilter_pruned", npruned)
+    metrics.observe("prefilter_kept_frac", len(keep) / nrow)
+    if npruned:
+        # clustering scales roughly as N log N
+        nkeep = max(len(keep), 2)
+        speedup = nrow * np.log(nrow) / (nkeep * np.log(nkeep))
+        logging.info(
+            f"Prefilter pruned {npruned} of {nrow} candidates "
+            f"(est. clustering speedup {speedup:.1f}x)"
+        )
+    return tab[keep]
+
+
+def write_cluster_output(
+    tab, output_file, outroot, mjd, min_snr_t2out=None, max_ncl=None
+):
+    """Write the clustered gulp to output_file (heimdall format) and
+    aggregate it into the daily <mjd>.csv and cluster_output.csv files.
+    """
+
+    outputted = cluster_heimdall.dump_cluster_results_heimdall(
+        tab, output_file, min_snr_t2out=min_snr_t2out, max_ncl=max_ncl
+    )
+
+    # aggregate files
+    if outputted:
+        # itime is written as specnum (see dump_cluster_results_heimdall)
+        header = ",".join("specnum" if c == "itime" else c for c in tab.colnames)
+        output_mjd = str(int(mjd))
+        old_mjd = str(int(mjd) - 1)
+
+        os.system("cat " + output_file + " >> " + outroot + output_mjd + ".csv")
+        os.system(
+            f"if ! grep -Fxq '{header}' "
+            + outroot
+            + output_mjd
+            + f".csv; then sed -i '1s/^/{header}\\n/' "
+            + outroot
+            + output_mjd
+            + ".csv; fi"
+        )
+
+        os.system(f"echo '{header}' > " + outroot + "cluster_output.csv")
+        os.system(
+            "test -f "
+            + outroot
+            + old_mjd
+            + ".csv && tail -n +2 "
+            + outroot
+            + old_mjd
+            + ".csv | tr ' ' ',' >> "
+            + outroot
+            + "cluster_output.csv"
+        )
+        os.system(
+            "tail -n +2 "
+            + outroot
+            + output_mjd
+            + ".csv | tr ' ' ',' >> "
+            + outroot
+            + "cluster_output.csv"
+        )
+
+
+def warmup(seed=0):
+    """Run a synthetic gulp through parsing, clustering, peak finding,
+    filtering and naming without writing outputs or triggering, so that
+    imports, hdbscan/sklearn setup and the start-time query are paid before
+    the first real gulp. Returns the time taken in seconds.
+    """
+
+    t0 = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    n = WARMUP_NCANDS
+    itime = np.sort(rng.integers(10000, 20000, n))
+    idm = rng.integers(0, 512, n)
+    lines = [
+        f"{snr:.4f} {it * 32} {it} {it * 1.048e-3:.4f} {ibox} {dm} {dm * 2.0:.2f} {beam}"
+        for snr, it, ibox, dm, beam in zip(
+            rng.uniform(8.0, 20.0, n),
+            itime,
+            rng.integers(0, 8, n),
+            idm,
+            rng.integers(0, 256, n),
+        )
+    ]
+
+    tab = CandidateBatch.from_text("\n".join(lines))
+    rfi.storm_rows(tab)
+    cluster_heimdall.cluster_data(tab, metric="euclidean", allow_single_cluster=True)
+    tab2 = cluster_heimdall.get_peak(tab)
+    filters.get_filter(DEFAULT_CONFIG["filter"])(tab2)
+    tab2.to_table()
+    names.increment_name(names.mjd_now())
+
+    try:
+        cluster_heimdall.get_start_time()
+    except Exception as exc:
+        logging.warning(f"Could not prime start time during warm-up: {exc}")
+
+    elapsed = time.perf_counter() - t0
+    logging.info(f"Warm-up finished in {elapsed:.3f} s")
+    return elapsed
+
+
 def recvall(sock, n):
     """
     helper function to receive all bytes from a socket
@@ -1,7 +1,5 @@
 import os.path
 import numpy as np
-from astropy import units as u
-from astropy.coordinates import SkyCoord
 import logging
 
 # TODO should move to calib constants
@@ -22,7 +20,9 @@ def parse_catalog(catalog):
     Parameters
     ----------
     catalog: string path to file
-        Needs to have format <ra_sexagesimal> <dec_sexagesimal> <SNR_flag>
+        Needs to have format <ra_sexagesimal> <dec_sexagesimal> <SNR_flag>,
+        optionally followed by the ephemeris of a known periodic source
+        (see known_sources.read_known_sources)
 
     Returns
     -------
@@ -33,14 +33,21 @@ def parse_catalog(catalog):
     snrs = []
 
     if catalog is not None:
+        from astropy import units as u
+        from astropy.coordinates import SkyCoord
+
         assert os.path.exists(catalog), f"catalog file ({catalog}) not found"
 
         with open(catalog, "r") as reader:
             lines = reader.readlines()
 
         for i in np.arange(1, len(lines)):
+            # known periodic sources have more fields (see known_sources)
+            fields = lines[i].split("#", 1)[0].split()
+            if not fields:
+                continue
             try:
-                ra, dec, minsnr = lines[i].split()
+                ra, dec, minsnr = fields[:3]
                 c = SkyCoord(ra=ra, dec=dec, unit=(u.hourangle, u.deg), frame="icrs")
                 coords.append(c)
                 snrs.append(float(minsnr))
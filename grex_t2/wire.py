@@ -0,0 +1,94 @@
+import struct
+import numpy as np
+from grex_t2.candidates import col_heimdall
+
+# binary candidate packets: a header (magic, version, record count)
+# followed by fixed-width little-endian records in heimdall column order
+MAGIC = b"GXT2"
+VERSION = 1
+HEADER = struct.Struct("<4sHH")
+RECORD = np.dtype(
+    [
+        ("snr", "<f8"),
+        ("if", "<i8"),
+        ("itime", "<i8"),
+        ("mjds", "<f8"),
+        ("ibox", "<i4"),
+        ("idm", "<i4"),
+        ("dm", "<f8"),
+        ("ibeam", "<i4"),
+    ]
+)
+# largest datagram T2 reads (socket_grex.receive_gulps)
+MAX_PACKET = 512
+RECORDS_PER_PACKET = (MAX_PACKET - HEADER.size) // RECORD.itemsize
+
+
+def is_binary(data):
+    """Whether a datagram (or gulp payload) is in the binary format."""
+    return data[: len(MAGIC)] == MAGIC
+
+
+def read_header(data):
+    """Version and number of records of a binary packet."""
+
+    magic, version, nrec = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a binary candidate packet")
+    if version != VERSION:
+        raise ValueError(f"Unsupported candidate packet version {version}")
+    if len(data) != HEADER.size + nrec * RECORD.itemsize:
+        raise ValueError(
+            f"Candidate packet of {len(data)} bytes does not hold {nrec} records"
+        )
+    return version, nrec
+
+
+def packet_records(data):
+    """The record bytes of a binary packet (after checking its header)."""
+
+    read_header(data)
+    return memoryview(data)[HEADER.size :]
+
+
+def decode_records(payload):
+    """View concatenated record bytes as a RECORD array, without copying."""
+
+    if len(payload) % RECORD.itemsize:
+        raise ValueError(
+            f"{len(payload)} bytes is not a whole number of {RECORD.itemsize}-byte records"
+        )
+    return np.frombuffer(payload, dtype=RECORD)
+
+
+def decode(data):
+    """Records of one binary packet, as a RECORD array view."""
+    return decode_records(packet_records(data))
+
+
+def first_itime(data):
+    """itime of the first record of a binary packet, or None if empty."""
+
+    if len(data) < HEADER.size + RECORD.itemsize:
+        return None
+    return int(
+        np.frombuffer(data, dtype=RECORD, count=1, offset=HEADER.size)["itime"][0]
+    )
+
+
+def encode(tab, records_per_packet=RECORDS_PER_PACKET):
+    """Encode the heimdall columns of tab (a CandidateBatch, Table or
+    mapping of columns) as a list of binary packets of at most
+    records_per_packet records each.
+    """
+
+    nrow = len(tab[col_heimdall[0]])
+    records = np.empty(nrow, dtype=RECORD)
+    for name in col_heimdall:
+        records[name] = tab[name]
+
+    packets = []
+    for start in range(0, nrow, records_per_packet):
+        chunk = records[start : start + records_per_packet]
+        packets.append(HEADER.pack(MAGIC, VERSION, len(chunk)) + chunk.tobytes())
+    return packets
@@ -0,0 +1,68 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from grex_t2 import metrics
+
+# maximum number of pending writes before submit blocks
+MAX_PENDING = 1000
+
+
+class ArtifactWriter:
+    """Runs output writes (JSON, .cand, CSV) on a background thread.
+
+    Jobs run one at a time in submission order, so a later write never
+    overtakes an earlier one. flush() waits for everything submitted so
+    far and close() flushes and stops the thread; close() is also
+    registered to run at interpreter exit. A failing job is logged and
+    does not stop the jobs after it.
+    """
+
+    def __init__(self, max_pending=MAX_PENDING, name="t2-writer"):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, func, *args, **kwargs):
+        """Queue func(*args, **kwargs). Blocks if max_pending jobs are queued."""
+
+        if self._closed:
+            raise RuntimeError("ArtifactWriter is closed")
+        self._queue.put((func, args, kwargs, time.perf_counter()))
+        metrics.set_gauge("writer_pending", self._queue.qsize())
+
+    def pending(self):
+        return self._queue.unfinished_tasks
+
+    def flush(self):
+        """Block until all submitted jobs have run."""
+        self._queue.join()
+
+    def close(self):
+        """Flush pending jobs and stop the writer thread."""
+
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        atexit.unregister(self.close)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                func, args, kwargs, t_submit = job
+                try:
+                    func(*args, **kwargs)
+                except Exception:
+                    logging.exception(f"Background write {func.__name__} failed")
+                    metrics.inc("writer_errors")
+                metrics.observe("writer_delay_s", time.perf_counter() - t_submit)
+            finally:
+                self._queue.task_done()
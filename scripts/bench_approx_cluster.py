@@ -0,0 +1,84 @@
+"""Quality and run time of approximate clustering (cluster_approx) against
+exact hdbscan on a synthetic RFI-storm gulp: uniform low-SNR junk plus
+compact bright pulses.
+
+python scripts/bench_approx_cluster.py --nrow 20000 --fit-rows 5000
+"""
+
+import argparse
+
+import numpy as np
+
+from grex_t2 import cluster_heimdall
+from grex_t2.candidates import CandidateBatch
+
+
+def storm_gulp(nrow, npulse=50, rows_per_pulse=40, seed=0):
+    """Uniform noise candidates plus npulse compact clusters of bright rows."""
+
+    rng = np.random.default_rng(seed)
+    nnoise = nrow - npulse * rows_per_pulse
+    itime = rng.integers(0, 16384, nnoise)
+    idm = rng.integers(0, 1024, nnoise)
+    ibox = rng.integers(0, 12, nnoise)
+    ibeam = rng.integers(0, 256, nnoise)
+    snr = 7.0 + rng.exponential(1.0, nnoise)
+
+    centres = np.column_stack(
+        [
+            rng.integers(0, 16384, npulse),
+            rng.integers(100, 1024, npulse),
+            rng.integers(2, 10, npulse),
+            rng.integers(0, 256, npulse),
+        ]
+    )
+    pulses = np.repeat(centres, rows_per_pulse, axis=0) + rng.integers(
+        -2, 3, (npulse * rows_per_pulse, 4)
+    )
+    pulse_snr = np.repeat(rng.uniform(15.0, 60.0, npulse), rows_per_pulse)
+    pulse_snr *= rng.uniform(0.5, 1.0, len(pulse_snr))
+
+    itime = np.concatenate([itime, pulses[:, 0]])
+    order = np.argsort(itime, kind="stable")
+    cols = {
+        "snr": np.concatenate([snr, pulse_snr]),
+        "if": itime * 32,
+        "itime": itime,
+        "mjds": itime * 1.048e-3,
+        "ibox": np.concatenate([ibox, pulses[:, 2]]),
+        "idm": np.concatenate([idm, pulses[:, 1]]),
+        "dm": np.concatenate([idm, pulses[:, 1]]) * 1.8,
+        "ibeam": np.concatenate([ibeam, pulses[:, 3]]),
+    }
+    return CandidateBatch.from_columns({k: v[order] for k, v in cols.items()})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark approximate clustering")
+    parser.add_argument("--nrow", type=int, default=20000)
+    parser.add_argument(
+        "--fit-rows", type=int, default=cluster_heimdall.APPROX_FIT_ROWS
+    )
+    parser.add_argument("--keep-snr", type=float, default=12.0)
+    parser.add_argument("--assign", default="nearest", choices=["nearest", "predict"])
+    parser.add_argument("--min-snr", type=float, default=10.0)
+    args = parser.parse_args()
+
+    tab = storm_gulp(args.nrow)
+    report = cluster_heimdall.approx_quality(
+        tab,
+        min_snr=args.min_snr,
+        approx_fit_rows=args.fit_rows,
+        approx_keep_snr=args.keep_snr,
+        approx_assign=args.assign,
+    )
+    for key, value in report.items():
+        print(
+            f"{key:>12}: {value:.4g}"
+            if isinstance(value, float)
+            else f"{key:>12}: {value}"
+        )
+
+
+if __name__ == "__main__":
+    main()
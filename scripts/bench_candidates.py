@@ -0,0 +1,87 @@
+"""Compare per-gulp memory and time of the astropy Table path against
+CandidateBatch for everything around the clustering call (feature matrix,
+cluster columns, peak selection, filtering, mjd conversion, output table).
+
+python scripts/bench_candidates.py --nrow 1000000
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+from astropy.table import Table
+from numpy.lib.recfunctions import structured_to_unstructured
+
+from grex_t2 import cluster_heimdall
+from grex_t2.candidates import CandidateBatch, col_heimdall
+
+selectcols = ["itime", "idm", "ibox", "ibeam"]
+
+
+def fake_gulp(nrow, seed=0):
+    rng = np.random.default_rng(seed)
+    itime = np.sort(rng.integers(0, 16384, nrow))
+    cols = {
+        "snr": rng.uniform(7.0, 30.0, nrow),
+        "if": itime * 32,
+        "itime": itime,
+        "mjds": itime * 1.048e-3,
+        "ibox": rng.integers(0, 12, nrow),
+        "idm": rng.integers(0, 1024, nrow),
+        "dm": rng.uniform(0.0, 2000.0, nrow),
+        "ibeam": rng.integers(0, 256, nrow),
+    }
+    cl = rng.integers(-1, nrow // 20, nrow)
+    return cols, cl
+
+
+def table_path(cols, cl):
+    """Column handling as done with astropy Tables before CandidateBatch."""
+    tab = Table([cols[c] for c in col_heimdall], names=col_heimdall)
+    data = structured_to_unstructured(tab[selectcols].as_array())
+    _, inverse, counts = np.unique(cl, return_inverse=True, return_counts=True)
+    tab["cl"] = cl.tolist()
+    tab["cntc"] = counts[inverse].tolist()
+    tab["cntb"] = np.zeros(len(cl), dtype=int).tolist()
+    tab2 = tab[cluster_heimdall.peak_indices(tab["cl"], tab["snr"])]
+    tab3 = cluster_heimdall.filter_clustered(tab2, min_snr=10.0, min_dm=50)
+    tab3["mjds"] = tab3["mjds"] / 86400.0 + 60000.0
+    tab2["mjds"] = tab2["mjds"] / 86400.0 + 60000.0
+    tab2["trigger"] = np.zeros(len(tab2), dtype=int)
+    return data, tab2
+
+
+def batch_path(cols, cl):
+    tab = CandidateBatch.from_columns(cols)
+    data = cluster_heimdall.cluster_features(tab, selectcols)
+    cluster_heimdall.assign_clusters(tab, cl)
+    tab2 = cluster_heimdall.get_peak(tab)
+    cluster_heimdall.filter_clustered(tab2, min_snr=10.0, min_dm=50)
+    tab2["mjds"] = tab2["mjds"] / 86400.0 + 60000.0
+    return data, tab2.to_table()
+
+
+def measure(func, cols, cl):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    func(cols, cl)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark candidate containers")
+    parser.add_argument("--nrow", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    cols, cl = fake_gulp(args.nrow)
+    for name, func in [("astropy Table", table_path), ("CandidateBatch", batch_path)]:
+        elapsed, peak = measure(func, cols, cl)
+        print(f"{name:>15}: {elapsed:.3f} s, peak traced memory {peak / 2**20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Throughput of merging and clustering several heimdall streams: each of
+nstream streams sends gulps of --nrow candidates (beams split between
+the streams), which merge.StreamMerger aligns and merges before
+socket_grex.cluster_gulp clusters the merged window.
+
+python scripts/bench_merge.py --streams 1 2 4 --nrow 2000
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from bench_approx_cluster import storm_gulp
+from grex_t2 import merge, socket_grex
+from grex_t2.candidates import col_heimdall
+from grex_t2.config import load_config
+
+
+def stream_gulps(nstream, nrow, ngulp):
+    """Text gulps of each stream, by window: stream i gets the beams
+    b % nstream == i of a storm gulp of nstream * nrow candidates.
+    """
+
+    gulps = []
+    for window in range(ngulp):
+        tab = storm_gulp(nstream * nrow, npulse=nstream, seed=window)
+        tab["itime"] = tab["itime"] // 2 + window * merge.GULP_SAMPLES
+        tab["mjds"] = tab["itime"] * merge.TSAMP
+        parts = []
+        for stream in range(nstream):
+            part = tab[tab["ibeam"] % nstream == stream]
+            lines = np.column_stack([part[c] for c in col_heimdall])
+            parts.append("\n".join(" ".join(map(str, row)) for row in lines) + "\n")
+        gulps.append(parts)
+    return gulps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--streams", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--nrow", type=int, default=2000)
+    parser.add_argument("--ngulp", type=int, default=10)
+    args = parser.parse_args()
+
+    config = load_config()
+    config["rfi"]["enabled"] = False
+    config["beams"]["enabled"] = False
+    socket_grex.warmup()
+    for nstream in args.streams:
+        gulps = stream_gulps(nstream, args.nrow, args.ngulp)
+        merger = merge.StreamMerger(nstream)
+        t_merge = t_cluster = 0.0
+        ncand = 0
+        for parts in gulps:
+            t0 = time.perf_counter()
+            merged = []
+            for stream, payload in enumerate(parts):
+                merged += merger.add(stream, payload, 1, 0.0)
+            t1 = time.perf_counter()
+            for batch, _, _ in merged:
+                ncand += len(batch)
+                socket_grex.cluster_gulp(batch, config)
+            t_merge += t1 - t0
+            t_cluster += time.perf_counter() - t1
+        total = t_merge + t_cluster
+        print(
+            f"{nstream} streams: {ncand / total:,.0f} candidates/s "
+            f"({args.ngulp / total:.2f} windows/s; parse+merge {t_merge:.2f} s, "
+            f"cluster {t_cluster:.2f} s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Gulp throughput of sequential processing (socket_grex.process_gulps)
+against the pipelined worker pool (pipeline.process_gulps) with 1 to N
+workers, on synthetic gulps queued all at once. Outputs and triggers are
+real, written to a temporary directory.
+
+python scripts/bench_pipeline.py --ngulp 24 --nrow 5000 --workers 1 2 4 8
+"""
+
+import argparse
+import os
+import queue
+import sqlite3
+import tempfile
+import time
+
+from grex_t2 import pipeline, socket_grex
+from grex_t2.config import load_config
+
+from bench_wire import make_text
+
+
+def bench_config():
+    config = load_config()
+    # measure raw throughput of clustering, not load shedding or RFI excision
+    config["shedding"]["enabled"] = False
+    config["profiling"]["enabled"] = False
+    config["rfi"]["enabled"] = False
+    return config
+
+
+def run(gulps, workers, config, pool=None):
+    outroot = tempfile.mkdtemp(prefix="t2pipe") + "/"
+    db_con = sqlite3.connect(os.path.join(outroot, "bench.db"))
+    db_con.execute("CREATE TABLE injection (mjd REAL)")
+    runtime = socket_grex.T2Runtime(outroot, db_con, config=config)
+    pending = queue.Queue()
+    for candstr in gulps:
+        pending.put((candstr, candstr.count("\n"), time.perf_counter()))
+    pending.put(None)
+
+    t0 = time.perf_counter()
+    if workers:
+        pipeline.process_gulps(pending, runtime, workers, trigger=False, pool=pool)
+    else:
+        socket_grex.process_gulps(pending, runtime, trigger=False)
+    runtime.close()
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--ngulp", type=int, default=24)
+    parser.add_argument("--nrow", type=int, default=5000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    gulps = [make_text(args.nrow, seed=i) for i in range(args.ngulp)]
+    print(f"{os.cpu_count()} CPUs, {args.ngulp} gulps of {args.nrow} rows")
+    config = bench_config()
+    # first run pays for imports and hdbscan compilation
+    run(gulps[:2], 0, config)
+    base = run(gulps, 0, config)
+    print(f"sequential: {args.ngulp / base:.2f} gulps/s")
+    for workers in args.workers:
+        # start the workers outside of the timed run
+        pool = pipeline.make_pool(config, workers)
+        run(gulps[:workers], workers, config, pool)
+        elapsed = run(gulps, workers, config, pool)
+        pool.shutdown()
+        print(
+            f"{workers} workers: {args.ngulp / elapsed:.2f} gulps/s "
+            f"({base / elapsed:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Rows pruned and clustering speedup of the pre-clustering prefilter
+(filters.prefilter) on a synthetic RFI-storm gulp, and whether the peaks
+passing the filter are unchanged.
+
+python scripts/bench_prefilter.py --nrow 50000
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from bench_approx_cluster import storm_gulp
+from grex_t2 import cluster_heimdall, filters
+from grex_t2.config import load_config
+
+
+def cluster_and_filter(tab, config):
+    t0 = time.perf_counter()
+    cluster_heimdall.cluster_data(
+        tab, metric="euclidean", allow_single_cluster=True, **config["cluster"]
+    )
+    elapsed = time.perf_counter() - t0
+    peaks, _ = filters.get_filter(config["filter"])(cluster_heimdall.get_peak(tab))
+    return elapsed, peaks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the prefilter")
+    parser.add_argument("--nrow", type=int, default=50000)
+    parser.add_argument("--guard", type=float, default=50.0)
+    parser.add_argument("--snr-margin", type=float, default=2.0)
+    parser.add_argument("--dm-margin", type=float, default=10.0)
+    args = parser.parse_args()
+
+    config = load_config()
+    config["cluster"]["approx_min_rows"] = None
+
+    # the first full-size hdbscan run is much slower; keep it out of the timings
+    cluster_and_filter(storm_gulp(args.nrow), config)
+
+    tab = storm_gulp(args.nrow)
+    exact_s, exact = cluster_and_filter(tab, config)
+
+    tab = storm_gulp(args.nrow)
+    t0 = time.perf_counter()
+    keep = filters.prefilter(
+        tab,
+        config["filter"],
+        selectcols=config["cluster"]["selectcols"],
+        snr_margin=args.snr_margin,
+        dm_margin=args.dm_margin,
+        guard=args.guard,
+    )
+    prefilter_s = time.perf_counter() - t0
+    pruned_s, pruned = cluster_and_filter(tab[keep], config)
+
+    same = np.array_equal(exact.index, pruned.index)
+    recall = np.isin(exact.index, pruned.index).mean() if len(exact) else 1.0
+    print(f"      nrow: {args.nrow}")
+    print(f"    pruned: {args.nrow - len(keep)} ({1 - len(keep) / args.nrow:.1%})")
+    print(f"prefilter : {prefilter_s:.3f} s")
+    print(f"   cluster: {exact_s:.3f} s -> {pruned_s:.3f} s")
+    print(f"   speedup: {exact_s / (prefilter_s + pruned_s):.2f}x")
+    print(f"same peaks: {same} ({len(exact)} vs {len(pruned)})")
+    print(f"    recall: {recall:.1%}")
+    if len(exact):
+        print(f"brightest : {exact.index[np.argmax(exact['snr'])] in pruned.index}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Measure T2 cold start: wall time from launching run_socket_grex.py
+to its "Ready to receive" log line, with and without the warm-up gulp.
+
+python scripts/bench_startup.py --repeat 5
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+_script_dir = os.path.dirname(os.path.abspath(__file__))
+_script = os.path.join(_script_dir, "run_socket_grex.py")
+
+
+def time_to_ready(port, warmup=True, timeout=120.0):
+    """Launch T2 and return the seconds until it is ready to receive."""
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cmd = [
+            sys.executable,
+            _script,
+            "--outroot",
+            tmpdir + "/",
+            "--db-path",
+            os.path.join(tmpdir, "candidates.db"),
+            "--port",
+            str(port),
+        ]
+        if not warmup:
+            cmd.append("--no-warmup")
+
+        # make grex_t2 importable when it is not installed
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(
+            filter(None, [os.path.dirname(_script_dir), env.get("PYTHONPATH")])
+        )
+
+        t0 = time.perf_counter()
+        proc = subprocess.Popen(
+            cmd,
+            cwd=tmpdir,
+            env=env,
+            stderr=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            text=True,
+        )
+        try:
+            for line in proc.stderr:
+                if "Ready to receive" in line:
+                    return time.perf_counter() - t0
+                if time.perf_counter() - t0 > timeout:
+                    break
+            raise RuntimeError("T2 did not become ready")
+        finally:
+            proc.kill()
+            proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark T2 startup time")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--port", type=int, default=22345)
+    args = parser.parse_args()
+
+    for warmup in (False, True):
+        times = [time_to_ready(args.port, warmup=warmup) for _ in range(args.repeat)]
+        print(
+            f"warmup={warmup}: ready in min {min(times):.3f} s, "
+            f"mean {sum(times) / len(times):.3f} s over {args.repeat} runs"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Rows per second ingested from heimdall text lines against binary
+packets (grex_t2.wire), from gulp payload to CandidateBatch, including
+framing the packets into a gulp.
+
+python scripts/bench_wire.py --nrow 1000000
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from grex_t2 import framing, wire
+from grex_t2.candidates import CandidateBatch
+
+
+def make_text(nrow, seed=0):
+    rng = np.random.default_rng(seed)
+    itime = np.sort(rng.integers(0, 16384, nrow))
+    idm = rng.integers(0, 1024, nrow)
+    return "".join(
+        f"{snr:.4f} {it * 32} {it} {it * 1.048e-3:.6f} {ibox} {dm} {dm * 1.8:.4f} {beam}\n"
+        for snr, it, ibox, dm, beam in zip(
+            rng.uniform(7.0, 30.0, nrow),
+            itime,
+            rng.integers(0, 12, nrow),
+            idm,
+            rng.integers(0, 256, nrow),
+        )
+    )
+
+
+def best_of(func, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def frame(packets):
+    framer = framing.GulpFramer(max_bytes=None, max_span=None)
+    for packet in packets:
+        framer.feed(packet, 0.0)
+    ((payload, _, _),) = framer.feed(framing.END_OF_GULP, 0.0)
+    return payload
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark candidate ingestion")
+    parser.add_argument("--nrow", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    text = make_text(args.nrow)
+    text_packets = [line.encode() + b"\n" for line in text.splitlines()]
+    binary_packets = wire.encode(CandidateBatch.from_text(text))
+    payload = frame(binary_packets)
+
+    results = {
+        "text parse": best_of(lambda: CandidateBatch.from_text(text), args.repeat),
+        "binary parse": best_of(
+            lambda: CandidateBatch.from_records(wire.decode_records(payload)),
+            args.repeat,
+        ),
+        "text frame+parse": best_of(
+            lambda: CandidateBatch.from_text(frame(text_packets)), args.repeat
+        ),
+        "binary frame+parse": best_of(
+            lambda: CandidateBatch.from_records(
+                wire.decode_records(frame(binary_packets))
+            ),
+            args.repeat,
+        ),
+    }
+    print(
+        f"{args.nrow} rows, {len(text_packets)} text / {len(binary_packets)} binary packets"
+    )
+    for name, elapsed in results.items():
+        print(f"{name:>20}: {elapsed:.3f} s, {args.nrow / elapsed:.3g} rows/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Calibrate the hdbscan cost model (grex_t2.costmodel) on this machine:
+time every algorithm, leaf_size and core_dist_n_jobs setting on synthetic
+gulps of increasing size, fit a power law per setting and check that its
+cluster peaks agree with those of the default settings. Point
+"cluster": {"cost_model": ...} in the T2 config at the output.
+
+python scripts/calibrate_cluster.py --nrow 1000 3000 10000 30000 -o cost_model.json
+"""
+
+import argparse
+import os
+import platform
+import time
+
+import numpy as np
+
+from grex_t2 import cluster_heimdall, costmodel
+from grex_t2.config import DEFAULT_CONFIG
+
+from bench_approx_cluster import storm_gulp
+
+
+def bright_peaks(tab, labels, min_snr):
+    """(itime, idm, ibeam) of the cluster peaks above min_snr, and of the
+    brightest peak.
+    """
+
+    tab = tab.copy()
+    cluster_heimdall.assign_clusters(tab, labels)
+    peaks = cluster_heimdall.get_peak(tab)
+    keys = list(
+        zip(peaks["itime"].tolist(), peaks["idm"].tolist(), peaks["ibeam"].tolist())
+    )
+    brightest = keys[int(np.argmax(peaks["snr"]))] if keys else None
+    bright = {key for key, snr in zip(keys, peaks["snr"]) if snr >= min_snr}
+    return bright, brightest
+
+
+def agreement(reference, other):
+    """Jaccard index of two sets of bright peaks, 0 if their brightest
+    peak (the one that would trigger) differs.
+    """
+
+    (ref, ref_best), (peaks, best) = reference, other
+    if ref_best != best:
+        return 0.0
+    return len(ref & peaks) / max(len(ref | peaks), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--nrow", type=int, nargs="+", default=[1000, 3000, 10000, 30000]
+    )
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        default=10.0,
+        help="Skip larger gulps for a setting once a fit takes this long",
+    )
+    parser.add_argument(
+        "--min-agreement",
+        type=float,
+        default=0.95,
+        help="Peak agreement with the default settings to count as equivalent",
+    )
+    parser.add_argument("--min-snr", type=float, default=10.0)
+    parser.add_argument("-o", "--output", default="cost_model.json")
+    args = parser.parse_args()
+
+    import hdbscan
+
+    cluster = DEFAULT_CONFIG["cluster"]
+    params = dict(
+        metric="euclidean",
+        min_cluster_size=cluster["min_cluster_size"],
+        min_samples=cluster["min_samples"],
+        cluster_selection_method="eom",
+        cluster_selection_epsilon=cluster["cluster_selection_epsilon"],
+        allow_single_cluster=True,
+    )
+    grid = costmodel.settings_grid(
+        n_jobs=sorted(set(costmodel.CORE_DIST_N_JOBS) | {os.cpu_count()})
+    )
+    timings = [[] for _ in grid]
+    agreements = [[] for _ in grid]
+    ndim = len(cluster["selectcols"])
+    print(f"{os.cpu_count()} CPUs, {len(grid)} settings")
+    for nrow in sorted(args.nrow):
+        tab = storm_gulp(nrow, npulse=max(nrow // 500, 1), seed=nrow)
+        data = cluster_heimdall.cluster_features(tab, cluster["selectcols"])
+        peaks = {}
+        for i, settings in enumerate(grid):
+            if timings[i] and timings[i][-1][1] > args.max_seconds:
+                continue
+            best = np.inf
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                labels = hdbscan.HDBSCAN(**params, **settings).fit(data).labels_
+                best = min(best, time.perf_counter() - t0)
+            peaks[i] = bright_peaks(tab, labels, args.min_snr)
+            timings[i].append((nrow, best))
+            print(f"{nrow:>8} {settings}: {best:.3f} s")
+        # peaks of each setting against the default's on this gulp, if the
+        # default was not too slow to run
+        reference = peaks.get(grid.index(costmodel.DEFAULT))
+        for i, other in peaks.items():
+            if reference is not None:
+                agreements[i].append(agreement(reference, other))
+
+    entries = []
+    for settings, times, agree in zip(grid, timings, agreements):
+        if len(times) < 2:
+            print(f"Dropping {settings}: timed on fewer than two gulp sizes")
+            continue
+        nrows, seconds = zip(*times)
+        a, b = costmodel.fit_power_law(nrows, seconds)
+        entries.append(
+            {
+                "settings": settings,
+                "a": a,
+                "b": b,
+                "nrow_min": min(nrows),
+                "nrow_max": max(nrows),
+                "agreement": min(agree, default=0.0),
+                "equivalent": settings == costmodel.DEFAULT
+                or min(agree, default=0.0) >= args.min_agreement,
+            }
+        )
+    model = costmodel.CostModel(entries, ndim, machine=platform.node())
+    model.save(args.output)
+    for entry in entries:
+        print(
+            f"{entry['settings']}: t = {np.exp(entry['a']):.3g} * N^{entry['b']:.2f}, "
+            f"agreement {entry['agreement']:.3f}"
+            + ("" if entry["equivalent"] else " (not equivalent)")
+        )
+    for nrow in sorted(args.nrow):
+        settings, predicted = model.choose(nrow)
+        print(f"{nrow:>8} rows: {settings}, predicted {predicted:.3f} s")
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
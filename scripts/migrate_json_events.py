@@ -0,0 +1,33 @@
+"""Move the per-candidate JSON files of a T2 outroot into its per-day
+event log (grex_t2.eventlog), for "output": {"candidates": "log"}.
+
+python scripts/migrate_json_events.py /hdd/data/candidates/T2/ --remove
+"""
+
+import argparse
+import time
+
+from grex_t2 import eventlog
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("outroot")
+    parser.add_argument(
+        "--remove",
+        action="store_true",
+        help="Delete each JSON file once it reads back from the event log",
+    )
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    nlogged, nskipped = eventlog.migrate_json(args.outroot, remove=args.remove)
+    print(
+        f"Logged {nlogged} candidates ({nskipped} already logged) in "
+        f"{time.perf_counter() - t0:.1f} s; last name "
+        f"{eventlog.last_name(args.outroot)}"
+    )
+
+
+if __name__ == "__main__":
+    main()
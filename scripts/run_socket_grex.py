@@ -1,19 +1,16 @@
-import argparse
-import socket
-from grex_t2 import socket_grex, database
-import logging
+import time
 
-HOST = "127.0.0.1"
-PORT = 12345
+_T_START = time.perf_counter()
 
-# Setup logging to write to a file and stdout, with formatting
-# TODO Write to OpenTelemetry as well to collect logs for grafana
+import argparse  # noqa: E402
+import queue  # noqa: E402
+import signal  # noqa: E402
+import socket  # noqa: E402
+from grex_t2 import socket_grex, database, config, metrics, logs, pipeline  # noqa: E402
+import logging  # noqa: E402
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="[%(asctime)s] [%(levelname)s] %(message)s",
-    handlers=[logging.FileHandler("output.log"), logging.StreamHandler()],
-)
+HOST = "127.0.0.1"
+PORT = 12345
 
 
 def parse_args():
@@ -41,60 +38,122 @@ def parse_args():
         help="Path to SQLite database",
         required=False,
     )
+    parser.add_argument(
+        "--host",
+        type=str,
+        default=HOST,
+        help="Address to receive heimdall candidates on",
+        required=False,
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        nargs="+",
+        default=[PORT],
+        help="Port(s) to receive heimdall candidates on, one per heimdall stream",
+        required=False,
+    )
+    parser.add_argument(
+        "--config",
+        type=str,
+        default=None,
+        help="JSON file overriding the default T2 config (grex_t2/config.py)",
+        required=False,
+    )
+    parser.add_argument(
+        "--log-file",
+        type=str,
+        default="output.log",
+        help="Log file, rotated by size (or by --log-rotate-when)",
+        required=False,
+    )
+    parser.add_argument(
+        "--log-rotate-when",
+        type=str,
+        default=None,
+        help='Rotate the log file on time instead of size, e.g. "midnight"',
+        required=False,
+    )
+    parser.add_argument(
+        "--log-json",
+        action="store_true",
+        help="Write JSON log records with gulp ids and stage timings",
+    )
+    parser.add_argument(
+        "--no-warmup",
+        action="store_true",
+        help="Skip the warm-up gulp before binding the socket",
+    )
     return parser.parse_args()
 
 
 def main():
     args = parse_args()
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    # Create a UDP socket
-    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    # Ensure that you can reconnect
-    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    # Bind the socket to the port
-    server_address = (HOST, PORT)
-    s.bind(server_address)
+
+    # Log to a file and stdout from a background thread, so that slow disk
+    # writes do not hold up processing
+    # TODO Write to OpenTelemetry as well to collect logs for grafana
+    logs.setup_logging(
+        args.log_file, json_format=args.log_json, when=args.log_rotate_when
+    )
+    t2_config = config.load_config(args.config)
 
     # Connect to SQLite
     db_con = database.connect(args.db_path)
 
+    # restores the last checkpoint, including the start time used by warmup
+    runtime = socket_grex.T2Runtime(args.outroot, db_con, config=t2_config)
+
+    # Pay import and first-use costs before we start receiving
+    if not args.no_warmup:
+        socket_grex.warmup()
+
+    socks = []
+    for port in args.port:
+        # Create a UDP socket
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # Ensure that you can reconnect
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # Bind the socket to the port
+        server_address = (args.host, port)
+        s.bind(server_address)
+        socks.append(s)
+
+        logging.info(
+            "Connected to socket %s:%d. Triggering set to %s"
+            % (args.host, port, args.trigger)
+        )
     logging.info(
-        "Connected to socket %s:%d. Triggering set to %s" % (HOST, PORT, args.trigger)
+        f"Ready to receive after {time.perf_counter() - _T_START:.3f} s since start"
     )
 
-    last_trigger_time = 0.0
-    # Outer loop that runs as long as T2 is running
-    while True:
-        candstr_list = ""
-        cand_count = 0
-        # Inner loop for chunks of Heimdall output data
-        while True:
-            # Recieve 512 bytes
-            data, address = s.recvfrom(512)
-
-            # Waiting for end of text. When chunk is done, break inner loop
-            if len(data) == 1 and data == b"\x03":
-                break
-
-            candstr = data.decode("utf-8")
-
-            # Removing the \n from the end of line
-            candstr_list += candstr
-            cand_count += 1
-
-        logging.info(f"Number of candidates {cand_count}")
-
-        if cand_count > 0:
-            logging.info(f"Filtering, last trig was {last_trigger_time}")
-            last_trigger_time = socket_grex.filter_candidates(
-                candstr_list,
-                outroot=args.outroot,
-                db_con=db_con,
+    if runtime.profiler is not None:
+        # kill -USR1 <pid> profiles the next gulps with cProfile
+        signal.signal(
+            signal.SIGUSR1, lambda signum, frame: runtime.profiler.request_cprofile()
+        )
+
+    # gulps are received on a separate thread so that a slow gulp shows up
+    # as backlog (and load shedding) rather than dropped packets
+    gulps = queue.Queue()
+    socket_grex.start_receivers(socks, gulps, config=t2_config)
+
+    try:
+        workers = t2_config["pipeline"]["workers"]
+        if workers:
+            pipeline.process_gulps(
+                gulps,
+                runtime,
+                workers,
+                t2_config["pipeline"]["max_inflight"],
                 trigger=args.trigger,
-                last_trigger_time=last_trigger_time,
             )
-
-        continue
+        else:
+            socket_grex.process_gulps(gulps, runtime, trigger=args.trigger)
+    finally:
+        # make sure queued outputs reach disk on shutdown
+        runtime.close()
+        metrics.log_summary()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,120 @@
+"""Soak test for memory leaks: replay hours' worth of synthetic gulps
+through the T2 processing loop (parsing, clustering, filtering, JSON and
+.cand outputs and, with --trigger, trigger packets) and check that RSS
+stays flat after warm-up.
+
+python scripts/soak_memory.py --hours 6
+"""
+
+import argparse
+import logging
+import os
+import queue
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from grex_t2 import memory, socket_grex
+from grex_t2.config import load_config
+
+# itime samples per gulp and seconds per sample, for gulps per hour
+GULP_SAMPLES = 16384
+TSAMP = 1.048e-3
+
+
+def make_gulp(igulp, nrow, rng):
+    """Candidate text for gulp igulp: noise rows and one bright pulse."""
+
+    itime0 = igulp * GULP_SAMPLES
+    itime = itime0 + np.sort(rng.integers(0, GULP_SAMPLES, nrow))
+    idm = rng.integers(0, 1024, nrow)
+    snr = 7.0 + rng.exponential(1.0, nrow)
+    ibox = rng.integers(0, 12, nrow)
+    ibeam = rng.integers(0, 256, nrow)
+    npulse = min(40, nrow)
+    pulse = rng.choice(nrow, npulse, replace=False)
+    itime[pulse] = itime0 + GULP_SAMPLES // 2 + rng.integers(-2, 3, npulse)
+    idm[pulse] = 400 + rng.integers(-2, 3, npulse)
+    snr[pulse] = rng.uniform(15.0, 30.0, npulse)
+    ibox[pulse] = 4
+    ibeam[pulse] = 100
+    return "".join(
+        f"{s:.4f} {it * 32} {it} {it * TSAMP:.6f} {b} {d} {d * 1.8:.4f} {beam}\n"
+        for s, it, b, d, beam in zip(snr, itime, ibox, idm, ibeam)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--hours", type=float, default=6.0)
+    parser.add_argument("--nrow", type=int, default=2000, help="Rows per gulp")
+    parser.add_argument(
+        "--warmup", type=int, default=50, help="Gulps before RSS is compared"
+    )
+    parser.add_argument(
+        "--max-growth",
+        type=float,
+        default=16.0,
+        help="Largest RSS growth after warm-up, in MiB, before failing",
+    )
+    parser.add_argument("--trigger", action="store_true", help="Send triggers")
+    parser.add_argument("--trace", action="store_true", help="Enable tracemalloc")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    ngulp = int(args.hours * 3600 / (GULP_SAMPLES * TSAMP))
+    outroot = tempfile.mkdtemp(prefix="t2soak") + "/"
+    db_con = sqlite3.connect(os.path.join(outroot, "soak.db"))
+    db_con.execute("CREATE TABLE injection (mjd REAL)")
+    config = load_config()
+    config["memory"]["trace"] = args.trace
+    config["memory"]["window"] = min(config["memory"]["window"], ngulp)
+    config["profiling"]["enabled"] = False
+    runtime = socket_grex.T2Runtime(outroot, db_con, config=config)
+
+    # gulps are made as they are needed, so they do not count towards RSS
+    gulps = queue.Queue(maxsize=4)
+
+    def feed():
+        rng = np.random.default_rng(0)
+        for igulp in range(ngulp):
+            candstr = make_gulp(igulp, args.nrow, rng)
+            gulps.put((candstr, args.nrow, time.perf_counter()))
+        gulps.put(None)
+
+    records = []
+
+    def report(record):
+        records.append(record)
+        if len(records) % 100 == 0:
+            print(f"gulp {len(records)}/{ngulp}: RSS {record['rss'] / 1024**2:.1f} MiB")
+
+    print(f"Replaying {ngulp} gulps ({args.hours} h) of {args.nrow} rows")
+    t0 = time.perf_counter()
+    threading.Thread(target=feed, daemon=True).start()
+    try:
+        socket_grex.process_gulps(gulps, runtime, trigger=args.trigger, on_gulp=report)
+    finally:
+        runtime.close()
+
+    warmup = min(args.warmup, len(records) // 2)
+    rss = np.array([record["rss"] for record in records[warmup:]], dtype=float)
+    slope, grew = memory.growth(rss)
+    total = (rss.max() - rss[0]) / 1024**2
+    print(
+        f"{len(records)} gulps in {time.perf_counter() - t0:.1f} s; after warm-up "
+        f"RSS {rss[0] / 1024**2:.1f} -> {rss[-1] / 1024**2:.1f} MiB "
+        f"(max growth {total:.1f} MiB, slope {slope / 1024:.2f} KiB/gulp)"
+    )
+    if total > args.max_growth or runtime.memory.leak:
+        print("FAIL: memory grew")
+        sys.exit(1)
+    print("OK: memory flat")
+
+
+if __name__ == "__main__":
+    main()
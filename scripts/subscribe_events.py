@@ -0,0 +1,41 @@
+"""Print the candidate events published by a running T2 (the "events"
+config section), one line per gulp.
+
+python scripts/subscribe_events.py unix:/tmp/t2_events.sock
+"""
+
+import argparse
+import json
+
+from grex_t2 import events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("address", help="unix:PATH or tcp:HOST:PORT")
+    parser.add_argument(
+        "--json", action="store_true", help="Print each message as JSON"
+    )
+    args = parser.parse_args()
+
+    for message in events.subscribe(args.address):
+        if args.json:
+            print(json.dumps(message), flush=True)
+            continue
+        peaks = message["peaks"]
+        best = max(range(message["npeak"]), key=lambda i: peaks["snr"][i], default=None)
+        line = f"gulp {message['gulp']}: {message['npeak']} peaks"
+        if best is not None:
+            line += (
+                f", brightest snr {peaks['snr'][best]:.1f} at DM "
+                f"{peaks['dm'][best]:.1f}, MJD {peaks['mjds'][best]:.8f}"
+            )
+        if message["candname"] is not None:
+            line += f", candidate {message['candname']}"
+            line += " (triggered)" if message["triggered"] else ""
+            line += " (injection)" if message["injection"] else ""
+        print(line, flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Summarise the slow-gulp profiles captured by grex_t2.profiling by
+stage: how often and how long each stage ran in the captured gulps, and
+the functions it was sampled in.
+
+python scripts/summarise_profiles.py /hdd/data/candidates/T2/profiles
+"""
+
+import argparse
+import glob
+import os
+import pstats
+
+from grex_t2 import profiling
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("path", help="Profile directory or capture JSON file")
+    parser.add_argument("--top", type=int, default=10, help="Functions per stage")
+    parser.add_argument(
+        "--cprofile",
+        action="store_true",
+        help="Also print the top cumulative functions of cProfile captures",
+    )
+    args = parser.parse_args()
+
+    if os.path.isdir(args.path):
+        paths = sorted(glob.glob(os.path.join(args.path, "gulp*.json")))
+    else:
+        paths = [args.path]
+    captures = profiling.read_captures(paths)
+    if not captures:
+        print(f"No profile captures in {args.path}")
+        return
+
+    wall = [capture["wall_s"] for capture in captures]
+    print(
+        f"{len(captures)} captures, wall time mean {sum(wall) / len(wall):.3f} s, "
+        f"max {max(wall):.3f} s"
+    )
+    for stage, entry in profiling.summarise(captures, top=args.top).items():
+        print(
+            f"\n{stage}: {entry['share']:.1%} of wall time, "
+            f"total {entry['total_s']:.3f} s, max {entry['max_s']:.3f} s "
+            f"in {entry['captures']} captures"
+        )
+        for function, count in entry["functions"]:
+            print(f"  {count:8d}  {function}")
+
+    if args.cprofile:
+        files = [c["cprofile_file"] for c in captures if c.get("cprofile_file")]
+        files = [f for f in files if os.path.exists(f)]
+        if files:
+            print()
+            pstats.Stats(*files).sort_stats("cumulative").print_stats(args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Train the linear peak classifier (grex_t2.classify.LinearModel) on
+synthetic clusters, report its accuracy and the per-gulp latency of
+feature extraction and scoring, and write the model. Point "classify":
+{"model": ...} in the T2 config at the output.
+
+The synthetic pulses sit in one or two adjacent beams with a narrow DM
+extent and an snr that falls off away from the peak boxcar; the RFI
+spreads over many beams, low or wide DMs and every boxcar. It is a
+starting model, to be replaced by one fitted (classify.fit_logistic) on
+labelled peaks from the telescope.
+
+python scripts/train_classifier.py --nclusters 20000 -o classifier.json
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from grex_t2 import classify
+from grex_t2.candidates import CandidateBatch
+
+
+def pulse(rng):
+    nrow = rng.integers(5, 80)
+    dm_peak = rng.uniform(50.0, 1500.0)
+    ibox_peak = rng.integers(1, 9)
+    ibox = np.clip(ibox_peak + rng.integers(-2, 3, nrow), 0, classify.NBOX - 1)
+    ddm = rng.uniform(-0.05, 0.05, nrow)
+    snr = (
+        rng.uniform(10.0, 60.0)
+        * (1.0 - 0.15 * np.abs(ibox - ibox_peak))
+        * (1.0 - 5.0 * np.abs(ddm))
+        * rng.uniform(0.8, 1.0, nrow)
+    )
+    return {
+        "snr": snr,
+        "itime": rng.integers(0, 16384) + rng.integers(-4, 5, nrow) * 2**ibox_peak,
+        "ibox": ibox,
+        "dm": dm_peak * (1.0 + ddm),
+        "ibeam": rng.integers(0, 255) + rng.integers(0, 2, nrow),
+    }
+
+
+def rfi(rng):
+    nrow = rng.integers(10, 300)
+    if rng.random() < 0.5:
+        dm = rng.uniform(0.0, 80.0, nrow)
+    else:
+        dm = rng.uniform(0.0, 2000.0, nrow)
+    nbeam = rng.integers(4, 256)
+    return {
+        "snr": rng.uniform(8.0, 40.0) * rng.uniform(0.6, 1.0, nrow),
+        "itime": rng.integers(0, 16384) + rng.integers(-200, 200, nrow),
+        "ibox": rng.integers(0, classify.NBOX, nrow),
+        "dm": dm,
+        "ibeam": rng.choice(256, nbeam, replace=False)[rng.integers(0, nbeam, nrow)],
+    }
+
+
+def synthetic_gulp(nclusters, seed=0):
+    """Clustered candidates of nclusters synthetic clusters (cl is the
+    cluster number), and the label of each (1 pulse, 0 RFI).
+    """
+
+    rng = np.random.default_rng(seed)
+    labels = (rng.random(nclusters) < 0.5).astype(int)
+    clusters = [pulse(rng) if label else rfi(rng) for label in labels]
+    cols = {name: np.concatenate([c[name] for c in clusters]) for name in clusters[0]}
+    cols["idm"] = np.round(cols["dm"] / 1.8).astype(int)
+    cols["mjds"] = cols["itime"] * 1.048e-3
+    cols["cl"] = np.repeat(np.arange(nclusters), [len(c["snr"]) for c in clusters])
+    return CandidateBatch.from_columns(cols), labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--nclusters", type=int, default=20000)
+    parser.add_argument("--npeaks", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--min-score", type=float, default=0.5)
+    parser.add_argument("-o", "--output", default="classifier.json")
+    args = parser.parse_args()
+
+    tab, labels = synthetic_gulp(args.nclusters)
+    weights, bias, mean, scale = classify.fit_logistic(
+        classify.peak_features(tab), labels
+    )
+    model = classify.LinearModel(classify.FEATURES, weights, bias, mean, scale)
+    model.save(args.output)
+
+    test, test_labels = synthetic_gulp(args.nclusters // 4, seed=1)
+    passed = model.score(classify.peak_features(test)) >= args.min_score
+    print(
+        f"Held-out pulses kept {passed[test_labels == 1].mean():.3f}, "
+        f"RFI kept {passed[test_labels == 0].mean():.3f}"
+    )
+
+    classifier = classify.Classifier(model, args.min_score)
+    for npeak in args.npeaks:
+        gulp, _ = synthetic_gulp(npeak, seed=2)
+        best = np.inf
+        for _ in range(5):
+            t0 = time.perf_counter()
+            classifier.score(gulp)
+            best = min(best, time.perf_counter() - t0)
+        print(f"{npeak:>8} peaks ({len(gulp)} rows): {1e3 * best:.2f} ms per gulp")
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
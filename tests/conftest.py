@@ -0,0 +1,32 @@
+import sqlite3
+import pytest
+from grex_t2 import socket_grex
+from grex_t2.config import load_config
+
+
+@pytest.fixture
+def db_con():
+    """In-memory database with an empty injection table."""
+
+    con = sqlite3.connect(":memory:")
+    con.execute("CREATE TABLE injection (mjd REAL)")
+    yield con
+    con.close()
+
+
+@pytest.fixture
+def make_runtime(db_con):
+    """Factory of T2Runtime(outroot, db_con, config) processing in the
+    foreground, with the db_con fixture and the default config unless
+    given.
+    """
+
+    def make(outroot, config=None):
+        return socket_grex.T2Runtime(
+            outroot,
+            db_con,
+            config=load_config() if config is None else config,
+            background=False,
+        )
+
+    return make
@@ -0,0 +1,100 @@
+import numpy as np
+from grex_t2 import cluster_heimdall
+from grex_t2.candidates import CandidateBatch
+
+
+def make_gulp(nnoise=3000, npulse=10, rows_per_pulse=30, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = np.repeat(
+        np.column_stack(
+            [
+                rng.integers(0, 16384, npulse),
+                rng.integers(100, 1024, npulse),
+                rng.integers(2, 10, npulse),
+                rng.integers(0, 256, npulse),
+            ]
+        ),
+        rows_per_pulse,
+        axis=0,
+    )
+    pulses = centres + rng.integers(-2, 3, centres.shape)
+    noise = np.column_stack(
+        [
+            rng.integers(0, 16384, nnoise),
+            rng.integers(0, 1024, nnoise),
+            rng.integers(0, 12, nnoise),
+            rng.integers(0, 256, nnoise),
+        ]
+    )
+    feats = np.concatenate([noise, pulses])
+    snr = np.concatenate(
+        [
+            7.0 + rng.exponential(1.0, nnoise),
+            np.repeat(rng.uniform(15.0, 60.0, npulse), rows_per_pulse)
+            * rng.uniform(0.5, 1.0, npulse * rows_per_pulse),
+        ]
+    )
+    return CandidateBatch.from_columns(
+        {
+            "snr": snr,
+            "if": feats[:, 0] * 32,
+            "itime": feats[:, 0],
+            "mjds": feats[:, 0] * 1.048e-3,
+            "ibox": feats[:, 2],
+            "idm": feats[:, 1],
+            "dm": feats[:, 1] * 1.8,
+            "ibeam": feats[:, 3],
+        }
+    )
+
+
+def test_subsample_keeps_bright_rows():
+    snr = np.concatenate([np.full(900, 8.0), np.full(100, 20.0)])
+    ifit = cluster_heimdall.subsample_rows(snr, 300, 12.0)
+    assert len(ifit) == 300
+    assert np.all(np.isin(np.arange(900, 1000), ifit))
+    assert len(np.unique(ifit)) == 300
+
+
+def test_approx_cluster():
+    tab = make_gulp()
+    cluster_heimdall.cluster_data(tab, approx_min_rows=1000, approx_fit_rows=1000)
+    assert len(tab["cl"]) == len(tab)
+    assert len(cluster_heimdall.get_peak(tab))
+
+    report = cluster_heimdall.approx_quality(
+        make_gulp(), min_snr=14.0, approx_fit_rows=1000
+    )
+    assert report["brightest_match"]
+    assert report["peak_recall"] >= 0.8
+
+
+def test_coalesce_rows():
+    # one pulse seen at four boxcars, a fainter one in another DM bin and
+    # a row in another beam
+    tab = CandidateBatch.from_columns(
+        {
+            "snr": [10.0, 15.0, 12.0, 9.0, 8.0, 20.0],
+            "if": np.zeros(6),
+            "itime": [100, 101, 103, 105, 100, 100],
+            "mjds": np.zeros(6),
+            "ibox": [1, 2, 3, 4, 1, 1],
+            "idm": [40, 40, 41, 40, 50, 40],
+            "dm": np.zeros(6),
+            "ibeam": [3, 3, 3, 3, 3, 4],
+        }
+    )
+    rep, inverse, multiplicity = cluster_heimdall.coalesce_rows(tab, 16, 2)
+    assert np.array_equal(rep, [1, 4, 5])
+    assert np.array_equal(inverse, [0, 0, 0, 0, 1, 2])
+    assert np.array_equal(multiplicity, [4, 1, 1])
+
+
+def test_coalesce_cluster():
+    tab = make_gulp()
+    cluster_heimdall.cluster_data(tab, coalesce_time_bin=8, coalesce_dm_bin=2)
+    rep, inverse, _ = cluster_heimdall.coalesce_rows(tab, 8, 2)
+    cl = np.asarray(tab["cl"])
+    assert np.array_equal(cl, cl[rep][inverse])
+    # every peak is a representative, so no detection is reported twice
+    assert np.all(np.isin(cluster_heimdall.peak_indices(cl, tab["snr"]), rep))
@@ -0,0 +1,72 @@
+import os.path
+import numpy as np
+from grex_t2 import beams, metrics, replay
+from grex_t2.candidates import CandidateBatch
+from grex_t2.config import load_config
+
+_install_dir = os.path.abspath(os.path.dirname(__file__))
+
+
+def make_gulp(counts, seed=0):
+    """Columns of a gulp with counts[beam] candidates in each beam."""
+
+    rng = np.random.default_rng(seed)
+    ibeam = np.repeat(np.arange(len(counts)), counts)
+    return {"ibeam": ibeam, "snr": rng.uniform(6.5, 9.0, len(ibeam))}
+
+
+def test_beam_stats():
+    counts, snr_counts = beams.beam_stats(
+        {"ibeam": np.array([0, 0, 3]), "snr": np.array([5.0, 7.5, 60.0])}, nbeam=4
+    )
+    assert counts.tolist() == [2, 0, 0, 1]
+    assert snr_counts.shape == (4, len(beams.SNR_EDGES) + 1)
+    assert snr_counts[0, 0] == 1 and snr_counts[0, 2] == 1
+    assert snr_counts[3, -1] == 1
+
+
+def test_mask_hysteresis():
+    monitor = beams.BeamMonitor(nbeam=16, halflife=2.0, min_rate=20.0, min_gulps=3)
+    quiet = np.full(16, 5)
+    hot = quiet.copy()
+    hot[7] = 500
+    for i in range(3):
+        masked, _ = monitor.update(*beams.beam_stats(make_gulp(hot, i), nbeam=16))
+    assert masked.tolist() == [7]
+    assert np.flatnonzero(monitor.mask).tolist() == [7]
+    assert monitor.snapshot()["masked"] == [7]
+
+    # the rate decays through the mask threshold before the beam is released
+    history = []
+    for i in range(12):
+        monitor.update(*beams.beam_stats(make_gulp(quiet, i), nbeam=16))
+        history.append((monitor.rates[7] > monitor.threshold, monitor.mask[7]))
+    assert (False, True) in history
+    assert not monitor.mask.any()
+
+
+def test_mask_rows():
+    tab = CandidateBatch.from_columns({"ibeam": [0, 1, 2, 1], "snr": [1, 2, 3, 4]})
+    kept = beams.mask_rows(tab, np.array([False, True, False]))
+    assert kept["ibeam"].tolist() == [0, 2]
+
+
+def test_replay_hot_beam(tmp_path, make_runtime):
+    with open(os.path.join(_install_dir, "data/giants_1.cand")) as f:
+        gulps = replay.split_gulps(f.read())
+    # beam 30 rings at low snr in every gulp
+    hot = "".join(f"6.5 0 {4096 + i} 0.5 0 {i % 256} 5.0 30\n" for i in range(3000))
+    gulps = [gulp + hot for gulp in gulps]
+
+    config = load_config()
+    config["beams"].update(enabled=True, halflife=1.0, min_gulps=2)
+    outroot = str(tmp_path) + "/"
+    runtime = make_runtime(outroot, config)
+    before = metrics.snapshot()["counters"].get("beam_rows_masked", 0)
+    try:
+        replay.replay(gulps, runtime)
+    finally:
+        runtime.close()
+    assert runtime.beams.mask[30]
+    assert np.count_nonzero(runtime.beams.mask) == 1
+    assert metrics.snapshot()["counters"]["beam_rows_masked"] > before
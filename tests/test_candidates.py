@@ -0,0 +1,42 @@
+import os.path
+import numpy as np
+from astropy.io import ascii
+from grex_t2 import cluster_heimdall
+from grex_t2.candidates import CandidateBatch, col_heimdall
+
+_install_dir = os.path.abspath(os.path.dirname(__file__))
+candsfile = os.path.join(_install_dir, "data/giants.cand")
+
+
+def test_from_text():
+    batch = CandidateBatch.from_text(open(candsfile).read())
+    tab = ascii.read(candsfile, names=col_heimdall, format="no_header")
+    assert len(batch) == len(tab) == 3411
+    for col in col_heimdall:
+        assert np.allclose(batch[col], tab[col])
+    assert batch["ibeam"].dtype == np.int64
+    assert (batch["cl"] == -1).all() and (batch["trigger"] == "0").all()
+
+
+def test_selection_is_view():
+    batch = CandidateBatch.from_text(open(candsfile).read())
+    sel = batch[batch["snr"] > 20]
+    sub = sel[:3]
+    assert np.shares_memory(sub._columns["snr"], batch._columns["snr"])
+    sub["cl"] = [7, 8, 9]
+    assert list(batch["cl"][sub.index]) == [7, 8, 9]
+    assert sel[0]["snr"] == sel["snr"][0]
+    assert len(sub.to_table()) == 3
+
+
+def test_peak_matches_table():
+    text = open(candsfile).read()
+    batch = CandidateBatch.from_text(text)
+    tab = ascii.read(candsfile, names=col_heimdall, format="no_header")
+    cl = np.arange(len(tab)) // 50
+    cl[::7] = -1
+    cluster_heimdall.assign_clusters(batch, cl)
+    cluster_heimdall.assign_clusters(tab, cl)
+    peaks = cluster_heimdall.get_peak(batch)
+    assert np.array_equal(peaks["snr"], cluster_heimdall.get_peak(tab)["snr"])
+    assert np.array_equal(batch["cntc"], tab["cntc"])
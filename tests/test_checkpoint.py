@@ -0,0 +1,82 @@
+import os.path
+from grex_t2 import (
+    checkpoint,
+    cluster_heimdall,
+    eventlog,
+    metrics,
+    names,
+    replay,
+)
+from grex_t2.config import load_config
+
+_install_dir = os.path.abspath(os.path.dirname(__file__))
+
+
+def recent_config():
+    config = load_config()
+    config["recent"]["port"] = 0
+    return config
+
+
+def test_save_load(tmp_path):
+    path = str(tmp_path / "ckpt")
+    assert checkpoint.load(path) is None
+    checkpoint.save(path, {"version": checkpoint.VERSION, "lastname": "230225aaab"})
+    assert checkpoint.load(path)["lastname"] == "230225aaab"
+    assert not os.path.exists(path + ".tmp")
+
+    checkpoint.save(path, {"version": checkpoint.VERSION + 1})
+    assert checkpoint.load(path) is None
+    with open(path, "w") as f:
+        f.write('{"version": 1, "lastn')
+    assert checkpoint.load(path) is None
+
+
+def test_check_lastname(tmp_path):
+    outroot = str(tmp_path)
+    assert checkpoint.name_mjd("230225aaab") == 60000.5
+    assert not checkpoint.check_lastname(outroot, "230225aaab", now_mjd=60000.5)
+    (tmp_path / "230225aaab.json").write_text("{}")
+    assert checkpoint.check_lastname(outroot, "230225aaab", now_mjd=60000.5)
+    # a candidate named after the checkpoint, on the same or a later day
+    (tmp_path / "230226aaaa.json").write_text("{}")
+    assert not checkpoint.check_lastname(outroot, "230225aaab", now_mjd=60001.5)
+    (tmp_path / "230225aaac.json").write_text("{}")
+    assert not checkpoint.check_lastname(outroot, "230225aaab", now_mjd=60000.5)
+
+
+def test_restart(tmp_path, db_con, make_runtime):
+    outroot = str(tmp_path) + "/"
+    db_con.execute("INSERT INTO injection VALUES (60000.0)")
+    with open(_install_dir + "/data/giants_1.cand", "r") as f:
+        gulps = replay.split_gulps(f.read())[:3]
+
+    runtime = make_runtime(outroot, recent_config())
+    try:
+        replay.replay(gulps, runtime)
+    finally:
+        runtime.close()
+    state = checkpoint.load(outroot + checkpoint.FILENAME)
+    assert state["lastname"] == runtime.lastname
+    assert state["injections"] == {"high_water": 1, "mjds": [60000.0]}
+    assert state["start_time"]["value"] == cluster_heimdall.get_start_time()
+
+    restarted = make_runtime(outroot, recent_config())
+    restarted.close()
+    assert restarted.lastname == runtime.lastname
+    assert restarted.injections.high_water == 1
+    assert len(restarted.recent) == len(runtime.recent) > 0
+
+    # a candidate written after the checkpoint, so the name is read from
+    # outroot again
+    later = names.increment_name(
+        checkpoint.name_mjd(runtime.lastname), runtime.lastname
+    )
+    eventlog.append(outroot, later, {"mjds": 60000.5})
+    mismatches = metrics.snapshot()["counters"].get("checkpoint_lastname_mismatch", 0)
+    rescanned = make_runtime(outroot, recent_config())
+    rescanned.close()
+    assert rescanned.lastname == later
+    assert (
+        metrics.snapshot()["counters"]["checkpoint_lastname_mismatch"] == mismatches + 1
+    )
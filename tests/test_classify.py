@@ -0,0 +1,132 @@
+import os.path
+import time
+import numpy as np
+import pytest
+from grex_t2 import classify, cluster_heimdall, metrics, socket_grex
+from grex_t2.candidates import CandidateBatch
+from grex_t2.config import load_config
+
+_install_dir = os.path.abspath(os.path.dirname(__file__))
+
+
+def make_peaks():
+    """Two clusters (labels 3 and 1) and two unclustered rows."""
+
+    return CandidateBatch.from_columns(
+        {
+            "snr": [9.0, 20.0, 8.0, 12.0, 15.0, 11.0, 15.0],
+            "itime": [100, 102, 500, 104, 501, 900, 503],
+            "ibox": [1, 2, 0, 3, 0, 4, 1],
+            "idm": [10, 11, 40, 12, 40, 70, 42],
+            "dm": [100.0, 110.0, 400.0, 120.0, 400.0, 700.0, 420.0],
+            "ibeam": [5, 5, 60, 6, 61, 7, 90],
+            "cl": [3, 3, -1, 3, 1, -1, 1],
+        }
+    )
+
+
+def reject_all():
+    return classify.LinearModel(["snr_peak"], [0.0], bias=-10.0)
+
+
+def test_peak_features():
+    tab = make_peaks()
+    X = classify.peak_features(tab)
+    peaks = cluster_heimdall.get_peak(tab)
+    assert X.shape == (len(peaks), len(classify.FEATURES))
+    column = {name: X[:, i] for i, name in enumerate(classify.FEATURES)}
+    # cluster 1, cluster 3, then the unclustered rows, as get_peak
+    assert column["snr_peak"].tolist() == peaks["snr"].tolist() == [15, 20, 8, 11]
+    assert column["dm_peak"].tolist() == peaks["dm"].tolist()
+    assert column["ibox_peak"].tolist() == [0, 2, 0, 4]
+    assert column["nbeam"].tolist() == [2, 2, 1, 1]
+    assert column["beam_span"].tolist() == [29, 1, 0, 0]
+    assert column["ndm"].tolist() == [2, 3, 1, 1]
+    assert column["time_extent"].tolist() == [2, 4, 0, 0]
+    assert column["log_ncand"] == pytest.approx(np.log10([2, 3, 1, 1]))
+    assert column["dm_extent"][1] == pytest.approx(20.0 / 110.0)
+    assert column["snr_mean_ratio"][1] == pytest.approx(41.0 / 3 / 20.0)
+    assert column["snr_box1"].tolist() == [1.0, 9.0 / 20.0, 0, 0]
+    assert column["snr_box3"][1] == pytest.approx(12.0 / 20.0)
+
+
+def test_linear_model(tmp_path):
+    X = np.column_stack([np.r_[np.zeros(50), np.ones(50)], np.arange(100) % 7])
+    y = np.r_[np.zeros(50), np.ones(50)]
+    model = classify.LinearModel(["nbeam", "ndm"], *classify.fit_logistic(X, y))
+    assert ((model.score(X) > 0.5) == y).all()
+
+    path = str(tmp_path / "classifier.json")
+    model.save(path)
+    loaded = classify.load_model(path)
+    assert loaded.features == ["nbeam", "ndm"]
+    assert loaded.score(X) == pytest.approx(model.score(X))
+    assert classify.load_model(f"{__name__}:reject_all").bias == -10.0
+
+    with pytest.raises(ValueError):
+        classify.Classifier(classify.LinearModel(["width"], [1.0]))
+
+
+def test_budget():
+    tab = make_peaks()
+    classifier = classify.Classifier(reject_all(), budget_s=None)
+    assert classifier.score(tab).shape == (4,)
+    assert classifier.seconds_per_peak is not None
+
+    fallbacks = metrics.registry.counters.get("classify_fallback", 0)
+    classifier.budget_s = 0.0
+    assert classifier.score(tab) is None
+    assert metrics.registry.counters["classify_fallback"] == fallbacks + 1
+
+    # overran once, then skipped on the cost predicted from earlier gulps
+    classifier = classify.Classifier(reject_all(), budget_s=0.0)
+    assert classifier.score(tab) is None
+    assert classifier.seconds_per_peak is not None
+    classifier.model = None
+    assert classifier.score(tab) is None
+
+
+class SlowOnce:
+    """reject_all, taking delay seconds on its first call."""
+
+    features = ["snr_peak"]
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.ncall = 0
+
+    def score(self, X):
+        self.ncall += 1
+        if self.ncall == 1:
+            time.sleep(self.delay)
+        return reject_all().score(X)
+
+
+def test_budget_recovers():
+    tab = make_peaks()
+    model = SlowOnce(0.06)
+    classifier = classify.Classifier(model, budget_s=0.05, probe_every=3)
+    # the slow call, then gulps skipped on its cost until a probe
+    assert [classifier.score(tab) is None for _ in range(5)] == [True] * 4 + [False]
+    assert model.ncall == 2
+    assert all(classifier.score(tab) is not None for _ in range(20))
+    assert model.ncall == 22
+
+
+def test_cluster_gulp_classify():
+    with open(_install_dir + "/data/giants_1.cand", "r") as f:
+        candstr = f.read()
+    config = load_config()
+    tab2, tab3, rejected = socket_grex.cluster_gulp(candstr, config)
+    assert len(tab3) and "classifier" not in rejected
+
+    config["classify"]["model"] = f"{__name__}:reject_all"
+    tab2, tab3, rejected = socket_grex.cluster_gulp(candstr, config)
+    assert not len(tab3)
+    assert rejected["classifier"] == len(tab2)
+    assert (tab2["score"] < 1e-4).all()
+
+    # over budget: the cuts alone decide
+    config["classify"]["budget_s"] = 0.0
+    _, tab3, rejected = socket_grex.cluster_gulp(candstr, config)
+    assert len(tab3) and "classifier" not in rejected
@@ -43,8 +43,8 @@ def test_filter(tab):
     assert len(tab2) == 0
 
 
-def test_json(tab):
-    outfile = os.path.join(_install_dir, "trigger.json")
+def test_json(tab, tmp_path):
+    outfile = str(tmp_path / "trigger.json")
     cluster_heimdall.cluster_data(tab, return_clusterer=False)
 
     tab2 = cluster_heimdall.get_peak(tab)
@@ -53,8 +53,8 @@ def test_json(tab):
     assert os.path.exists(outfile)
 
 
-def test_cand(tab):
-    outfile = os.path.join(_install_dir, "output.cand")
+def test_cand(tab, tmp_path):
+    outfile = str(tmp_path / "output.cand")
     cluster_heimdall.cluster_data(tab, return_clusterer=False)
 
     tab2 = cluster_heimdall.get_peak(tab)
@@ -62,13 +62,27 @@ def test_cand(tab):
     assert os.path.exists(outfile)
 
 
-def test_plot_dmhist(tab):
-    plotting.plot_dm_hist(tab, plot_dir=os.path.join(_install_dir, "plot_"))
+def test_plot_dmhist(tab, tmp_path):
+    plotting.plot_dm_hist(tab, plot_dir=str(tmp_path / "plot_"))
 
 
-def test_plot_bt(tab):
-    plotting.plot_beam_time(tab, plot_dir=os.path.join(_install_dir, "plot_"))
+def test_plot_bt(tab, tmp_path):
+    plotting.plot_beam_time(tab, plot_dir=str(tmp_path / "plot_"))
 
 
-def test_giantst(tab):
-    plotting.plot_giants(tab, plot_dir=os.path.join(_install_dir, "plot_"))
+def test_giantst(tab, tmp_path):
+    plotting.plot_giants(tab, plot_dir=str(tmp_path / "plot_"))
+
+
+def test_bin_candidates(tab):
+    binned = plotting.bin_candidates(tab)
+    assert binned["time_dm"].sum() == len(tab)
+    assert binned["snr_dm"].sum() == len(tab)
+    assert binned["beam_time"].sum() == len(tab)
+    assert binned["beam_dm"].sum() == len(tab)
+    assert len(plotting.brightest(tab, 10)) == 10
+
+
+def test_giants_aggregate(tab, tmp_path):
+    plotting.plot_giants(tab, plot_dir=str(tmp_path / "plot_agg_"), aggregate=True)
+    assert (tmp_path / "plot_agg_giants_dm_time_snr.pdf").exists()
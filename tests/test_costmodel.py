@@ -0,0 +1,60 @@
+import os.path
+import numpy as np
+import pytest
+from grex_t2 import cluster_heimdall, costmodel
+from grex_t2.candidates import CandidateBatch
+
+_install_dir = os.path.abspath(os.path.dirname(__file__))
+
+
+def entry(settings, a, b, equivalent=True):
+    return {"settings": settings, "a": a, "b": b, "equivalent": equivalent}
+
+
+def test_settings_grid():
+    grid = costmodel.settings_grid(n_jobs=[4, 1])
+    assert grid[0] == costmodel.DEFAULT
+    assert all(
+        s["core_dist_n_jobs"] == 1 for s in grid if s["algorithm"] == "prims_kdtree"
+    )
+    assert len(grid) == 15
+
+
+def test_fit_power_law():
+    nrows = np.array([1000, 3000, 10000, 30000])
+    a, b = costmodel.fit_power_law(nrows, 2e-6 * nrows**1.3)
+    assert b == pytest.approx(1.3)
+    assert np.exp(a) == pytest.approx(2e-6)
+
+
+def test_choose():
+    fast_small = {"algorithm": "prims_kdtree", "leaf_size": 40, "core_dist_n_jobs": 1}
+    fastest = {"algorithm": "boruvka_balltree", "leaf_size": 20, "core_dist_n_jobs": 1}
+    model = costmodel.CostModel(
+        [
+            entry(costmodel.DEFAULT, np.log(1e-5), 1.2),
+            entry(fast_small, np.log(1e-7), 1.8),
+            entry(fastest, np.log(1e-9), 1.0, equivalent=False),
+        ]
+    )
+    # prims wins on small gulps, the default on large ones
+    assert model.choose(100)[0] == fast_small
+    settings, predicted = model.choose(100000)
+    assert settings == costmodel.DEFAULT
+    assert predicted == pytest.approx(1e-5 * 100000**1.2)
+
+
+def test_cluster_data_cost_model(tmp_path):
+    path = str(tmp_path / "cost_model.json")
+    settings = {"algorithm": "boruvka_balltree", "leaf_size": 20, "core_dist_n_jobs": 1}
+    costmodel.CostModel([entry(settings, np.log(1e-6), 1.0)]).save(path)
+    assert costmodel.get_model(str(tmp_path / "missing.json")) is None
+
+    with open(_install_dir + "/data/giants_1.cand", "r") as f:
+        tab = CandidateBatch.from_text(f.read())
+    clusterer = cluster_heimdall.cluster_data(
+        tab, return_clusterer=True, cost_model=path
+    )
+    assert clusterer.algorithm == "boruvka_balltree"
+    assert clusterer.leaf_size == 20
+    assert clusterer.core_dist_n_jobs == 1
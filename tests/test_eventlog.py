@@ -0,0 +1,90 @@
+import os.path
+from grex_t2 import cluster_heimdall, eventlog, names
+
+
+def fields(mjd, snr=12.0):
+    return {"mjds": mjd, "snr": snr, "ibox": 2, "dm": 300.0, "ibeam": 7, "specnum": 1}
+
+
+def test_append_lookup(tmp_path):
+    outroot = str(tmp_path) + "/"
+    assert eventlog.last_name(outroot) is None
+    for candname, mjd in [
+        ("230225aaaa", 60000.1),
+        ("230225aaab", 60000.2),
+        ("230225aaad", 60000.4),
+        ("230226aaaa", 60001.1),
+    ]:
+        eventlog.append(outroot, candname, fields(mjd))
+
+    assert eventlog.lookup(outroot, "230225aaab") == {
+        "candname": "230225aaab",
+        **fields(60000.2),
+    }
+    assert eventlog.lookup(outroot, "230225aaac") is None
+    assert eventlog.lookup(outroot, "230225aaaz") is None
+    assert eventlog.lookup(outroot, "230301aaaa") is None
+    assert eventlog.find_mjd(outroot, 60000.39)["candname"] == "230225aaad"
+    assert eventlog.find_mjd(outroot, 60000.3, tol=0.01) is None
+    assert eventlog.days(outroot) == ["230225", "230226"]
+    assert [e["candname"] for e in eventlog.iter_events(outroot, "230225")] == [
+        "230225aaaa",
+        "230225aaab",
+        "230225aaad",
+    ]
+    assert eventlog.last_name(outroot) == "230226aaaa"
+    assert names.get_lastname_grex(outroot) == "230226aaaa"
+
+
+def test_crash_recovery(tmp_path):
+    outroot = str(tmp_path)
+    eventlog.append(outroot, "230225aaaa", fields(60000.1))
+    eventlog.append(outroot, "230225aaab", fields(60000.2))
+    log_path = os.path.join(eventlog.event_dir(outroot), "230225.jsonl")
+    index_path = os.path.join(eventlog.event_dir(outroot), "230225.idx")
+
+    # the index entry of the last line was never written
+    with open(index_path, "r+b") as f:
+        f.truncate(eventlog.INDEX_DTYPE.itemsize)
+    assert eventlog.lookup(outroot, "230225aaab") is None
+    assert eventlog.last_name(outroot) == "230225aaab"
+    assert eventlog.lookup(outroot, "230225aaab")["mjds"] == 60000.2
+
+    # a line cut short is skipped, and the next one starts on a new line
+    with open(log_path, "ab") as f:
+        f.write(b'{"candname": "230225aa')
+    eventlog.append(outroot, "230225aaac", fields(60000.3))
+    assert eventlog.lookup(outroot, "230225aaac")["mjds"] == 60000.3
+    assert eventlog.rebuild_index(outroot, "230225") == 3
+    assert [e["candname"] for e in eventlog.iter_events(outroot)] == [
+        "230225aaaa",
+        "230225aaab",
+        "230225aaac",
+    ]
+
+    # a torn last line does not rebuild the index on every restart
+    with open(log_path, "ab") as f:
+        f.write(b'{"candname": "230225aa')
+    # a rebuild replaces the index file
+    inode = os.stat(index_path).st_ino
+    for _ in range(2):
+        assert eventlog.last_name(outroot) == "230225aaac"
+        assert os.stat(index_path).st_ino == inode
+
+
+def test_migrate_json(tmp_path):
+    outroot = str(tmp_path) + "/"
+    for candname, mjd in [("230225aaab", 60000.2), ("230225aaaa", 60000.1)]:
+        cluster_heimdall.write_json(
+            f"{outroot}{candname}.json", {candname: fields(mjd)}
+        )
+    (tmp_path / "cost_model.json").write_text("{}")
+    eventlog.append(outroot, "230225aaaa", fields(60000.1))
+
+    assert eventlog.migrate_json(outroot, remove=True) == (1, 1)
+    assert sorted(os.listdir(outroot)) == ["cost_model.json", eventlog.EVENT_DIR]
+    assert eventlog.lookup(outroot, "230225aaab") == {
+        "candname": "230225aaab",
+        **fields(60000.2),
+    }
+    assert eventlog.last_name(outroot) == "230225aaab"
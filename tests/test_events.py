@@ -0,0 +1,84 @@
+import os.path
+import socket
+import time
+import numpy as np
+import pytest
+from grex_t2 import eventlog, events, metrics, replay
+from grex_t2.config import load_config
+
+_install_dir = os.path.abspath(os.path.dirname(__file__))
+
+
+def wait_for(condition, timeout=5.0):
+    t_end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < t_end
+        time.sleep(0.01)
+
+
+def connect(address):
+    family, bind = events.parse_address(address)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.settimeout(5.0)
+    sock.connect(bind)
+    return sock
+
+
+def test_parse_address():
+    assert events.parse_address("unix:/tmp/t2.sock") == (socket.AF_UNIX, "/tmp/t2.sock")
+    assert events.parse_address("tcp::5000") == (socket.AF_INET, ("127.0.0.1", 5000))
+    with pytest.raises(ValueError):
+        events.parse_address("udp:host:5000")
+
+
+def test_slow_subscriber_dropped(tmp_path):
+    address = f"unix:{tmp_path}/events.sock"
+    publisher = events.EventPublisher(address, max_buffer=64 * 1024)
+    try:
+        reader = connect(address)
+        stuck = connect(address)
+        # the stuck subscriber never reads: shrink its kernel buffer so
+        # the publisher's own buffer fills up
+        stuck.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        wait_for(lambda: publisher.nsubscriber == 2)
+
+        dropped0 = metrics.snapshot()["counters"].get("events_subscribers_dropped", 0)
+        payload = np.arange(1000)
+        for i in range(200):
+            publisher.publish({"i": i, "payload": payload})
+            assert events.read_message(reader)["i"] == i
+
+        assert publisher.nsubscriber == 1
+        dropped = metrics.snapshot()["counters"]["events_subscribers_dropped"]
+        assert dropped == dropped0 + 1
+        reader.close()
+        stuck.close()
+    finally:
+        publisher.close()
+    assert not os.path.exists(f"{tmp_path}/events.sock")
+
+
+def test_gulp_events(tmp_path, make_runtime):
+    outroot = str(tmp_path) + "/"
+    address = f"unix:{tmp_path}/events.sock"
+    config = load_config()
+    config["events"]["address"] = address
+    runtime = make_runtime(outroot, config)
+    try:
+        subscriber = connect(address)
+        wait_for(lambda: runtime.events.nsubscriber == 1)
+        with open(os.path.join(_install_dir, "data/giants_1.cand"), "r") as f:
+            gulps = replay.split_gulps(f.read())[:3]
+        replay.replay(gulps, runtime)
+        messages = [events.read_message(subscriber) for _ in gulps]
+        subscriber.close()
+    finally:
+        runtime.close()
+
+    assert [m["gulp"] for m in messages] == [1, 2, 3]
+    names = {m["candname"] for m in messages} - {None}
+    assert {event["candname"] for event in eventlog.iter_events(outroot)} == names
+    for message in messages:
+        assert message["npeak"] == len(message["peaks"]["snr"])
+        assert min(message["peaks"]["mjds"]) > 50000.0
+        assert not message["triggered"]
@@ -0,0 +1,96 @@
+import numpy as np
+from grex_t2 import cluster_heimdall, filters
+from grex_t2.candidates import CandidateBatch
+from grex_t2.config import DEFAULT_CONFIG
+
+
+def make_batch():
+    rng = np.random.default_rng(1)
+    n = 1000
+    return CandidateBatch.from_columns(
+        {
+            "snr": rng.uniform(5.0, 60.0, n),
+            "if": np.zeros(n),
+            "itime": np.arange(n),
+            "mjds": np.zeros(n),
+            "ibox": rng.integers(0, 100, n),
+            "idm": np.arange(n),
+            "dm": rng.uniform(0.0, 500.0, n),
+            "ibeam": rng.integers(0, 256, n),
+        }
+    )
+
+
+def test_matches_reference():
+    tab = make_batch()
+    snr, dm, ibox = tab["snr"], tab["dm"], tab["ibox"]
+    inside = (dm > 50.0) & (dm < 100.0)
+    expected = (
+        (
+            ((snr > 10.0) & ~inside & (dm != 50.0) & (dm != 100.0))
+            | ((snr > 20.0) & inside)
+        )
+        & (dm > 50.0)
+        & (ibox < 64)
+    )
+
+    good, counts = filters.get_filter(DEFAULT_CONFIG["filter"]).select(tab)
+    assert np.array_equal(good, np.flatnonzero(expected))
+    assert counts["min_dm"] == np.sum(dm <= 50.0)
+    assert counts["max_ibox"] == np.sum(ibox >= 64)
+    assert counts["max_ncl"] == 0
+
+
+def test_max_ncl_and_rules():
+    tab = make_batch()
+    spec = {
+        "min_snr": 10.0,
+        "max_ncl": 5,
+        "rules": [{"column": "ibeam", "op": "<", "value": 128}],
+    }
+    tab_out, counts = filters.CandidateFilter.from_spec(spec)(tab)
+    passing = (tab["snr"] > 10.0) & (tab["ibeam"] < 128)
+    assert len(tab_out) == 5
+    assert np.allclose(np.sort(tab_out["snr"]), np.sort(tab["snr"][passing])[-5:])
+    assert counts["ibeam<128"] == np.sum(tab["ibeam"] >= 128)
+    assert counts["max_ncl"] == passing.sum() - 5
+
+
+def test_filter_clustered_max_ncl():
+    tab = make_batch()
+    tab_out = cluster_heimdall.filter_clustered(tab, min_snr=8.0, max_ncl=30)
+    assert len(tab_out) == 30
+    assert tab_out["snr"].min() > 8.0
+
+
+def test_prefilter():
+    n = 200
+    # a bright pulse at high DM, a low-DM RFI blob far from it, and
+    # faint rows right next to the pulse
+    tab = CandidateBatch.from_columns(
+        {
+            "snr": np.r_[np.full(10, 30.0), np.full(n, 9.0), np.full(10, 6.0)],
+            "if": np.zeros(n + 20),
+            "itime": np.r_[np.arange(10) + 5000, np.arange(n), np.arange(10) + 5005],
+            "mjds": np.zeros(n + 20),
+            "ibox": np.full(n + 20, 4),
+            "idm": np.r_[np.full(10, 300), np.full(n, 2), np.full(10, 305)],
+            "dm": np.r_[np.full(10, 150.0), np.full(n, 1.0), np.full(10, 152.0)],
+            "ibeam": np.full(n + 20, 100),
+        }
+    )
+    keep = filters.prefilter(tab, DEFAULT_CONFIG["filter"])
+    assert np.array_equal(keep, np.r_[np.arange(10), np.arange(n + 10, n + 20)])
+
+    # with no margins and no guard only the seeds are kept
+    keep = filters.prefilter(tab, DEFAULT_CONFIG["filter"], guard=0.0)
+    assert np.array_equal(keep, np.arange(10))
+
+    # cluster-count cuts and custom rules turn the prefilter off
+    for update in (
+        {"min_cntc": 3},
+        {"rules": [{"column": "snr", "op": ">", "value": 1}]},
+    ):
+        spec = dict(DEFAULT_CONFIG["filter"], **update)
+        assert filters.prefilter_conflicts(spec) == list(update)
+        assert np.array_equal(filters.prefilter(tab, spec), np.arange(n + 20))
@@ -0,0 +1,59 @@
+import queue
+import socket
+import threading
+from grex_t2 import framing, socket_grex
+
+
+def packet(itime, snr=10.0):
+    return f"{snr} {itime * 32} {itime} {itime * 1.048e-3:.4f} 3 10 20.0 7\n".encode()
+
+
+def test_marker():
+    framer = framing.GulpFramer()
+    assert framer.feed(packet(100), 0.0) == []
+    assert framer.feed(packet(101), 0.0) == []
+    ((text, npackets, reason),) = framer.feed(b"\x03", 0.0)
+    assert npackets == 2 and reason == "marker"
+    assert text == (packet(100) + packet(101)).decode()
+    assert framer.feed(b"\x03", 0.0) == [("", 0, "marker")]
+
+
+def test_size_and_span():
+    framer = framing.GulpFramer(max_bytes=3 * len(packet(100)) + 10, max_span=1000)
+    done = []
+    for itime in range(100, 105):
+        done += framer.feed(packet(itime), 0.0)
+    assert [(n, reason) for _, n, reason in done] == [(3, "size")]
+    assert len(framer) == 2
+
+    # a lost marker: the next gulp starts far later in time
+    done = framer.feed(packet(5000), 0.0)
+    assert [(n, reason) for _, n, reason in done] == [(2, "span")]
+    assert len(framer) == 1
+
+
+def test_idle():
+    framer = framing.GulpFramer(idle_timeout=1.0)
+    framer.feed(packet(100), 10.0)
+    assert framer.poll(10.5) == []
+    ((_, npackets, reason),) = framer.poll(11.5)
+    assert npackets == 1 and reason == "idle"
+    assert framer.poll(20.0) == []
+
+
+def test_receive_gulps_without_marker():
+    recv = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    recv.bind(("127.0.0.1", 0))
+    gulps = queue.Queue()
+    framer = framing.GulpFramer(idle_timeout=0.2)
+    threading.Thread(
+        target=socket_grex.receive_gulps, args=(recv, gulps, framer), daemon=True
+    ).start()
+
+    send = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    for itime in range(100, 110):
+        send.sendto(packet(itime), recv.getsockname())
+    # the end marker is lost, so the gulp is flushed once idle
+    candstr, npackets, _ = gulps.get(timeout=5.0)
+    assert npackets == 10
+    assert candstr.count("\n") == 10
@@ -0,0 +1,124 @@
+import logging
+import os.path
+import numpy as np
+import pytest
+from grex_t2 import known_sources
+from grex_t2.candidates import CandidateBatch
+
+_install_dir = os.path.abspath(os.path.dirname(__file__))
+EPOCH = 60000.0
+
+
+def make_index(pdot=0.0, valid_to=EPOCH + 1.0):
+    # overlapping DM windows; "b" at the declination of "a", "c" elsewhere
+    return known_sources.KnownSourceIndex(
+        ["a", "b", "c"],
+        ra=[83.6, 53.2, 293.9],
+        dec=[22.0, 22.0, 16.3],
+        dm=[56.8, 57.1, 158.5],
+        dm_tol=[2.0, 2.0, 3.0],
+        period=[0.25, 0.5, 0.4],
+        pdot=[0.0, pdot, 0.0],
+        epoch=[EPOCH, EPOCH, EPOCH],
+        phase_tol=[0.05, 0.05, 0.05],
+        valid_from=[EPOCH - 1.0, EPOCH - 1.0, EPOCH - 1.0],
+        valid_to=[EPOCH + 1.0, valid_to, EPOCH + 1.0],
+    )
+
+
+def in_beam(index, isrc, mjd):
+    beam = known_sources.expected_beam(index.ra[isrc], index.dec[isrc], mjd)
+    return np.rint(beam).astype(int)
+
+
+def test_expected_beam():
+    # a source transits one beam per beam_separation of hour angle
+    mjd = EPOCH + np.array([0.0, 1.0 / 1440.0])
+    beam = known_sources.expected_beam(0.0, 0.0, mjd)
+    step = 360.98564736629 / 1440.0 * 60.0
+    assert beam[1] - beam[0] == pytest.approx(
+        step / known_sources.triggering.beam_separation
+    )
+    # a sidereal day later the source is back in the same beam
+    later = known_sources.expected_beam(0.0, 0.0, EPOCH + 1.0 / 1.00273790935)
+    assert later == pytest.approx(beam[0], abs=1e-3)
+
+
+def test_match():
+    index = make_index()
+    on_pulse = EPOCH + 1000 * 0.5 / 86400.0
+    off_pulse = on_pulse + 0.25 / 86400.0
+    beam_b = in_beam(index, 1, on_pulse)
+    # 58.9 is only in the window of b; 58.0 in those of a and b
+    dm = [10.0, 58.9, 58.9, 58.9, 58.0]
+    mjd = [on_pulse, on_pulse, off_pulse, on_pulse, off_pulse]
+    ibeam = [beam_b, beam_b, beam_b, beam_b + 20, in_beam(index, 0, off_pulse)]
+    # off_pulse is 0.25 s after a pulse of b: on a pulse of a
+    assert np.array_equal(index.match(dm, mjd, ibeam), [-1, 1, -1, -1, 0])
+    assert index.match(dm, mjd, ibeam, beam_tol=30)[3] == 1
+    assert np.array_equal(index.match(dm, mjd, ibeam, pointing_dec=60.0), [-1] * 5)
+    assert index.match(dm, mjd, ibeam, pointing_dec=22.5)[1] == 1
+
+
+def test_match_ephemeris():
+    # 10^5 rotations after the epoch, pdot shifts the pulse by 0.25 turns
+    mjd = EPOCH + 1e5 * 0.5 / 86400.0
+    pdot = 0.5 * 0.5 / 1e10
+    for index, expected in [(make_index(), 1), (make_index(pdot=pdot), -1)]:
+        ibeam = in_beam(index, 1, mjd)
+        assert index.match([58.9], [mjd], [ibeam])[0] == expected
+    # outside the validity range of the ephemeris
+    index = make_index(valid_to=EPOCH + 0.5)
+    mjd = EPOCH + 0.75
+    assert index.match([58.9], [mjd], [in_beam(index, 1, mjd)])[0] == -1
+
+
+def test_catalog_file(tmp_path, caplog):
+    path = tmp_path / "catalog.txt"
+    path.write_text(
+        "# ra dec minsnr [name dm dm_tol period_s pdot epoch_mjd phase_tol "
+        "valid_from valid_to]\n"
+        "03:32:59.37 +54:34:43.6 50\n"
+        "05:34:31.97 +22:00:52.1 0.0 B0531+21 56.77 2.0 0.033739 4.21e-13 "
+        "60000.0 0.05 59900.0 60100.0\n"
+        "19:35:47.83 +16:16:39.9 0.0 B1933+16 158.52 3.0 0.358738 6.0e-15 "
+        "- 0.05 - -\n"
+    )
+    with caplog.at_level(logging.WARNING):
+        index = known_sources.read_known_sources(str(path))
+    assert index.names == ["B0531+21"]
+    assert index.ra[0] == pytest.approx(83.6332, abs=1e-3)
+    assert index.dec[0] == pytest.approx(22.0145, abs=1e-3)
+    assert "B1933+16" in caplog.text
+
+    path.write_text("05:34:31.97 +22:00:52.1 0.0 B0531+21 56.77\n")
+    with pytest.raises(ValueError):
+        known_sources.read_known_sources(str(path))
+
+
+def test_shipped_catalog():
+    # no entry of the shipped catalog has an ephemeris epoch yet
+    path = os.path.join(_install_dir, "../data/catalog.txt")
+    coords, snrs = known_sources.triggering.parse_catalog(path)
+    assert len(coords) == len(snrs) > 0
+    index = known_sources.read_known_sources(path)
+    assert not len(index)
+    assert np.array_equal(index.match([56.8], [EPOCH], [100]), [-1])
+
+
+def test_tag_reject_known():
+    index = make_index()
+    on_pulse = EPOCH + 1000 * 0.5 / 86400.0
+    tab = CandidateBatch.from_columns(
+        {
+            "snr": [20.0, 30.0, 40.0],
+            "dm": [58.9, 300.0, 58.9],
+            "mjds": np.full(3, on_pulse),
+            "ibeam": [in_beam(index, 1, on_pulse), 0, 0],
+        }
+    )
+    known_sources.tag_known(tab, index)
+    assert tab["known_source"].tolist() == ["b", "0", "0"]
+    kept, matched = known_sources.reject_known(tab)
+    assert np.array_equal(kept.index, [1, 2])
+    assert np.array_equal(matched.index, [0])
@@ -0,0 +1,35 @@
+import json
+import logging
+from grex_t2 import logs
+
+
+def test_json_logging(tmp_path):
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    logfile = tmp_path / "t2.log"
+    try:
+        logs.setup_logging(str(logfile), json_format=True, stream=False)
+        logs.set_gulp(7)
+        logging.info("Gulp done", extra={"stages": {"cluster": 0.5}})
+        logs.set_gulp(None)
+        logging.debug("not written")
+        logs.stop_logging()
+    finally:
+        root.handlers[:] = handlers
+        root.setLevel(level)
+
+    records = [json.loads(line) for line in logfile.read_text().splitlines()]
+    assert len(records) == 1
+    assert records[0]["message"] == "Gulp done"
+    assert records[0]["gulp"] == 7
+    assert records[0]["stages"] == {"cluster": 0.5}
+
+
+def test_stage_timer():
+    stages = {}
+    timer = logs.StageTimer(stages)
+    timer.mark("parse")
+    timer.mark("cluster")
+    timer.mark("parse")
+    assert list(stages) == ["parse", "cluster"]
+    assert all(t >= 0 for t in stages.values())
@@ -0,0 +1,51 @@
+import numpy as np
+from grex_t2 import memory, metrics
+
+
+def test_growth():
+    slope, grew = memory.growth(np.arange(20) * 1000.0)
+    assert np.isclose(slope, 1000.0)
+    assert grew
+    # allocator noise around a flat level is not growth
+    rng = np.random.default_rng(0)
+    slope, grew = memory.growth(1e8 + rng.normal(0.0, 1e5, 100))
+    assert not grew
+
+
+def test_leak_detection():
+    tracker = memory.MemoryTracker(window=10, leak_bytes_per_gulp=1024**2)
+    leaked = []
+    for _ in range(12):
+        tracker.start_gulp()
+        leaked.append(np.ones(4 * 1024**2 // 8))
+        tracker.mark("cluster")
+        tracker.end_gulp()
+    assert tracker.leak
+    assert tracker.stages["cluster"]["rss_delta"] > 3 * 1024**2
+    assert metrics.snapshot()["gauges"]["memory_leak_suspected"] == 1
+
+    leaked.clear()
+    tracker = memory.MemoryTracker(window=10, leak_bytes_per_gulp=1024**2)
+    for _ in range(12):
+        tracker.start_gulp()
+        scratch = np.ones(4 * 1024**2 // 8)
+        del scratch
+        tracker.end_gulp()
+    assert not tracker.leak
+
+
+def test_trace_stage_peaks():
+    tracker = memory.MemoryTracker(trace=True, top_every=2, top_n=3)
+    try:
+        for _ in range(2):
+            tracker.start_gulp()
+            scratch = bytearray(8 * 1024**2)
+            del scratch
+            tracker.mark("parse")
+            tracker.mark("cluster")
+            tracker.end_gulp()
+    finally:
+        tracker.close()
+    assert tracker.stages["parse"]["peak"] >= 8 * 1024**2
+    assert tracker.stages["cluster"]["peak"] < 8 * 1024**2
+    assert len(tracker.top) == 3
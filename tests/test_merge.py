@@ -0,0 +1,137 @@
+import os.path
+import queue
+import socket
+import numpy as np
+import pytest
+from grex_t2 import cluster_heimdall, eventlog, merge, replay, socket_grex
+from grex_t2.candidates import CandidateBatch
+from grex_t2.config import load_config
+
+_install_dir = os.path.abspath(os.path.dirname(__file__))
+
+
+def gulp_text(itimes, beam):
+    return "".join(
+        f"12.0 {it * 32} {it} {it * 1.048e-3:.4f} 3 10 20.0 {beam}\n" for it in itimes
+    )
+
+
+def test_merge_in_order():
+    merger = merge.StreamMerger(2, gulp_samples=1000, max_wait=1.0)
+    # stream 1 is a window ahead of stream 0
+    assert merger.add(1, gulp_text([100, 200], 1), 2, 0.0) == []
+    assert merger.add(1, gulp_text([1100], 1), 1, 0.1) == []
+    ((batch, npackets, _),) = merger.add(0, gulp_text([150], 0), 1, 0.2)
+    assert npackets == 3
+    assert np.array_equal(batch["itime"], [150, 100, 200])
+    assert np.array_equal(batch["stream"], [0, 1, 1])
+
+    # window 1 is merged without stream 0 once it has waited max_wait
+    assert merger.poll(1.0) == []
+    ((batch, _, _),) = merger.poll(1.2)
+    assert np.array_equal(batch["itime"], [1100])
+    assert len(merger) == 0
+
+    # a late gulp for a merged window is passed on by itself
+    ((batch, _, _),) = merger.add(0, gulp_text([1200], 0), 1, 1.3)
+    assert np.array_equal(batch["stream"], [0])
+
+
+def test_merge_bounded():
+    merger = merge.StreamMerger(2, gulp_samples=1000, max_wait=100.0, max_pending=2)
+    done = []
+    for window in range(5):
+        done += merger.add(0, gulp_text([window * 1000], 0), 1, 0.0)
+    assert len(merger) == 2
+    assert [int(b["itime"][0]) for b, _, _ in done] == [0, 1000, 2000]
+
+    # an empty gulp counts towards the oldest window it has not sent
+    ((batch, _, _),) = merger.add(1, "", 1, 0.0)
+    assert np.array_equal(batch["itime"], [3000])
+
+
+def test_merge_start_times():
+    cluster_heimdall.set_start_time(55000.0)
+    # stream 1 started 10 s after the T2 start time, stream 2 with it
+    late = 55000.0 + 10.0 / 86400.0
+    merger = merge.StreamMerger(
+        3,
+        gulp_samples=1000,
+        max_wait=1.0,
+        start_times=[None, late, cluster_heimdall.START_TIME_URL],
+    )
+    shift = round(10.0 / merge.TSAMP)
+    assert merger.offset(1) == pytest.approx(10.0)
+    assert merger.add(0, gulp_text([shift + 100], 0), 1, 0.0) == []
+    assert merger.add(1, gulp_text([100], 1), 1, 0.0) == []
+    ((batch, _, _),) = merger.add(2, gulp_text([shift + 101], 2), 1, 0.0)
+    # itime stays each stream's own sample number, for triggers and dumps
+    assert np.array_equal(batch["itime"], [shift + 100, 100, shift + 101])
+    assert np.array_equal(batch["itime_t2"], [shift + 100] * 2 + [shift + 101])
+    assert batch["mjds"][1] == pytest.approx(batch["mjds"][0], abs=merge.TSAMP)
+    data = cluster_heimdall.cluster_features(batch, ["itime", "ibeam"])
+    assert np.array_equal(data[:, 0], batch["itime_t2"])
+
+    with pytest.raises(ValueError):
+        merge.StreamMerger(2, start_times=[None])
+
+
+def test_stream_counts():
+    cl = np.array([0, 0, 1, 1, -1, 2])
+    stream = np.array([0, 1, 1, 1, 0, 0])
+    assert np.array_equal(merge.stream_counts(cl, stream), [2, 2, 1, 1, 1, 1])
+
+
+def test_two_streams(tmp_path):
+    with open(os.path.join(_install_dir, "data/giants_1.cand")) as f:
+        text = f.read()
+    # split the beams between two heimdall streams
+    tab = CandidateBatch.from_text(text)
+    lines = np.array(text.splitlines())
+    halves = [
+        "\n".join(lines[tab["ibeam"] < 16]) + "\n",
+        "\n".join(lines[tab["ibeam"] >= 16]) + "\n",
+    ]
+
+    socks = []
+    for _ in halves:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024**2)
+        sock.bind(("127.0.0.1", 0))
+        socks.append(sock)
+    config = load_config()
+    config["merge"]["gulp_samples"] = 1 << 20
+    config["merge"]["max_wait"] = 10.0
+    gulps = queue.Queue()
+    threads = socket_grex.start_receivers(socks, gulps, config=config)
+    assert len(threads) == 3
+
+    for half, sock in zip(halves, socks):
+        replay.send([half], sock.getsockname(), binary=True)
+    batch, npackets, _ = gulps.get(timeout=10.0)
+    assert len(batch) == len(tab)
+    assert np.array_equal(np.sort(batch["snr"]), np.sort(tab["snr"]))
+    nlow = np.sum(tab["ibeam"] < 16)
+    assert np.array_equal(batch["stream"][:nlow], np.zeros(nlow))
+    assert np.all(batch["stream"][nlow:] == 1)
+
+
+def test_coincidence(tmp_path, db_con):
+    config = load_config()
+    config["merge"]["min_streams"] = 2
+
+    def pulse(itime, snr):
+        return "".join(
+            f"{snr - abs(i)} {(itime + i) * 32} {itime + i} 1.0 3 100 200.0 7\n"
+            for i in range(-3, 4)
+        )
+
+    # a pulse seen by both stations, and a brighter one only by station 1
+    merger = merge.StreamMerger(2)
+    merger.add(0, pulse(5000, 40.0), 7, 0.0)
+    ((batch, _, _),) = merger.add(1, pulse(5000, 30.0) + pulse(9000, 60.0), 14, 0.0)
+
+    outroot = str(tmp_path) + "/"
+    socket_grex.filter_candidates(batch, outroot, db_con, trigger=False, config=config)
+    (cand,) = eventlog.iter_events(outroot)
+    assert cand["snr"] == 40.0
@@ -0,0 +1,15 @@
+from astropy.time import Time
+from grex_t2 import names
+
+
+def test_mjd_to_datetime():
+    for mjd in [55000.0, 60000.5, 60123.999]:
+        dt = names.mjd_to_datetime(mjd)
+        dt_astropy = Time(mjd, format="mjd", scale="utc").to_datetime()
+        assert abs((dt - dt_astropy).total_seconds()) < 1e-3
+
+
+def test_increment_name():
+    assert names.increment_name(60000.5) == "230225aaaa"
+    assert names.increment_name(60000.5, lastname="230225aaaa") == "230225aaab"
+    assert names.increment_name(60001.5, lastname="230225aaab") == "230226aaaa"
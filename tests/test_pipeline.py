@@ -0,0 +1,88 @@
+import glob
+import json
+import os.path
+import queue
+import numpy as np
+from grex_t2 import eventlog, pipeline, replay, socket_grex
+from grex_t2.candidates import CandidateBatch
+from grex_t2.config import load_config
+
+_install_dir = os.path.abspath(os.path.dirname(__file__))
+
+
+def test_shared_roundtrip():
+    columns = {
+        "snr": np.arange(5.0),
+        "trigger": np.array(["0", "abc", "0", "0", "x"], dtype="U16"),
+        "flag": np.array([True, False, True, True, False]),
+    }
+    block, layout = pipeline.to_shared(columns)
+    block.close()
+    copied = pipeline.from_shared(block.name, layout, unlink=True)
+    for name, col in columns.items():
+        assert np.array_equal(copied[name], col)
+        assert copied[name].dtype == col.dtype
+
+    for payload in (
+        "1 2 3\n",
+        b"\x01\x02",
+        CandidateBatch.from_columns({"snr": [1.0]}),
+    ):
+        kind, cols = pipeline.payload_columns(payload)
+        back = pipeline.payload_from_columns(kind, cols)
+        if isinstance(payload, CandidateBatch):
+            assert np.array_equal(back["snr"], payload["snr"])
+        else:
+            assert back == payload
+
+
+def run(runtime, gulps, workers):
+    pending = queue.Queue()
+    for candstr in gulps:
+        pending.put((candstr, candstr.count("\n"), 0.0))
+    pending.put(None)
+    records = []
+    if workers:
+        pipeline.process_gulps(
+            pending, runtime, workers, trigger=False, on_gulp=records.append
+        )
+    else:
+        socket_grex.process_gulps(
+            pending, runtime, trigger=False, on_gulp=records.append
+        )
+    runtime.close()
+    return runtime, records
+
+
+def test_pipeline_matches_sequential(tmp_path, make_runtime):
+    with open(os.path.join(_install_dir, "data/giants_1.cand"), "r") as f:
+        gulps = replay.split_gulps(f.read())[:6]
+    # an empty gulp keeps its place in the order
+    gulps.insert(2, "")
+
+    os.makedirs(tmp_path / "seq")
+    os.makedirs(tmp_path / "par")
+    seq, seq_records = run(make_runtime(str(tmp_path / "seq") + "/"), gulps, 0)
+    par, par_records = run(make_runtime(str(tmp_path / "par") + "/"), gulps, 2)
+
+    assert par.lastname == seq.lastname
+    assert [r["ncand"] for r in par_records] == [r["ncand"] for r in seq_records]
+    names_seq = [e["candname"] for e in eventlog.iter_events(str(tmp_path / "seq"))]
+    names_par = [e["candname"] for e in eventlog.iter_events(str(tmp_path / "par"))]
+    assert names_par == names_seq
+    assert len(names_par) > 1
+
+
+def test_pipeline_profiles_commit(tmp_path, make_runtime):
+    with open(os.path.join(_install_dir, "data/giants_1.cand"), "r") as f:
+        gulps = replay.split_gulps(f.read())[:2]
+    config = load_config()
+    config["profiling"]["threshold_s"] = 0.0
+    run(make_runtime(str(tmp_path) + "/", config), gulps, 1)
+    captures = sorted(glob.glob(str(tmp_path / "profiles" / "gulp*.json")))
+    assert len(captures) == len(gulps)
+    with open(captures[0], "r") as f:
+        capture = json.load(f)
+    # the commit stages only: clustering ran in a worker
+    assert capture["process_s"] >= capture["wall_s"]
+    assert "trigger" in capture["stages"] and "cluster" not in capture["stages"]
@@ -0,0 +1,69 @@
+import glob
+import os
+import time
+from grex_t2 import profiling
+
+
+def busy(seconds):
+    t_end = time.perf_counter() + seconds
+    while time.perf_counter() < t_end:
+        pass
+
+
+def test_stage_of():
+    stages = {"parse": 0.1, "cluster": 0.5, "filter": 0.1}
+    assert profiling.stage_of([0.05, 0.3, 0.65, 1.0], stages) == [
+        "parse",
+        "cluster",
+        "filter",
+        "other",
+    ]
+
+
+def test_slow_gulp_capture(tmp_path):
+    outdir = str(tmp_path / "profiles")
+    profiler = profiling.GulpProfiler(
+        outdir, threshold_s=0.1, sample_interval=0.005, max_captures=2
+    )
+    try:
+        # fast gulps are not captured
+        profiler.start_gulp()
+        assert profiler.end_gulp(1, 0.01) is None
+
+        paths = []
+        for gulp_id in range(2, 5):
+            profiler.start_gulp()
+            t0 = time.perf_counter()
+            busy(0.15)
+            stages = {"cluster": time.perf_counter() - t0}
+            paths.append(profiler.end_gulp(gulp_id, stages["cluster"], stages, ncand=9))
+            time.sleep(0.01)
+    finally:
+        profiler.close()
+
+    # only the newest max_captures are kept
+    assert sorted(glob.glob(outdir + "/gulp*.json")) == sorted(paths[1:])
+    (capture,) = profiling.read_captures(paths[-1:])
+    assert capture["gulp"] == 4
+    assert capture["ncand"] == 9
+    functions = [key.rsplit(";", 1)[-1] for key in capture["samples"]["cluster"]]
+    assert "test_profiling.py:busy" in functions
+
+    summary = profiling.summarise(profiling.read_captures(paths[1:]))
+    assert summary["cluster"]["captures"] == 2
+    assert summary["cluster"]["functions"][0][0] == "test_profiling.py:busy"
+
+
+def test_cprofile_request(tmp_path):
+    outdir = str(tmp_path)
+    profiler = profiling.GulpProfiler(outdir, threshold_s=None, sample_interval=None)
+    profiler.request_cprofile(1)
+    for gulp_id in (1, 2):
+        profiler.start_gulp()
+        busy(0.01)
+        path = profiler.end_gulp(gulp_id, 0.01)
+        assert (path is not None) == (gulp_id == 1)
+
+    (capture,) = profiling.read_captures(glob.glob(outdir + "/gulp*.json"))
+    assert capture["cprofile"]
+    assert os.path.exists(capture["cprofile_file"])
@@ -0,0 +1,95 @@
+import json
+import os.path
+import urllib.request
+import numpy as np
+import pytest
+from grex_t2 import recent, replay
+from grex_t2.config import load_config
+
+_install_dir = os.path.abspath(os.path.dirname(__file__))
+
+
+def make_peaks(n, mjd0, seed=0):
+    rng = np.random.default_rng(seed)
+    return {
+        "snr": rng.uniform(8.0, 30.0, n),
+        "itime": np.arange(n),
+        "mjds": mjd0 + np.arange(n) * 1e-5,
+        "ibox": rng.integers(0, 8, n),
+        "idm": rng.integers(0, 1024, n),
+        "dm": rng.uniform(0.0, 1000.0, n),
+        "ibeam": rng.integers(0, 256, n),
+    }
+
+
+def test_downsample():
+    mjds = np.arange(1000.0)
+    snr = np.ones(1000)
+    snr[[5, 995]] = 50.0
+    keep = recent.downsample(mjds, snr, 10)
+    assert len(keep) == 10
+    assert np.all(np.diff(mjds[keep]) > 0)
+    assert {5, 995} <= set(keep)
+
+
+def test_ring_and_spill(tmp_path):
+    ring = recent.RecentPeaks(capacity=100, max_age=10.0, spill_dir=str(tmp_path))
+    ring.add(make_peaks(60, 60000.0), gulp_id=1, now=0.0)
+    ring.add(make_peaks(60, 60001.0), gulp_id=2, now=5.0)
+    # full: the oldest 20 peaks of gulp 1 are spilled
+    assert len(ring) == 100
+    columns, nmatch = ring.query()
+    assert nmatch == 100
+    assert np.all(np.diff(columns["mjds"]) > 0)
+    assert columns["mjds"][0] == pytest.approx(60000.0 + 20e-5)
+
+    # gulp 1 has aged out
+    ring.expire(now=12.0)
+    columns, nmatch = ring.query(mjd_max=60000.5)
+    assert nmatch == 0
+    columns, nmatch = ring.query(mjd_max=60000.5, spilled=True)
+    assert nmatch == 60
+    assert set(columns["gulp"]) == {1}
+
+    columns, nmatch = ring.query(dm_min=500.0, snr_min=20.0, beams=[1, 2, 3])
+    assert np.all(columns["dm"] >= 500.0)
+    assert np.all(columns["snr"] >= 20.0)
+    assert set(columns["ibeam"]) <= {1, 2, 3}
+    assert ring.stats()["mjd_min"] == pytest.approx(60001.0)
+
+
+def test_parse_query():
+    assert recent.parse_query("mjd_min=1.5&beam=3,4&max_points=10&spilled=1") == {
+        "mjd_min": 1.5,
+        "beams": [3, 4],
+        "max_points": 10,
+        "columns": recent.QUERY_COLUMNS,
+        "spilled": True,
+    }
+    assert recent.parse_query("columns=snr,gulp")["columns"] == ["snr", "gulp"]
+    with pytest.raises(ValueError):
+        recent.parse_query("colour=red")
+
+
+def test_http_query(tmp_path, make_runtime):
+    config = load_config()
+    config["recent"]["port"] = 0
+    runtime = make_runtime(str(tmp_path) + "/", config)
+    try:
+        with open(_install_dir + "/data/giants_1.cand", "r") as f:
+            gulps = replay.split_gulps(f.read())[:3]
+        replay.replay(gulps, runtime)
+        port = runtime.recent_server.server_port
+        url = f"http://127.0.0.1:{port}/peaks?snr_min=10&max_points=5&columns=snr,gulp"
+        with urllib.request.urlopen(url) as response:
+            body = json.load(response)
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/stats") as response:
+            stats = json.load(response)
+    finally:
+        runtime.close()
+
+    assert body["nmatch"] >= body["npoint"] > 0
+    assert body["npoint"] <= 5
+    assert min(body["columns"]["snr"]) >= 10.0
+    assert set(body["columns"]["gulp"]) <= {1, 2, 3}
+    assert stats["recent"]["npeak"] == len(runtime.recent)
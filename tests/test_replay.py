@@ -0,0 +1,90 @@
+import glob
+import os.path
+import numpy as np
+from grex_t2 import eventlog, metrics, replay, shedding
+from grex_t2.config import load_config
+
+_install_dir = os.path.abspath(os.path.dirname(__file__))
+
+
+def shed_config():
+    config = load_config()
+    config["shedding"]["thresholds"] = [2, 4, 6]
+    config["shedding"]["top_k"] = 200
+    return config
+
+
+def test_shedder_levels():
+    shedder = shedding.LoadShedder(thresholds=(4, 8, 16), recover=0.5)
+    assert [shedder.update(b) for b in (0, 4, 9, 20, 9, 5, 4, 3, 2)] == [
+        0,
+        1,
+        2,
+        3,
+        3,
+        2,
+        1,
+        1,
+        0,
+    ]
+    assert metrics.snapshot()["gauges"]["shed_level"] == 0
+
+
+def test_top_rows():
+    from grex_t2.candidates import CandidateBatch
+
+    tab = CandidateBatch.from_columns({"snr": [5.0, 9.0, 7.0, 8.0]})
+    assert np.array_equal(shedding.top_rows(tab, 2).index, [1, 3])
+
+
+def test_replay_backlog(tmp_path, make_runtime):
+    with open(os.path.join(_install_dir, "data/giants_1.cand")) as f:
+        gulps = replay.split_gulps(f.read())
+    gulps = gulps * 4
+    outroot = str(tmp_path) + "/"
+    runtime = make_runtime(outroot, shed_config())
+
+    skipped0 = metrics.snapshot()["counters"].get("shed_outputs_skipped", 0)
+
+    # all gulps arrive at once, so the backlog (the later gulps and the
+    # end marker) starts at 12 and drains
+    records = replay.replay(gulps, runtime)
+    runtime.close()
+
+    levels = [r["level"] for r in records]
+    backlogs = [r["backlog"] for r in records]
+    assert backlogs == list(range(len(gulps), 0, -1))
+    assert levels[0] == shedding.SKIP_OUTPUTS and levels[-1] == shedding.NORMAL
+    assert levels == sorted(levels, reverse=True)
+
+    # a trigger record for every gulp, outputs skipped only at SKIP_OUTPUTS
+    assert len(list(eventlog.iter_events(outroot))) == len(gulps)
+    skipped = metrics.snapshot()["counters"]["shed_outputs_skipped"] - skipped0
+    assert skipped == levels.count(shedding.SKIP_OUTPUTS)
+    assert glob.glob(outroot + "cluster_output*.cand")
+
+
+def test_replay_no_backlog(tmp_path, make_runtime):
+    with open(os.path.join(_install_dir, "data/giants_1.cand")) as f:
+        gulps = replay.split_gulps(f.read())[:3]
+    runtime = make_runtime(str(tmp_path) + "/", shed_config())
+    records = replay.replay(gulps, runtime, interval=1.0)
+    runtime.close()
+    assert all(r["level"] == shedding.NORMAL for r in records)
+
+
+def test_replay_binary(tmp_path, make_runtime):
+    with open(os.path.join(_install_dir, "data/giants_1.cand")) as f:
+        gulps = replay.split_gulps(f.read())
+    results = {}
+    for binary in (False, True):
+        outroot = str(tmp_path / str(binary)) + "/"
+        os.makedirs(outroot)
+        runtime = make_runtime(outroot, shed_config())
+        records = replay.replay(gulps, runtime, binary=binary)
+        runtime.close()
+        results[binary] = (
+            [r["ncand"] for r in records],
+            [event["candname"] for event in eventlog.iter_events(outroot)],
+        )
+    assert results[True] == results[False]
@@ -0,0 +1,52 @@
+import numpy as np
+from grex_t2 import rfi
+from grex_t2.candidates import CandidateBatch
+
+
+def make_gulp(seed=0):
+    # sparse candidates over 16 time bins, plus broadband RFI in all 256
+    # beams and many DMs inside time bin 5
+    rng = np.random.default_rng(seed)
+    nquiet, nstorm = 400, 5000
+    itime = np.r_[rng.integers(0, 16 * 256, nquiet), rng.integers(1280, 1536, nstorm)]
+    return CandidateBatch.from_columns(
+        {
+            "snr": np.r_[
+                rng.uniform(7.0, 30.0, nquiet), rng.uniform(7.0, 12.0, nstorm)
+            ],
+            "if": itime * 32,
+            "itime": itime,
+            "mjds": itime * 1.048e-3,
+            "ibox": rng.integers(0, 8, nquiet + nstorm),
+            "idm": rng.integers(0, 1024, nquiet + nstorm),
+            "dm": np.zeros(nquiet + nstorm),
+            "ibeam": np.r_[rng.integers(0, 64, nquiet), np.arange(nstorm) % 256],
+        }
+    )
+
+
+def test_occupancy():
+    tab = make_gulp()
+    tbin, beam_counts, dm_counts = rfi.occupancy(tab)
+    assert beam_counts.sum() == len(tab) and dm_counts.sum() == len(tab)
+    assert beam_counts.shape[1] == 256
+    assert np.count_nonzero(beam_counts, axis=1).argmax() == 5
+
+
+def test_storm_rows():
+    tab = make_gulp()
+    storm = (tab["itime"] >= 1280) & (tab["itime"] < 1536)
+
+    keep, stats = rfi.storm_rows(tab, action="excise")
+    assert np.array_equal(keep, np.flatnonzero(~storm))
+    assert stats["storm_bins"] == 1
+    assert stats["rows_removed"] == storm.sum()
+    assert stats["max_beams_hit"] == 256
+
+    keep, stats = rfi.storm_rows(tab, keep_per_bin=3)
+    assert len(keep) == (~storm).sum() + 3
+    kept_storm = keep[storm[keep]]
+    assert np.allclose(np.sort(tab["snr"][kept_storm]), np.sort(tab["snr"][storm])[-3:])
+
+    keep, stats = rfi.storm_rows(tab, max_beams=None)
+    assert len(keep) == len(tab) and stats["storm_bins"] == 0
@@ -42,3 +42,9 @@ def test_T2():
     )
 
     assert candname is not None
+
+
+def test_warmup():
+    from grex_t2 import socket_grex
+
+    assert socket_grex.warmup() > 0
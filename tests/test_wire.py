@@ -0,0 +1,52 @@
+import os.path
+import numpy as np
+import pytest
+from grex_t2 import framing, replay, wire
+from grex_t2.candidates import CandidateBatch, col_heimdall
+
+_install_dir = os.path.abspath(os.path.dirname(__file__))
+
+
+def read_giants():
+    with open(os.path.join(_install_dir, "data/giants.cand")) as f:
+        return f.read()
+
+
+def test_roundtrip():
+    text = read_giants()
+    tab = CandidateBatch.from_text(text)
+    packets = wire.encode(tab)
+    assert all(len(p) <= wire.MAX_PACKET for p in packets)
+
+    records = np.concatenate([wire.decode(p) for p in packets])
+    decoded = CandidateBatch.from_records(records)
+    for name in col_heimdall:
+        assert np.array_equal(decoded[name], tab[name])
+
+
+def test_bad_header():
+    lines = read_giants().splitlines()[:3]
+    (packet,) = wire.encode(CandidateBatch.from_text("\n".join(lines)))
+    assert len(wire.decode(packet)) == 3
+    with pytest.raises(ValueError):
+        wire.decode(packet[:-1])
+
+
+def test_framer_detects_format():
+    text = read_giants()
+    lines = text.splitlines()[:10]
+    framer = framing.GulpFramer()
+    done = []
+    for packet in replay.gulp_packets("\n".join(lines), binary=True)[:-1]:
+        done += framer.feed(packet, 0.0)
+    assert done == []
+    # text packets after binary ones end the binary gulp
+    done = framer.feed(lines[0].encode() + b"\n", 0.0)
+    ((payload, _, reason),) = done
+    assert reason == "format"
+    tab = CandidateBatch.from_records(wire.decode_records(payload))
+    assert np.array_equal(tab["itime"], CandidateBatch.from_text(text)["itime"][:10])
+
+    # invalid binary packets are dropped
+    assert framer.feed(wire.MAGIC + b"junk", 0.0) == []
+    assert len(framer) == 1
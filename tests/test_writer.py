@@ -0,0 +1,45 @@
+import os.path
+import sqlite3
+import time
+from grex_t2 import database, metrics, writer
+
+
+def test_writer_order_and_flush(tmp_path):
+    outfile = os.path.join(tmp_path, "out.txt")
+
+    def append(i):
+        time.sleep(0.001)
+        with open(outfile, "a") as f:
+            f.write(f"{i}\n")
+
+    w = writer.ArtifactWriter()
+    for i in range(50):
+        w.submit(append, i)
+    w.close()
+    assert open(outfile).read().split() == [str(i) for i in range(50)]
+
+
+def test_writer_survives_errors(tmp_path):
+    def fail():
+        raise OSError("disk full")
+
+    done = []
+    w = writer.ArtifactWriter()
+    w.submit(fail)
+    w.submit(done.append, 1)
+    w.flush()
+    assert done == [1]
+    assert metrics.snapshot()["counters"]["writer_errors"] >= 1
+    w.close()
+
+
+def test_injection_cache():
+    con = sqlite3.connect(":memory:")
+    con.execute("CREATE TABLE injection (mjd REAL)")
+    con.execute("INSERT INTO injection VALUES (60000.5)")
+    cache = database.InjectionCache(con)
+    for mjd in [60000.5, 60000.50005, 60000.6]:
+        assert cache.is_injection(mjd) == database.is_injection(mjd, con)
+    con.execute("INSERT INTO injection VALUES (60000.6)")
+    assert cache.is_injection(60000.6)
+    assert cache.high_water == 2